@@ -43,6 +43,7 @@ class ASRFactory:
             return AzureASR(
                 subscription_key=kwargs.get("api_key"),
                 region=kwargs.get("region"),
+                upload_format=kwargs.get("upload_format", "opus"),
             )
         elif system_name == "GroqWhisperASR":
             from .groq_whisper_asr import VoiceRecognition as GroqWhisperASR
@@ -51,6 +52,17 @@ class ASRFactory:
                 api_key=kwargs.get("api_key"),
                 model=kwargs.get("model"),
                 lang=kwargs.get("lang"),
+                upload_format=kwargs.get("upload_format", "flac"),
             )
         else:
             raise ValueError(f"Unknown ASR system: {system_name}")
+
+    @staticmethod
+    def get_pooled_asr_system(system_name: str, num_workers: int, **kwargs) -> Type[ASRInterface]:
+        """
+        Same as `get_asr_system`, but the model runs in `num_workers` worker processes
+        shared by every caller with the same configuration.
+        """
+        from .asr_worker_pool import VoiceRecognition as PooledASR
+
+        return PooledASR(system_name, num_workers, **kwargs)
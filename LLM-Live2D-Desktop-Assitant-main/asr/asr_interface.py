@@ -1,11 +1,35 @@
 import abc
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
 import numpy as np
-from .asr_with_vad import VoiceRecognitionVAD
+
+if TYPE_CHECKING:
+    from .asr_with_vad import VoiceRecognitionVAD
+
+
+@dataclass
+class TranscriptionResult:
+    """The transcription together with whatever the ASR system reports about it.
+
+    Attributes:
+        text: The transcribed text.
+        language: The language the audio was decoded as, if known.
+        language_probability: Confidence of the language detection, if the system ran one.
+        avg_logprob: Average token log probability of the decode, if known.
+    """
+
+    text: str
+    language: str | None = None
+    language_probability: float | None = None
+    avg_logprob: float | None = None
 
 
 class ASRInterface(metaclass=abc.ABCMeta):
 
-    asr_with_vad: VoiceRecognitionVAD = None
+    asr_with_vad: "VoiceRecognitionVAD" = None
+    wake_word_options: dict | None = None
+    endpointing_options: dict | None = None
     SAMPLE_RATE = 16000
     NUM_CHANNELS = 1
     SAMPLE_WIDTH = 2
@@ -19,9 +43,39 @@ class ASRInterface(metaclass=abc.ABCMeta):
             The transcription of the speech audio.
         """
         if self.asr_with_vad is None:
-            self.asr_with_vad = VoiceRecognitionVAD(self.transcribe_np)
+            # the VAD (onnxruntime) is only loaded when the microphone on this device is used
+            from .asr_with_vad import VoiceRecognitionVAD
+
+            self.asr_with_vad = VoiceRecognitionVAD(
+                self.transcribe_np,
+                **(self.wake_word_options or {}),
+                **(self.endpointing_options or {}),
+            )
         return self.asr_with_vad.start_listening()
 
+    def enable_wake_word(
+        self,
+        wake_word: str,
+        awake_window: float = 30,
+        wake_word_asr: "ASRInterface | None" = None,
+    ) -> None:
+        """Only transcribe speech with the local VAD after the wake word has been heard.
+
+        Args:
+            wake_word: The word (or phrase) that wakes the assistant up.
+            awake_window: Seconds to keep listening without the wake word after the last utterance.
+            wake_word_asr: A cheap ASR system (e.g. a tiny Whisper model) used to spot the
+                wake word. Defaults to this ASR system.
+        """
+        self.wake_word_options = {
+            "wake_word": wake_word,
+            "awake_window": awake_window,
+            "wake_word_transcribe_func": (
+                wake_word_asr.transcribe_np if wake_word_asr else None
+            ),
+        }
+        self.asr_with_vad = None
+
     @abc.abstractmethod
     def transcribe_np(self, audio: np.ndarray) -> str:
         """Transcribe speech audio in numpy array format and return the transcription.
@@ -31,6 +85,37 @@ class ASRInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def transcribe_np_detailed(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
+        """Transcribe speech audio and report the detected language and decode confidence.
+
+        ASR systems that cannot force a language or report detection results simply
+        return the text.
+
+        Args:
+            audio: The numpy array of the audio data to transcribe.
+            language: Decode in this language instead of the configured one (skips detection).
+        """
+        return TranscriptionResult(text=self.transcribe_np(audio))
+
+    async def transcribe_np_detailed_async(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
+        """Awaitable version of `transcribe_np_detailed`."""
+        return await asyncio.to_thread(self.transcribe_np_detailed, audio, language)
+
+    async def transcribe_np_async(self, audio: np.ndarray) -> str:
+        """Awaitable version of `transcribe_np` that keeps the event loop free while transcribing.
+
+        The default implementation runs `transcribe_np` in a thread. ASR systems that run
+        out of process (see `asr_worker_pool.py`) override this to await the worker directly.
+
+        Args:
+            audio: The numpy array of the audio data to transcribe.
+        """
+        return await asyncio.to_thread(self.transcribe_np, audio)
+
     def nparray_to_audio_file(
         self, audio: np.ndarray, sample_rate: int, file_path: str
     ) -> None:
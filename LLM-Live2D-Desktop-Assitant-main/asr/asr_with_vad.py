@@ -31,14 +31,19 @@ SOFTWARE.
 This modified version is also distributed under the MIT License.
 """
 
+import re
 import threading
 import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Callable, List
 
 import numpy as np
 from loguru import logger
 
+from .endpointer import AdaptiveEndpointer
+
 import sys
 import os
 
@@ -54,8 +59,11 @@ VAD_SIZE = 50  # Milliseconds of sample for Voice Activity Detection (VAD)
 VAD_THRESHOLD = 0.7  # Threshold for VAD detection
 BUFFER_SIZE = 600  # Milliseconds of buffer before VAD detection
 PAUSE_LIMIT = 1300  # Milliseconds of pause allowed before processing
+SHORT_PAUSE_LIMIT = 400  # Milliseconds of pause that end a turn whose text looks complete
 WAKE_WORD = "computer"  # Wake word for activation
 SIMILARITY_THRESHOLD = 2  # Threshold for wake word similarity
+WAKE_CHECK_SIZE = 1500  # Milliseconds of speech checked for the wake word
+AWAKE_WINDOW = 30  # Seconds the assistant stays awake after hearing the wake word
 
 
 class VoiceRecognitionVAD:
@@ -64,6 +72,10 @@ class VoiceRecognitionVAD:
         asr_transcribe_func: Callable,
         wake_word: str | None = None,
         function: Callable = print,
+        wake_word_transcribe_func: Callable | None = None,
+        awake_window: float = AWAKE_WINDOW,
+        endpointer: AdaptiveEndpointer | None = None,
+        adaptive_endpointing: bool = True,
     ) -> None:
         """
         Initializes the VoiceRecognition class, setting up necessary models, streams, and queues.
@@ -73,11 +85,16 @@ class VoiceRecognitionVAD:
         2. The audio is buffered until voice activity is detected. This is to make sure that the
             entire sentence is captured, including before voice activity is detected.
         2. While voice activity is detected, the audio is stored, together with the buffered audio.
-        3. When voice activity is not detected after a short time (the PAUSE_LIMIT), the audio is
-            transcribed. If voice is detected again during this time, the timer is reset and the
-            recording continues.
+        3. When voice activity is not detected after a short time, the audio is transcribed. With
+            adaptive endpointing, a partial transcript is started in the background after SHORT_PAUSE_LIMIT ms
+            and the turn ends as soon as it is there and looks complete; otherwise it ends after the pause limit learned for
+            this session (at most PAUSE_LIMIT). Without it, the turn ends after PAUSE_LIMIT ms.
+            If voice is detected again during this time, the timer is reset and the recording continues.
         4. After the voice stops, the listening stops, and the audio is transcribed.
-        5. If a wake word is set, the transcribed text is checked for similarity to the wake word.
+        5. If a wake word is set and the assistant is not awake, the first WAKE_CHECK_SIZE ms of
+            speech are transcribed by the (cheap) wake word transcriber and checked for similarity
+            to the wake word. Speech without the wake word is dropped before the full transcription.
+            Hearing the wake word keeps the assistant awake for `awake_window` seconds.
         6. The function is called with the transcribed text as the argument.
         7. The audio stream is reset (buffers cleared), and listening continues.
 
@@ -85,6 +102,13 @@ class VoiceRecognitionVAD:
             asr_transcribe_func (Callable): The function to use for automatic speech recognition.
             wake_word (str, optional): The wake word to use for activation. Defaults to None.
             func (Callable, optional): The function to call when the wake word is detected. Defaults to print.
+            wake_word_transcribe_func (Callable, optional): A cheap transcriber (e.g. a tiny Whisper model)
+                used for the wake word check. Defaults to `asr_transcribe_func`.
+            awake_window (float, optional): Seconds to stay awake after the wake word or the last
+                accepted utterance. Defaults to AWAKE_WINDOW.
+            endpointer (AdaptiveEndpointer, optional): The endpointer to use. Defaults to one using
+                SHORT_PAUSE_LIMIT and PAUSE_LIMIT.
+            adaptive_endpointing (bool, optional): Set to False to always wait PAUSE_LIMIT ms.
         """
 
         self._setup_audio_stream()
@@ -97,7 +121,21 @@ class VoiceRecognitionVAD:
         self.buffer = queue.Queue(maxsize=BUFFER_SIZE // VAD_SIZE)
         self.recording_started = False
         self.gap_counter = 0
-        self.wake_word = wake_word
+        self.wake_word = wake_word.lower() if wake_word else None
+        self.wake_transcribe = wake_word_transcribe_func or asr_transcribe_func
+        self.awake_window = awake_window
+        self.awake_until = 0.0
+        self.wake_word_checked = False
+        self.endpointer = None
+        if adaptive_endpointing:
+            self.endpointer = endpointer or AdaptiveEndpointer(
+                short_pause_ms=SHORT_PAUSE_LIMIT, max_pause_ms=PAUSE_LIMIT
+            )
+        self.partial_text = None
+        self._partial: Future | None = None
+        # every transcription runs on this thread, one at a time, so a partial transcript
+        # does not hold up the frames coming in
+        self._asr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad-asr")
 
     def _setup_audio_stream(self):
         """
@@ -158,7 +196,11 @@ class VoiceRecognitionVAD:
             sample, vad_confidence = self.sample_queue.get()
             result = self._handle_audio_sample(sample, vad_confidence)
 
-            if result:
+            if result == "":
+                # nothing was transcribed, keep listening
+                self.reset()
+                self.input_stream.start()
+            elif result:
                 if returnText:
                     # if we return the text and are not starting the listening again, we can reset the recorder without blocking
                     threading.Thread(target=self.reset).start()
@@ -194,28 +236,90 @@ class VoiceRecognitionVAD:
 
         Uses a pause limit to determine when to process the detected audio. This is to
         ensure that the entire sentence is captured before processing, including slight gaps.
+        With adaptive endpointing the limit depends on whether the partial transcript looks complete.
         """
 
         self.samples.append(sample)
 
+        if (
+            self._wake_word_gate_active()
+            and len(self.samples) >= WAKE_CHECK_SIZE // VAD_SIZE
+        ):
+            if not self._check_wake_word():
+                # drop this utterance without the full transcription
+                self.reset()
+                return None
+
         if not vad_confidence:
             self.gap_counter += 1
-            if self.gap_counter >= PAUSE_LIMIT // VAD_SIZE:
+            if self.endpointer is None:
+                if self.gap_counter >= PAUSE_LIMIT // VAD_SIZE:
+                    return self._process_detected_audio()
+                return None
+
+            pause_ms = self.gap_counter * VAD_SIZE
+            if (
+                self._partial is None
+                and pause_ms >= self.endpointer.short_pause_ms
+                and not self._wake_word_gate_active()
+            ):
+                self._partial = self._asr_executor.submit(self.asr, list(self.samples))
+            if (
+                self.partial_text is None
+                and self._partial is not None
+                and self._partial.done()
+                and self._partial.exception() is None
+            ):
+                self.partial_text = self._partial.result()
+            if self.endpointer.should_end(pause_ms, self.partial_text):
                 return self._process_detected_audio()
         else:
+            if self.endpointer is not None and self.gap_counter:
+                # the user paused and kept talking
+                self.endpointer.observe_pause(self.gap_counter * VAD_SIZE)
             self.gap_counter = 0
+            # a partial transcript still running is of no use any more
+            self._partial = None
+            self.partial_text = None
 
-    # def _wakeword_detected(self, text: str) -> bool:
-    #     """
-    #     Calculates the nearest Levenshtein distance from the detected text to the wake word.
+    def _wake_word_gate_active(self) -> bool:
+        """
+        Whether the current utterance still has to pass the wake word check.
+        """
+        if not self.wake_word or self.wake_word_checked:
+            return False
+        return time.monotonic() >= self.awake_until
 
-    #     This is used as 'Glados' is not a common word, and Whisper can sometimes mishear it.
-    #     """
-    #     words = text.split()
-    #     closest_distance = min(
-    #         [distance(word.lower(), self.wake_word) for word in words]
-    #     )
-    #     return closest_distance < SIMILARITY_THRESHOLD
+    def _check_wake_word(self) -> bool:
+        """
+        Transcribes the start of the current utterance with the wake word transcriber and
+        checks it for the wake word. Hearing the wake word opens the awake window.
+        """
+        head = np.concatenate(self.samples[: WAKE_CHECK_SIZE // VAD_SIZE])
+        text = self._asr_executor.submit(self.wake_transcribe, head).result()
+        self.wake_word_checked = True
+        if text and self._wakeword_detected(text):
+            logger.info(f"Wake word detected in '{text}'")
+            self.awake_until = time.monotonic() + self.awake_window
+            return True
+        logger.debug(f"No wake word in '{text}', ignoring speech")
+        return False
+
+    def _wakeword_detected(self, text: str) -> bool:
+        """
+        Calculates the nearest Levenshtein distance from the detected text to the wake word.
+
+        This is used as 'Glados' is not a common word, and Whisper can sometimes mishear it.
+        """
+        words = re.findall(r"[\w']+", text.lower())
+        span = len(self.wake_word.split())
+        candidates = [" ".join(words[i : i + span]) for i in range(len(words) - span + 1)]
+        if not candidates:
+            return False
+        closest_distance = min(
+            [_levenshtein(candidate, self.wake_word) for candidate in candidates]
+        )
+        return closest_distance < SIMILARITY_THRESHOLD
 
     def _process_detected_audio(self):
         """
@@ -223,6 +327,11 @@ class VoiceRecognitionVAD:
         """
         logger.info("Detected pause after speech. Processing...")
 
+        # short utterances end before the wake word check had enough audio
+        if self._wake_word_gate_active() and not self._check_wake_word():
+            self.reset()
+            return None
+
         logger.info("Stopping listening...")
         self.input_stream.stop()
 
@@ -234,10 +343,17 @@ class VoiceRecognitionVAD:
             audio_max = max([np.max(s) for s in self.samples])
             logger.info(f"Audio amplitude range: {audio_min:.4f} to {audio_max:.4f}")
         
-        detected_text = self.asr(self.samples)
+        if self._partial is not None:
+            # only silence was recorded since the partial transcript was started
+            detected_text = self._partial.result()
+        else:
+            detected_text = self._asr_executor.submit(self.asr, self.samples).result()
 
         if detected_text:
             logger.info(f"Detected: '{detected_text}'")
+            if self.wake_word:
+                # every accepted utterance keeps the conversation going
+                self.awake_until = time.monotonic() + self.awake_window
             return detected_text
         else:
             logger.warning("No text detected from audio")
@@ -265,5 +381,29 @@ class VoiceRecognitionVAD:
         self.recording_started = False
         self.samples.clear()
         self.gap_counter = 0
+        self.wake_word_checked = False
+        self._partial = None
+        self.partial_text = None
         with self.buffer.mutex:
             self.buffer.queue.clear()
+
+
+def _levenshtein(a: str, b: str) -> int:
+    """
+    Edit distance between two strings.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+    return previous[-1]
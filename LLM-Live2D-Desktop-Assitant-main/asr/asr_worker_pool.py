@@ -0,0 +1,358 @@
+"""
+Out-of-process ASR workers.
+
+Local ASR models (Faster-Whisper, FunASR, ...) hold the GIL for most of a decode,
+so running them through `asyncio.to_thread` inside the server process stalls the
+event loop for every connected client. This module runs the model in a pool of
+worker processes instead. Each worker loads the model once and receives audio
+through `multiprocessing.shared_memory`, so only a tiny job descriptor is pickled.
+"""
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import threading
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import numpy as np
+from loguru import logger
+
+from .asr_interface import ASRInterface, TranscriptionResult
+
+_STOP = None
+
+
+def _worker_main(system_name: str, asr_kwargs: dict, job_queue, connection) -> None:
+    """
+    Entry point of a worker process. Loads the ASR model once and transcribes jobs
+    until the stop sentinel is received.
+    """
+    from asr.asr_factory import ASRFactory
+
+    try:
+        asr = ASRFactory.get_asr_system(system_name, **asr_kwargs)
+    except Exception as e:
+        connection.send((None, None, f"Failed to load {system_name}: {e}"))
+        return
+    _serve(asr, job_queue, connection)
+
+
+def _serve(asr: ASRInterface, job_queue, connection) -> None:
+    """
+    Report the worker ready and transcribe the jobs in its queue.
+
+    A job is `(job_id, shm_name, num_samples, language)`. The audio is read as float32 straight
+    out of the shared memory block named `shm_name`; the parent owns (and unlinks) it.
+    The results go back through the worker's own pipe, so a worker that dies in the
+    middle of a write cannot block the others.
+    """
+    connection.send((None, "ready", None))
+
+    while True:
+        job = job_queue.get()
+        if job is _STOP:
+            break
+        job_id, shm_name, num_samples, language = job
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+        except FileNotFoundError as e:
+            connection.send((job_id, None, str(e)))
+            continue
+        audio = None
+        try:
+            audio = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+            result = asr.transcribe_np_detailed(audio, language=language)
+            connection.send((job_id, result, None))
+        except Exception as e:
+            connection.send((job_id, None, str(e)))
+        finally:
+            # the view must be released before the block can be closed
+            del audio
+            shm.close()
+
+
+class ASRWorkerPool:
+    """
+    A pool of processes that each own one instance of the ASR model.
+
+    Jobs are submitted with `submit()` which returns a `concurrent.futures.Future`,
+    so the pool can be used from worker threads and (through `asyncio.wrap_future`)
+    from the event loop alike.
+
+    Each worker has its own job queue and result pipe and gets one job at a time, so
+    the pool knows which job every worker holds. The result thread waits on the pipes
+    and on the process sentinels: when a worker dies (out of memory, a crash in the
+    model) its job fails, its shared memory is released and the worker is started
+    again. A worker that dies before its model is loaded is not restarted.
+    """
+
+    # the function the worker processes run, (system_name, asr_kwargs, job_queue, connection)
+    _worker_target = staticmethod(_worker_main)
+
+    def __init__(self, system_name: str, num_workers: int = 1, **asr_kwargs) -> None:
+        self.system_name = system_name
+        self.num_workers = max(1, int(num_workers))
+        self.asr_kwargs = asr_kwargs
+
+        self._ctx = mp.get_context("spawn")
+        # job id -> (future, shared memory, job descriptor)
+        self._pending: dict[int, tuple[Future, shared_memory.SharedMemory, tuple]] = {}
+        # jobs waiting for a free worker
+        self._backlog: deque[int] = deque()
+        self._idle: list[int] = []
+        # worker index -> id of the job it is transcribing
+        self._jobs: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._closed = False
+        self._load_error: str | None = None
+
+        # worker index -> process, job queue and result pipe, None once it is given up
+        self._processes: list = [None] * self.num_workers
+        self._job_queues: list = [None] * self.num_workers
+        self._connections: list = [None] * self.num_workers
+        self._ready_workers: set[int] = set()
+        for index in range(self.num_workers):
+            self._start_worker(index)
+
+        self._ready = threading.Event()
+        self._listener = threading.Thread(
+            target=self._collect_results, name="asr-pool-results", daemon=True
+        )
+        self._listener.start()
+        logger.info(f"Started {self.num_workers} {system_name} worker process(es)")
+
+    def _start_worker(self, index: int) -> None:
+        job_queue = self._ctx.Queue()
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=self._worker_target,
+            args=(self.system_name, self.asr_kwargs, job_queue, writer),
+            name=f"asr-worker-{index}",
+            daemon=True,
+        )
+        self._job_queues[index] = job_queue
+        self._connections[index] = reader
+        self._processes[index] = process
+        process.start()
+        # only the worker writes, so the pipe reports EOF once it is gone
+        writer.close()
+
+    def submit(self, audio: np.ndarray, language: str | None = None) -> Future:
+        """
+        Copy the audio into a shared memory block and queue it for transcription.
+
+        Parameters:
+            audio (np.ndarray): Mono float32 audio at 16 kHz.
+            language (str, optional): Force the decode language (see `transcribe_np_detailed`).
+
+        Returns:
+            Future: Resolves to a `TranscriptionResult`.
+        """
+        if self._closed:
+            raise RuntimeError("ASR worker pool is closed")
+        if self._load_error:
+            raise RuntimeError(self._load_error)
+
+        audio = np.ascontiguousarray(audio, dtype=np.float32).reshape(-1)
+        future = Future()
+        if audio.size == 0:
+            future.set_result(TranscriptionResult(text=""))
+            return future
+
+        shm = shared_memory.SharedMemory(create=True, size=audio.nbytes)
+        np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._pending[job_id] = (future, shm, (job_id, shm.name, audio.size, language))
+            self._backlog.append(job_id)
+            self._dispatch()
+        return future
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        """Block until every worker has loaded its model."""
+        return self._ready.wait(timeout)
+
+    def _dispatch(self) -> None:
+        """Hand the waiting jobs to the idle workers. Call it with the lock held."""
+        while self._idle and self._backlog:
+            job_id = self._backlog.popleft()
+            entry = self._pending.get(job_id)
+            if entry is None:
+                continue
+            index = self._idle.pop()
+            self._jobs[index] = job_id
+            self._job_queues[index].put(entry[2])
+
+    def _collect_results(self) -> None:
+        while not self._closed:
+            workers = {}
+            for index, process in enumerate(self._processes):
+                if process is not None:
+                    workers[self._connections[index]] = index
+                    workers[process.sentinel] = index
+            if not workers:
+                break
+            # check now and then whether the pool was closed
+            ready = wait(list(workers), timeout=0.5)
+            for index in sorted({workers[handle] for handle in ready}):
+                if self._closed:
+                    break
+                # the results a worker sent before it died are read first
+                connection = self._connections[index]
+                exited = False
+                try:
+                    while connection.poll():
+                        self._handle_message(index, *connection.recv())
+                except (EOFError, OSError):
+                    exited = True
+                if exited or not self._processes[index].is_alive():
+                    self._on_worker_exit(index)
+
+    def _handle_message(self, index: int, job_id, result, error) -> None:
+        if job_id is None:
+            # worker lifecycle message
+            if error:
+                logger.error(f"ASR worker error: {error}")
+                self._load_error = error
+                self._fail_pending(error)
+                return
+            with self._lock:
+                self._ready_workers.add(index)
+                self._idle.append(index)
+                self._dispatch()
+                if len(self._ready_workers) >= self.num_workers:
+                    self._ready.set()
+            return
+
+        with self._lock:
+            if self._jobs.get(index) == job_id:
+                del self._jobs[index]
+                self._idle.append(index)
+                self._dispatch()
+            entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return
+        future, shm, _ = entry
+        shm.close()
+        shm.unlink()
+        if error:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _on_worker_exit(self, index: int) -> None:
+        process = self._processes[index]
+        process.join()
+        self._connections[index].close()
+        with self._lock:
+            job_id = self._jobs.pop(index, None)
+            if index in self._idle:
+                self._idle.remove(index)
+            was_ready = index in self._ready_workers
+            self._ready_workers.discard(index)
+            entry = self._pending.pop(job_id, None) if job_id is not None else None
+        reason = f"ASR worker {index} exited with code {process.exitcode}"
+        logger.error(reason + (f" while transcribing job {job_id}" if entry else ""))
+        if entry is not None:
+            future, shm, _ = entry
+            shm.close()
+            shm.unlink()
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+
+        if was_ready:
+            logger.info(f"Restarting ASR worker {index}")
+            self._start_worker(index)
+            return
+        # the model could not be loaded, a restart would fail the same way
+        self._processes[index] = None
+        if all(process is None for process in self._processes):
+            self._load_error = self._load_error or f"Failed to load {self.system_name}: {reason}"
+            self._fail_pending(self._load_error)
+
+    def close(self) -> None:
+        """Stop all workers and fail any job that is still pending."""
+        if self._closed:
+            return
+        self._closed = True
+        self._listener.join(timeout=5)
+        for index, process in enumerate(self._processes):
+            if process is not None:
+                self._job_queues[index].put(_STOP)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            self._connections[index].close()
+
+        self._fail_pending("ASR worker pool closed")
+
+    def _fail_pending(self, reason: str) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._backlog.clear()
+        for future, shm, _ in pending.values():
+            shm.close()
+            shm.unlink()
+            if not future.done():
+                future.set_exception(RuntimeError(reason))
+
+
+_pools: dict[tuple, ASRWorkerPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_worker_pool(system_name: str, num_workers: int = 1, **asr_kwargs) -> ASRWorkerPool:
+    """
+    Return the process-wide pool for this ASR configuration, creating it on first use.
+    Sessions that share an ASR configuration share the pool (and the loaded models).
+    """
+    key = (system_name, repr(sorted(asr_kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ASRWorkerPool(system_name, num_workers, **asr_kwargs)
+            _pools[key] = pool
+        return pool
+
+
+def shutdown_worker_pools() -> None:
+    """Close every pool created by `get_worker_pool`."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class VoiceRecognition(ASRInterface):
+    """
+    ASR front-end that forwards transcription to an `ASRWorkerPool`.
+    """
+
+    def __init__(self, system_name: str, num_workers: int = 1, **asr_kwargs) -> None:
+        self.pool = get_worker_pool(system_name, num_workers, **asr_kwargs)
+        self.asr_with_vad = None
+
+    def transcribe_np(self, audio: np.ndarray) -> str:
+        return self.transcribe_np_detailed(audio).text
+
+    def transcribe_np_detailed(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
+        return self.pool.submit(audio, language).result()
+
+    async def transcribe_np_detailed_async(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
+        return await asyncio.wrap_future(self.pool.submit(audio, language))
+
+    async def transcribe_np_async(self, audio: np.ndarray) -> str:
+        return (await self.transcribe_np_detailed_async(audio)).text
@@ -0,0 +1,94 @@
+"""
+In-memory audio encoding for cloud ASR uploads.
+
+Cloud ASR providers accept compressed audio, and a 16 kHz mono utterance is several
+times smaller as FLAC (lossless) or Opus than as 16-bit WAV. Everything here works on
+in-memory buffers; nothing is written to disk.
+"""
+
+import io
+import wave
+
+import numpy as np
+from loguru import logger
+
+from utils.metrics import metrics
+
+# format name -> (file extension, mime type)
+AUDIO_FORMATS = {
+    "wav": ("wav", "audio/wav"),
+    "flac": ("flac", "audio/flac"),
+    "opus": ("ogg", "audio/ogg"),
+}
+
+_opus_unavailable = False
+
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    """
+    Convert float audio in [-1, 1] to raw little-endian 16-bit PCM bytes.
+
+    Args:
+        audio: The numpy array of the audio data.
+    """
+    audio = np.clip(audio, -1, 1)
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+def encode_audio(
+    audio: np.ndarray, sample_rate: int = 16000, audio_format: str = "flac"
+) -> tuple[bytes, str]:
+    """
+    Encode mono float audio into an in-memory file.
+
+    Opus needs libsndfile >= 1.0.29; if it is missing, FLAC is used instead.
+
+    Args:
+        audio: The numpy array of the audio data.
+        sample_rate: The sample rate of the audio data.
+        audio_format: One of "flac", "opus" or "wav".
+
+    Returns:
+        tuple: The encoded bytes and the format actually used.
+    """
+    global _opus_unavailable
+
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format: {audio_format}")
+    if audio_format == "opus" and _opus_unavailable:
+        audio_format = "flac"
+
+    if audio_format == "wav":
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(to_pcm16(audio))
+        return buffer.getvalue(), "wav"
+
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    audio = np.clip(audio, -1, 1).astype(np.float32)
+    try:
+        if audio_format == "opus":
+            sf.write(buffer, audio, sample_rate, format="OGG", subtype="OPUS")
+        else:
+            sf.write(buffer, audio, sample_rate, format="FLAC", subtype="PCM_16")
+    except (RuntimeError, ValueError, TypeError) as e:
+        if audio_format != "opus":
+            raise
+        logger.warning(f"Opus encoding is not available ({e}), falling back to FLAC")
+        _opus_unavailable = True
+        return encode_audio(audio, sample_rate, "flac")
+
+    return buffer.getvalue(), audio_format
+
+
+def record_upload(provider: str, num_bytes: int, seconds: float) -> None:
+    """Record the size and round-trip time of one ASR upload for `provider`."""
+    metrics.incr(f"asr.{provider}.requests")
+    metrics.observe(f"asr.{provider}.upload_bytes", num_bytes)
+    metrics.observe(f"asr.{provider}.latency_s", seconds)
+    logger.debug(f"{provider} ASR: uploaded {num_bytes} bytes in {seconds:.3f}s")
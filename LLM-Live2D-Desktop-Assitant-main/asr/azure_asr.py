@@ -1,7 +1,9 @@
 import azure.cognitiveservices.speech as speechsdk
 from .asr_interface import ASRInterface
+from .audio_encoding import encode_audio, record_upload, to_pcm16
 from typing import Callable
 import os
+import time
 from rich import print
 import numpy as np
 
@@ -14,6 +16,7 @@ class VoiceRecognition(ASRInterface):
         subscription_key=os.getenv("AZURE_API_Key"),
         region=os.getenv("AZURE_REGION"),
         callback: Callable = print,
+        upload_format: str = "opus",
     ):
 
         self.subscription_key = subscription_key
@@ -35,6 +38,13 @@ class VoiceRecognition(ASRInterface):
 
         self.callback = callback
 
+        # "opus" sends compressed OGG/Opus (FLAC where libsndfile has no Opus), which the
+        # Speech SDK decodes with GStreamer. Without GStreamer the first compressed upload
+        # fails and the session falls back to "pcm", raw 16-bit samples.
+        self.upload_format = upload_format
+        self._stream_formats = {}
+        self._mic_recognizer = None
+
     def _create_speech_recognizer(self, uses_default_microphone: bool = True):
         print("Sub: ", self.subscription_key, "Reg: ", self.region)
         assert isinstance(
@@ -49,7 +59,10 @@ class VoiceRecognition(ASRInterface):
         )
 
     def transcribe_with_local_vad(self) -> str:
-        speech_recognizer = self._create_speech_recognizer()
+        # the microphone recognizer does not depend on the input, so build it once
+        if self._mic_recognizer is None:
+            self._mic_recognizer = self._create_speech_recognizer()
+        speech_recognizer = self._mic_recognizer
         print("Azure Listening...")
         result = speech_recognizer.recognize_once()
 
@@ -73,17 +86,73 @@ class VoiceRecognition(ASRInterface):
         Args:
             audio: The numpy array of the audio data to transcribe.
         """
-        temp_file = "temp.wav"
+        if self.upload_format == "pcm":
+            audio_bytes, audio_format = to_pcm16(audio), "pcm"
+        else:
+            audio_bytes, audio_format = encode_audio(audio, self.SAMPLE_RATE, self.upload_format)
+
+        result = self._recognize(audio_bytes, audio_format)
+        if (
+            audio_format != "pcm"
+            and result.reason == speechsdk.ResultReason.Canceled
+            and result.cancellation_details.reason == speechsdk.CancellationReason.Error
+            # e.g. SPXERR_GSTREAMER_NOT_FOUND_ERROR
+            and "gstreamer" in (result.cancellation_details.error_details or "").lower()
+        ):
+            print(
+                f"Azure needs GStreamer for {audio_format} audio "
+                f"({result.cancellation_details.error_details}), falling back to PCM uploads.",
+                style="yellow",
+            )
+            self.upload_format = "pcm"
+            audio_bytes, audio_format = to_pcm16(audio), "pcm"
+            result = self._recognize(audio_bytes, audio_format)
+
+        if result.reason == speechsdk.ResultReason.RecognizedSpeech:
+            return result.text
+        if result.reason == speechsdk.ResultReason.Canceled:
+            print("Recognition Canceled: {}".format(result.cancellation_details.reason))
+        return ""
 
-        np.savetxt(temp_file, audio)
+    def _stream_format(self, audio_format: str):
+        stream_format = self._stream_formats.get(audio_format)
+        if stream_format is None:
+            if audio_format == "pcm":
+                stream_format = speechsdk.audio.AudioStreamFormat(
+                    samples_per_second=self.SAMPLE_RATE,
+                    bits_per_sample=self.SAMPLE_WIDTH * 8,
+                    channels=self.NUM_CHANNELS,
+                )
+            else:
+                container = {
+                    "opus": speechsdk.AudioStreamContainerFormat.OGG_OPUS,
+                    "flac": speechsdk.AudioStreamContainerFormat.FLAC,
+                }[audio_format]
+                stream_format = speechsdk.audio.AudioStreamFormat(
+                    compressed_stream_format=container
+                )
+            self._stream_formats[audio_format] = stream_format
+        return stream_format
+
+    def _recognize(self, audio_bytes: bytes, audio_format: str):
+        # feed the audio through an in-memory push stream instead of a temp file.
+        # A recognizer is bound to its input stream, so each utterance needs its own;
+        # the speech config and stream formats are shared.
+        push_stream = speechsdk.audio.PushAudioInputStream(
+            stream_format=self._stream_format(audio_format)
+        )
+        push_stream.write(audio_bytes)
+        push_stream.close()
 
-        audio_config = speechsdk.AudioConfig(filename=temp_file)
+        audio_config = speechsdk.audio.AudioConfig(stream=push_stream)
         speech_recognizer = speechsdk.SpeechRecognizer(
             speech_config=self.speech_config, audio_config=audio_config
         )
 
-        return speech_recognizer.recognize_once()
-
+        start = time.perf_counter()
+        result = speech_recognizer.recognize_once()
+        record_upload("azure", len(audio_bytes), time.perf_counter() - start)
+        return result
 
 if __name__ == "__main__":
     service = VoiceRecognition()
@@ -0,0 +1,96 @@
+import re
+import threading
+from collections import deque
+
+# text that ends a sentence: terminal punctuation (latin and CJK), optionally followed by
+# closing quotes or brackets
+COMPLETE_SENTENCE = re.compile(r"[.!?。！？…]['\"”’)\]」』]*\s*$")
+# a trailing word that almost never ends a turn ("and", "the", "because", ...)
+DANGLING_WORD = re.compile(
+    r"\b(and|or|but|so|because|the|a|an|to|of|with|for|if|that|my|your|um|uh|like)\s*$",
+    re.IGNORECASE,
+)
+QUESTION_START = re.compile(
+    r"^\s*(what|why|how|when|where|who|which|can|could|would|will|do|does|did|is|are|should)\b",
+    re.IGNORECASE,
+)
+
+
+class AdaptiveEndpointer:
+    """
+    Decides when the user has finished their turn.
+
+    A fixed pause limit has to be long enough for the slowest mid-sentence pause, so every
+    turn waits that long after the user has actually finished. The endpointer instead looks
+    at a cheap partial transcript once the gap reaches `short_pause_ms`: if the text looks
+    complete (terminal punctuation, or a question without a dangling conjunction) the turn
+    ends right there. Otherwise it waits for the long pause.
+
+    The long pause is learned per session from the pauses the user makes inside their turns
+    (gaps after which they kept talking): it is set a margin above the recent maximum, and
+    kept between `short_pause_ms` and `max_pause_ms`.
+    """
+
+    def __init__(
+        self,
+        short_pause_ms: int = 400,
+        max_pause_ms: int = 1300,
+        margin_ms: int = 200,
+        history: int = 20,
+    ) -> None:
+        self.short_pause_ms = short_pause_ms
+        self.max_pause_ms = max_pause_ms
+        self.margin_ms = margin_ms
+        self._pauses: deque[int] = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @property
+    def long_pause_ms(self) -> int:
+        """The gap that ends a turn whose text does not look complete."""
+        with self._lock:
+            if len(self._pauses) < 3:
+                return self.max_pause_ms
+            learned = max(self._pauses) + self.margin_ms
+        return max(self.short_pause_ms, min(self.max_pause_ms, learned))
+
+    def observe_pause(self, pause_ms: int) -> None:
+        """
+        Record a pause after which the user kept talking.
+
+        Parameters:
+            pause_ms (int): The length of the pause in milliseconds.
+        """
+        if pause_ms <= 0:
+            return
+        with self._lock:
+            self._pauses.append(pause_ms)
+
+    @staticmethod
+    def looks_complete(text: str | None) -> bool:
+        """
+        Whether the (partial) transcript reads like a finished turn.
+
+        Parameters:
+            text (str): The transcript of the speech so far.
+        """
+        if not text or not text.strip():
+            return False
+        text = text.strip()
+        if DANGLING_WORD.search(text.rstrip(".,!?…")):
+            # whisper likes to add a period to anything, "I went to the." is not finished
+            return False
+        if COMPLETE_SENTENCE.search(text):
+            return True
+        return bool(QUESTION_START.search(text)) and len(text.split()) >= 3
+
+    def should_end(self, pause_ms: int, partial_text: str | None) -> bool:
+        """
+        Whether a gap of `pause_ms` ends the turn, given the transcript so far.
+
+        Parameters:
+            pause_ms (int): The current gap in milliseconds.
+            partial_text (str): The partial transcript, or None if none was made.
+        """
+        if pause_ms >= self.long_pause_ms:
+            return True
+        return pause_ms >= self.short_pause_ms and self.looks_complete(partial_text)
@@ -1,6 +1,6 @@
 import numpy as np
 from faster_whisper import WhisperModel
-from .asr_interface import ASRInterface
+from .asr_interface import ASRInterface, TranscriptionResult
 from loguru import logger
 
 
@@ -67,6 +67,11 @@ class VoiceRecognition(ASRInterface):
     # def transcribe_with_local_vad(self) -> str:
 
     def transcribe_np(self, audio: np.ndarray) -> str:
+        return self.transcribe_np_detailed(audio).text
+
+    def transcribe_np_detailed(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
         logger.info("Transcribing audio with Faster Whisper...")
         
         # Enhanced diagnostic logging
@@ -96,41 +101,53 @@ class VoiceRecognition(ASRInterface):
                 print(f"[ASR DIAGNOSTIC] WARNING: Audio too short for reliable transcription")
         else:
             print(f"[ASR DIAGNOSTIC] ERROR: Empty audio array")
-            return ""
+            return TranscriptionResult(text="")
         
         try:
             print(f"[ASR DIAGNOSTIC] Starting Whisper transcription...")
             segments, info = self.model.transcribe(
                 audio,
                 beam_size=5 if self.BEAM_SEARCH else 1,
-                language=self.LANG,
+                # a known language skips Whisper's language detection pass
+                language=language or self.LANG,
                 condition_on_previous_text=False,
             )
             
             print(f"[ASR DIAGNOSTIC] Transcription info: {info}")
             
             text_segments = []
+            logprobs = []
             for i, segment in enumerate(segments):
                 confidence = getattr(segment, 'avg_logprob', 'N/A')
                 print(f"[ASR DIAGNOSTIC] Segment {i}: '{segment.text}' (confidence: {confidence})")
                 text_segments.append(segment.text)
+                if confidence != 'N/A':
+                    logprobs.append(confidence)
+
+            detection = TranscriptionResult(
+                text="",
+                language=info.language,
+                language_probability=info.language_probability,
+                avg_logprob=sum(logprobs) / len(logprobs) if logprobs else None,
+            )
             
             if not text_segments:
                 print(f"[ASR DIAGNOSTIC] WARNING: No text segments generated")
                 logger.warning("No text transcribed from audio")
-                return ""
+                return detection
             else:
                 result = "".join(text_segments)
                 print(f"[ASR DIAGNOSTIC] Final transcription: '{result}'")
                 logger.info(f"Transcribed text: {result}")
-                return result
+                detection.text = result
+                return detection
                 
         except Exception as e:
             print(f"[ASR DIAGNOSTIC] Transcription error: {e}")
             logger.error(f"Error transcribing audio: {e}")
             import traceback
             traceback.print_exc()
-            return ""
+            return TranscriptionResult(text="")
 
     def transcribe(self, audio_data):
         """
@@ -4,7 +4,7 @@ import torch
 import numpy as np
 import soundfile as sf
 from funasr import AutoModel
-from .asr_interface import ASRInterface
+from .asr_interface import ASRInterface, TranscriptionResult
 
 
 # paraformer-zh is a multi-functional asr model
@@ -46,7 +46,15 @@ class VoiceRecognition(ASRInterface):
     # Implemented in asr_interface.py
     # def transcribe_with_local_vad(self) -> str:
 
+    # SenseVoice language tags, e.g. '<|en|>' or '< | en | >'
+    LANGUAGE_TAG = re.compile(r"<\s*\|\s*(zh|en|yue|ja|ko)\s*\|\s*>")
+
     def transcribe_np(self, audio: np.ndarray) -> str:
+        return self.transcribe_np_detailed(audio).text
+
+    def transcribe_np_detailed(
+        self, audio: np.ndarray, language: str | None = None
+    ) -> TranscriptionResult:
 
         audio_tensor = torch.tensor(audio, dtype=torch.float32)
 
@@ -54,11 +62,14 @@ class VoiceRecognition(ASRInterface):
             input=audio_tensor,
             batch_size_s=300,
             use_itn=self.use_itn,
-            language=self.language,
+            language=language or self.language,
         )
 
         full_text = res[0]["text"]
 
+        language_tag = self.LANGUAGE_TAG.search(full_text)
+        detected_language = language_tag.group(1) if language_tag else None
+
         # SenseVoiceSmall may spits out some tags
         # like this: '<|zh|><|NEUTRAL|><|Speech|><|woitn|>欢迎大家来体验达摩院推出的语音识别模型'
         # we should remove those tags from the result
@@ -68,7 +79,8 @@ class VoiceRecognition(ASRInterface):
         # the tags can also look like '< | en | > < | EMO _ UNKNOWN | > < | S pe ech | > < | wo itn | > ', so...
         full_text = re.sub(r"< \|.*?\| >", "", full_text)
 
-        return full_text.strip()
+        # SenseVoice does not report a detection probability
+        return TranscriptionResult(text=full_text.strip(), language=detected_language)
 
     def _numpy_to_wav_in_memory(self, numpy_array: np.ndarray, sample_rate):
 
@@ -1,8 +1,8 @@
-import io
-import wave
+import time
 import numpy as np
 from groq import Groq
 from .asr_interface import ASRInterface
+from .audio_encoding import encode_audio, record_upload
 import sounddevice as sd
 
 class VoiceRecognition(ASRInterface):
@@ -10,12 +10,17 @@ class VoiceRecognition(ASRInterface):
     # sample_rate, n_channels, and sampwidth are defined in asr_interface.py
 
     def __init__(
-        self, api_key: str, model: str = "distil-whisper-large-v3-en", lang: str = "en"
+        self,
+        api_key: str,
+        model: str = "distil-whisper-large-v3-en",
+        lang: str = "en",
+        upload_format: str = "flac",
     ) -> None:
         print("Initializing Groq ASR...")
         self.client = Groq(api_key=api_key)
         self.lang = lang
         self.model = model
+        self.upload_format = upload_format
 
     # Implemented in asr_interface.py
     # def transcribe_with_local_vad(self) -> str:
@@ -29,32 +34,22 @@ class VoiceRecognition(ASRInterface):
 
         print("Transcribing audio (GroqWhisperASR)...")
 
-        # Turn the audio into an audio file
-        # Make sure the audio is in the range [-1, 1]
-        audio = np.clip(audio, -1, 1)
-        # Convert the audio to 16-bit PCM
-        audio_integer = (audio * 32767).astype(np.int16)
-
-        # groq api requires a file-like object for the audio data, so we use a BytesIO object
-        audio_buffer = io.BytesIO()
-
-        with wave.open(audio_buffer, "wb") as wf:
-            wf.setnchannels(self.NUM_CHANNELS)
-            wf.setsampwidth(self.SAMPLE_WIDTH)
-            wf.setframerate(self.SAMPLE_RATE)
-            wf.writeframes(audio_integer.tobytes())
-
-        audio_buffer.seek(0)
+        # groq api requires a file-like object for the audio data; a compressed
+        # in-memory file keeps the upload small
+        audio_bytes, audio_format = encode_audio(
+            audio, self.SAMPLE_RATE, self.upload_format
+        )
 
-        # Transcribe the audio with the BytesIO object
+        start = time.perf_counter()
         transcription = self.client.audio.transcriptions.create(
-            file=("audio.wav", audio_buffer.read()),
+            file=(f"audio.{audio_format}", audio_bytes),
             model=self.model,
             # prompt="Specify context or spelling",
             response_format="text",
             language=self.lang,
             temperature=0.0,
         )
+        record_upload("groq", len(audio_bytes), time.perf_counter() - start)
 
         return transcription
     
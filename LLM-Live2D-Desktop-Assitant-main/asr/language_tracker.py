@@ -0,0 +1,106 @@
+import threading
+
+import numpy as np
+from loguru import logger
+
+from .asr_interface import ASRInterface, TranscriptionResult
+
+
+class LanguageTracker:
+    """
+    Tracks the spoken language over one session and pins it once it is stable.
+
+    Whisper-style models run a language detection pass on every utterance when no
+    language is configured. Once `pin_after` consecutive utterances have been detected
+    as the same language with at least `min_probability`, the language is pinned and
+    passed to the ASR system explicitly, which skips detection. If a pinned decode comes
+    back with an average log probability below `redetect_logprob` (the user probably
+    switched languages), the pin is dropped and detection runs again. Systems that do
+    not report both probabilities are never pinned.
+
+    One tracker belongs to one session. ASR models may be shared between sessions.
+    """
+
+    def __init__(
+        self,
+        pin_after: int = 3,
+        min_probability: float = 0.8,
+        redetect_logprob: float = -1.0,
+    ) -> None:
+        self.pin_after = pin_after
+        self.min_probability = min_probability
+        self.redetect_logprob = redetect_logprob
+
+        self.pinned_language: str | None = None
+        self.last_language: str | None = None
+        self._candidate: str | None = None
+        self._streak = 0
+        self._lock = threading.Lock()
+
+    @property
+    def language(self) -> str | None:
+        """The language detected for this session so far (pinned or most recent)."""
+        return self.pinned_language or self.last_language
+
+    def observe(self, result: TranscriptionResult) -> None:
+        """
+        Update the session state with the outcome of one transcription.
+
+        Parameters:
+            result (TranscriptionResult): The transcription to learn from.
+        """
+        with self._lock:
+            if self.pinned_language:
+                if (
+                    result.avg_logprob is not None
+                    and result.avg_logprob < self.redetect_logprob
+                ):
+                    logger.info(
+                        f"Low decode confidence ({result.avg_logprob:.2f}) with pinned language "
+                        f"'{self.pinned_language}', re-enabling language detection"
+                    )
+                    self.pinned_language = None
+                    self._candidate = None
+                    self._streak = 0
+                return
+
+            if not result.language or not result.text.strip():
+                return
+            self.last_language = result.language
+
+            # without a probability the detection cannot be trusted, and without a log
+            # probability a pinned language could never be dropped again (FunASR reports neither)
+            confident = (
+                result.language_probability is not None
+                and result.avg_logprob is not None
+                and result.language_probability >= self.min_probability
+            )
+            if not confident:
+                self._streak = 0
+                return
+
+            if result.language == self._candidate:
+                self._streak += 1
+            else:
+                self._candidate = result.language
+                self._streak = 1
+
+            if self._streak >= self.pin_after:
+                self.pinned_language = self._candidate
+                logger.info(f"Pinned ASR language to '{self.pinned_language}'")
+
+    def transcribe(self, asr: ASRInterface, audio: np.ndarray) -> TranscriptionResult:
+        """Transcribe with the pinned language (if any) and learn from the result."""
+        result = asr.transcribe_np_detailed(audio, language=self.pinned_language)
+        self.observe(result)
+        return result
+
+    async def transcribe_async(
+        self, asr: ASRInterface, audio: np.ndarray
+    ) -> TranscriptionResult:
+        """Awaitable version of `transcribe`."""
+        result = await asr.transcribe_np_detailed_async(
+            audio, language=self.pinned_language
+        )
+        self.observe(result)
+        return result
@@ -1,6 +1,13 @@
+import json
+import socket
+import time
 import requests
 from typing import Iterator
+from loguru import logger
+from utils.metrics import metrics
 from .llm_interface import LLMInterface
+from .context_window import ContextWindow
+from .prompt_assembly import anthropic_messages, anthropic_system, record_cache_usage
 
 class LLM(LLMInterface):
     def __init__(
@@ -10,64 +17,135 @@ class LLM(LLMInterface):
         model: str = "claude-3-haiku-20240307",
         llm_api_key: str = None,  # Not needed for AWS endpoint but kept for compatibility
         verbose: bool = False,
+        stream: bool = False,
+        stream_url: str = None,
+        max_history_cnt: int = -1,
+        max_context_tokens: int = None,
+        context_evict_tokens: int = 1024,
+        summarize_context: bool = True,
+        prompt_caching: bool = True,
     ):
         """
         Initialize Claude LLM using AWS HTTP endpoint.
-        
+
         Args:
             system (str): System prompt
             base_url (str): Base URL for AWS HTTP endpoint
             model (str): Model name (for reference only, actual model is set in AWS)
             llm_api_key (str): Not used with AWS endpoint, kept for compatibility
             verbose (bool): Whether to print debug info
+            stream (bool): Stream the reply as server-sent events instead of waiting for the full reply
+            stream_url (str): URL of the streaming endpoint (the ClaudeStreamFn function URL).
+                Defaults to `{base_url}/claude/stream`
+            max_history_cnt (int): Keep at most this many messages in the context (-1 for no limit)
+            max_context_tokens (int): Token budget of the conversation history (None for no budget)
+            context_evict_tokens (int): Evict at least this many tokens at once
+            summarize_context (bool): Fold evicted turns into a rolling summary
+            prompt_caching (bool): Mark cache breakpoints after the system prompt and the newest message
         """
         self.system = system
         self.model = model
         self.verbose = verbose
         self.base_url = base_url
-        
+        self.stream = stream
+        self.prompt_caching = prompt_caching
+        self.stream_url = stream_url or f"{base_url}/claude/stream"
+        # keep the connection to the endpoint alive between turns
+        self.session = requests.Session()
+        # the streamed reply, so it can be cancelled
+        self._response = None
+
         if self.verbose:
             print(f"Initialized Claude LLM with AWS HTTP endpoint: {base_url}")
-        
+            if self.stream:
+                print(f"Streaming replies from: {self.stream_url}")
+
         # Store conversation history (excluding system prompt)
-        self.messages = []
+        self.context = ContextWindow(
+            max_tokens=max_context_tokens,
+            evict_tokens=context_evict_tokens,
+            max_history_cnt=max_history_cnt,
+            summarizer=self._complete if summarize_context else None,
+        )
+        self.messages = self.context.history
+
+    def _build_payload(self, prompt: str) -> dict:
+        # Prepare the payload with system prompt and conversation history
+        messages = self.context.messages()
+        if self.prompt_caching and self.system:
+            # the persona prompt is cached, the (rarely changing) summary comes after it
+            payload = {
+                "text": prompt,
+                "system": anthropic_system(self.system, self.context.summary_section()),
+                "messages": anthropic_messages(messages),
+            }
+            return payload
+
+        payload = {
+            "text": prompt,
+            "system": self.context.system_prompt(self.system or "").strip()
+        }
+
+        # Include conversation history if available
+        if len(messages) > 1:  # More than just the current user message
+            # Convert our message format to the format expected by the Lambda function
+            payload["messages"] = messages
+        return payload
+
+    @staticmethod
+    def _record_usage(usage: dict | None) -> None:
+        if usage:
+            record_cache_usage(
+                "claude",
+                input_tokens=usage.get("input_tokens"),
+                cached_tokens=usage.get("cache_read_input_tokens"),
+                cache_write_tokens=usage.get("cache_creation_input_tokens"),
+            )
+
+    def _complete(self, system: str, prompt: str) -> str:
+        """
+        A blocking one-off request, used to summarize evicted turns.
+        """
+        response = self.session.post(
+            f"{self.base_url}/claude",
+            json={"text": prompt, "system": system},
+            timeout=60
+        )
+        response.raise_for_status()
+        return response.json()["reply"]
 
     def chat_iter(self, prompt: str, image_base64=None) -> Iterator[str]:
         """
         Send message to Claude via AWS HTTP endpoint and yield response tokens.
-        
+
         Args:
             prompt (str): User message
             image_base64 (str, optional): Base64 encoded image (not used in this implementation)
-            
+
         Yields:
             str: Response tokens
         """
         # Add user message to history
         self.messages.append({"role": "user", "content": prompt})
-        
+
+        if self.stream:
+            yield from self._chat_iter_stream(prompt)
+            return
+
         try:
             if self.verbose:
                 print(f"Sending request to AWS HTTP endpoint: {self.base_url}/claude")
-            
-            # Prepare the payload with system prompt and conversation history
-            payload = {
-                "text": prompt,
-                "system": self.system if self.system else ""
-            }
-            
-            # Include conversation history if available
-            if len(self.messages) > 1:  # More than just the current user message
-                # Convert our message format to the format expected by the Lambda function
-                payload["messages"] = self.messages
-            
+
+            payload = self._build_payload(prompt)
+
             # Send request to AWS HTTP endpoint
-            response = requests.post(
+            start = time.perf_counter()
+            response = self.session.post(
                 f"{self.base_url}/claude",
                 json=payload,
                 timeout=60  # 60 second timeout
             )
-            
+
             # Check for errors
             if response.status_code != 200:
                 error_msg = f"HTTP error {response.status_code}: {response.text}"
@@ -75,7 +153,7 @@ class LLM(LLMInterface):
                     print(error_msg)
                 yield error_msg
                 return
-            
+
             # Parse the response
             data = response.json()
             if "reply" not in data:
@@ -84,30 +162,165 @@ class LLM(LLMInterface):
                     print(error_msg)
                 yield error_msg
                 return
-            
+
             # Get the response text
             response_text = data["reply"]
-            
-            # Simulate streaming by yielding characters one by one
-            # This maintains compatibility with the existing code that expects streaming
-            for char in response_text:
-                yield char
-            
+            self._record_usage(data.get("usage"))
+            # without streaming the first token arrives with the last one
+            elapsed = time.perf_counter() - start
+            metrics.observe("llm.claude.ttft_s", elapsed)
+            metrics.observe("llm.claude.latency_s", elapsed)
+
+            yield response_text
+
             # Add assistant response to history
             self.messages.append({
-                "role": "assistant", 
+                "role": "assistant",
                 "content": response_text
             })
-                
+
         except Exception as e:
             if self.verbose:
                 print(f"Error in Claude chat via AWS HTTP: {str(e)}")
             yield f"Error occurred: {str(e)}"
 
+    def _chat_iter_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yield reply deltas from the streaming endpoint as they arrive.
+
+        The endpoint answers with server-sent events whose data is one JSON object:
+        `{"delta": "..."}` for text, `{"usage": {...}}` with the prompt (cache) token counts,
+        `{"error": "..."}` on failure and `{"done": true}` at the end.
+        An endpoint that answers with a plain JSON `reply` is handled as well.
+        """
+        # recorded as it streams, so an interrupt can trim it right away
+        reply = {"role": "assistant", "content": ""}
+        response = None
+        try:
+            if self.verbose:
+                print(f"Streaming request to: {self.stream_url}")
+
+            start = time.perf_counter()
+            first_token_at = None
+            response = self.session.post(
+                self.stream_url,
+                json=self._build_payload(prompt),
+                headers={"accept": "text/event-stream"},
+                stream=True,
+                timeout=(10, 60),  # connect, and max gap between chunks
+            )
+
+            self._response = response
+
+            if response.status_code != 200:
+                error_msg = f"HTTP error {response.status_code}: {response.text}"
+                if self.verbose:
+                    print(error_msg)
+                yield error_msg
+                return
+
+            if "text/event-stream" not in response.headers.get("content-type", ""):
+                # not a streaming endpoint, fall back to the full reply
+                data = response.json()
+                reply["content"] = data.get("reply", "")
+                self._record_usage(data.get("usage"))
+                self.messages.append(reply)
+                first_token_at = time.perf_counter()
+                metrics.observe("llm.claude.ttft_s", first_token_at - start)
+                yield reply["content"]
+            else:
+                # chunk_size=None hands over data as it arrives instead of filling 512-byte blocks
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):].strip())
+                    if event.get("error"):
+                        logger.error(f"Claude stream error: {event['error']}")
+                        yield f"Error occurred: {event['error']}"
+                        break
+                    if "usage" in event:
+                        self._record_usage(event["usage"])
+                    if event.get("done"):
+                        break
+                    delta = event.get("delta")
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        metrics.observe("llm.claude.ttft_s", first_token_at - start)
+                        self.messages.append(reply)
+                    reply["content"] += delta
+                    yield delta
+
+            metrics.observe("llm.claude.latency_s", time.perf_counter() - start)
+
+        except Exception as e:
+            if response is not None and response is not self._response:
+                # the stream was cancelled
+                return
+            if self.verbose:
+                print(f"Error in Claude streaming via AWS HTTP: {str(e)}")
+            yield f"Error occurred: {str(e)}"
+        finally:
+            # also runs when the consumer stops early (interrupt), which drops the stream
+            if response is not None:
+                if self._response is response:
+                    self._response = None
+                response.close()
+
+    def cancel(self) -> None:
+        """
+        Close the streamed reply, so a request that is still waiting for the reply stops now.
+        """
+        response, self._response = self._response, None
+        if response is None:
+            return
+        # closing only takes effect at the next read, shutting the socket down also ends a waiting read
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
+    def add_turn(self, prompt: str, reply: str) -> None:
+        """
+        Record an exchange answered from the response cache.
+
+        Args:
+            prompt (str): User message
+            reply (str): The cached reply
+        """
+        self.messages.append({"role": "user", "content": prompt})
+        self.messages.append({"role": "assistant", "content": reply})
+
+    def replace_last_reply(self, reply: str) -> None:
+        """
+        Make `reply` the answer to the last prompt (another backend answered it).
+
+        Args:
+            reply (str): The reply the user got
+        """
+        if self.messages and self.messages[-1]["role"] == "assistant":
+            self.messages[-1]["content"] = reply
+        else:
+            self.messages.append({"role": "assistant", "content": reply})
+
+    def health_check(self) -> bool:
+        """
+        Check that the endpoint answers on /health.
+        """
+        try:
+            return self.session.get(f"{self.base_url}/health", timeout=5).ok
+        except requests.RequestException:
+            return False
+
     def handle_interrupt(self, heard_response: str) -> None:
         """
         Handle interruption by updating the last assistant message.
-        
+
         Args:
             heard_response (str): The heard portion of the response
         """
@@ -0,0 +1,247 @@
+"""Description: Token-budgeted conversation history shared by the LLM backends.
+
+Sending the whole conversation on every turn makes prompt processing time and cost grow
+with the length of the session. `ContextWindow` keeps the history under a token budget
+(and `max_history_cnt` messages). Old turns are evicted in chunks of at least
+`evict_tokens`, so the prompt prefix only changes once per chunk instead of on every
+turn, and evicted turns are folded into a rolling summary in the background. If the
+summary cannot be made, the turns are kept and it is tried again on the next turn; after
+`SUMMARY_RETRIES` more failures the chunk is dropped without a summary.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from loguru import logger
+
+from utils.metrics import metrics
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional, fall back to an estimate
+    _encoding = None
+
+# rough token cost of an image part in a vision message
+IMAGE_TOKENS = 765
+# role and separators around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# failed summaries of the same turns before they are dropped without one
+SUMMARY_RETRIES = 1
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Merge the previous summary and the new messages into one concise summary, written in "
+    "the third person. Keep names, facts, preferences, open questions and promises. "
+    "Reply with the summary only."
+)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count (or, without tiktoken, estimate) the tokens in `text`.
+
+    The estimate counts four ASCII characters per token and one token for every other
+    character, which is close enough for CJK text.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def message_tokens(message: dict) -> int:
+    """Count the tokens of one chat message, including vision messages."""
+    content = message.get("content")
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    if isinstance(content, list):
+        for part in content:
+            if part.get("type") == "text":
+                tokens += count_tokens(part.get("text", ""))
+            else:
+                tokens += IMAGE_TOKENS
+    else:
+        tokens += count_tokens(content or "")
+    return tokens
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text", "[image]") if part.get("type") == "text" else "[image]"
+            for part in content
+        )
+    return content or ""
+
+
+class ContextWindow:
+    """
+    The conversation history of one LLM backend, kept under a token budget.
+
+    `history` is a plain list of chat messages (without the system prompt) that the backend
+    appends to. Backends call `build(system)` (or `system_prompt` and `messages`) to get what
+    to send. Eviction happens there, before the request.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int | None = None,
+        evict_tokens: int = 1024,
+        max_history_cnt: int = -1,
+        summarizer: Callable[[str, str], str] | None = None,
+    ) -> None:
+        """
+        Parameters:
+        - max_tokens (int, optional): Token budget of the history. None means no budget.
+        - evict_tokens (int, optional): Evict at least this many tokens at once. Defaults to 1024.
+        - max_history_cnt (int, optional): Keep at most this many messages. -1 means no limit.
+        - summarizer (callable, optional): `summarizer(system, prompt) -> str`, a blocking completion
+            call used to fold evicted turns into the summary. Without it evicted turns are dropped.
+        """
+        self.max_tokens = max_tokens
+        self.evict_tokens = evict_tokens
+        self.max_history_cnt = max_history_cnt
+        self.summarizer = summarizer
+
+        self.history: list[dict] = []
+        self.summary = ""
+        self._lock = threading.Lock()
+        self._summarizing = False
+        self._summary_failures = 0
+        # bumped by clear(), so a summary of the turns before it is thrown away
+        self._generation = 0
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+            if summarizer
+            else None
+        )
+
+    def append(self, message: dict) -> None:
+        self.history.append(message)
+
+    def summary_section(self) -> str:
+        """The summary of the evicted turns, as a section of the system prompt."""
+        if not self.summary:
+            return ""
+        return f"## Summary of the earlier conversation\n{self.summary}"
+
+    def system_prompt(self, system: str) -> str:
+        """The system prompt followed by the summary of the evicted turns."""
+        if not self.summary:
+            return system
+        return f"{system}\n\n{self.summary_section()}"
+
+    def messages(self) -> list[dict]:
+        """The retained history, after evicting what is over the budget."""
+        self.trim()
+        messages = list(self.history)
+        metrics.observe(
+            "llm.context.tokens", sum(message_tokens(message) for message in messages)
+        )
+        return messages
+
+    def build(self, system: str) -> list[dict]:
+        """The full message list to send: system prompt (with summary) and history."""
+        messages = self.messages()
+        return [{"role": "system", "content": self.system_prompt(system)}] + messages
+
+    def trim(self) -> None:
+        """
+        Evict the oldest turns if the history is over its budget.
+
+        With a summarizer, the evicted turns stay in the history until their summary is
+        ready and are then swapped for it in one step, so the prompt prefix changes once.
+        """
+        with self._lock:
+            if self._summarizing:
+                return
+            count = self._eviction_count()
+            if count == 0:
+                return
+            evicted = self.history[:count]
+            if self._executor is None:
+                del self.history[:count]
+                logger.debug(f"Context: dropped {count} old messages")
+                return
+            self._summarizing = True
+            previous_summary = self.summary
+            generation = self._generation
+        self._executor.submit(self._summarize, evicted, previous_summary, generation)
+
+    def _eviction_count(self) -> int:
+        total = sum(message_tokens(message) for message in self.history)
+        over_tokens = self.max_tokens is not None and total > self.max_tokens
+        over_count = 0 < self.max_history_cnt < len(self.history)
+        if not over_tokens and not over_count:
+            return 0
+
+        # evict a whole chunk, not just the overflow, so this does not repeat every turn
+        tokens_to_free = max(self.evict_tokens, total - (self.max_tokens or total))
+        messages_to_free = (
+            len(self.history) - self.max_history_cnt if over_count else 0
+        )
+        freed = 0
+        count = 0
+        # never evict the newest message (the prompt being answered)
+        while count < len(self.history) - 1 and (
+            freed < tokens_to_free or count < messages_to_free
+        ):
+            freed += message_tokens(self.history[count])
+            count += 1
+        # end the chunk before a user message so the history still starts with the user
+        while count < len(self.history) - 1 and self.history[count]["role"] != "user":
+            count += 1
+        return count
+
+    def _summarize(self, evicted: list[dict], previous_summary: str, generation: int) -> None:
+        transcript = "\n".join(
+            f"{message['role']}: {_message_text(message)}" for message in evicted
+        )
+        prompt = (
+            f"Previous summary:\n{previous_summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        summary = None
+        try:
+            with metrics.timer("llm.context.summary_s"):
+                summary = self.summarizer(SUMMARY_SYSTEM_PROMPT, prompt).strip()
+        except Exception as e:
+            metrics.incr("llm.context.summary_errors")
+            logger.warning(f"Context: summarizing evicted turns failed: {e}")
+
+        with self._lock:
+            self._summarizing = False
+            # the evicted messages are still the first ones unless the history was cleared
+            if (
+                generation != self._generation
+                or len(self.history) < len(evicted)
+                or not all(a is b for a, b in zip(self.history, evicted))
+            ):
+                return
+            if summary is None:
+                self._summary_failures += 1
+                if self._summary_failures <= SUMMARY_RETRIES:
+                    # keep the turns, the next trim tries again
+                    return
+                del self.history[: len(evicted)]
+                self._summary_failures = 0
+                logger.warning(
+                    f"Context: dropped {len(evicted)} old messages without a summary"
+                )
+                return
+            del self.history[: len(evicted)]
+            self.summary = summary
+            self._summary_failures = 0
+        logger.debug(f"Context: folded {len(evicted)} old messages into the summary")
+
+    def clear(self) -> None:
+        with self._lock:
+            self.history.clear()
+            self.summary = ""
+            self._summary_failures = 0
+            self._generation += 1
@@ -0,0 +1,433 @@
+"""Description: A composite LLM that fails over from a primary to a secondary backend.
+
+The primary (e.g. local Ollama) gets every prompt first. If it has not produced its first
+token within `first_token_timeout_s`, or fails, the secondary (e.g. the Claude endpoint)
+is started as a hedge; whichever streams first wins and the other one is cancelled. Each
+backend has a circuit breaker: after `failure_threshold` failures or lost races in a row
+the backend is skipped until a health probe (or, without one, the next trial request after
+`reset_timeout_s`) shows it is back.
+
+Both backends keep their own history. After every turn the one that did not answer is
+given the reply, so either can take over the conversation at any time. A cancelled request
+is closed, but a backend may take a while to stop: the turns it missed are kept for it and
+given to it in order as soon as its stream has stopped, and until then new turns are
+answered without it.
+"""
+
+import queue
+from collections import deque
+import threading
+import time
+from typing import Iterator
+from loguru import logger
+
+from utils.metrics import metrics
+from .llm_interface import LLMInterface
+
+# how backends report a failed request as reply text
+_ERROR_PREFIXES = ("Error occurred", "Error calling", "HTTP error")
+_DONE = object()
+
+
+class CircuitBreaker:
+    """Tracks the consecutive failures of one backend."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout_s: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                # let one trial request through
+                self._state = self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"LLM failover: {self.name} is back")
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self.failures >= self.failure_threshold
+            ):
+                logger.warning(f"LLM failover: {self.name} failed {self.failures} times, skipping it")
+                metrics.incr(f"llm.failover.{self.name}.breaker_opened")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def half_open(self) -> None:
+        """Called when a health probe succeeds: the next request is a trial."""
+        with self._lock:
+            if self._state == self.OPEN:
+                self._state = self.HALF_OPEN
+
+
+class _Stream:
+    """One backend's reply, pulled in its own thread and put on a shared queue."""
+
+    def __init__(
+        self, name: str, llm: LLMInterface, prompt: str, image_base64, out: queue.Queue, on_finished
+    ) -> None:
+        self.name = name
+        self.llm = llm
+        self.out = out
+        self.cancelled = threading.Event()
+        self.started_at = time.perf_counter()
+        self.failed = False
+        # set once the backend is done with the request and its history will not change any more
+        self.finished = False
+        self._on_finished = on_finished
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self._run, args=(prompt, image_base64), name=f"llm-{name}", daemon=True
+        )
+        self.thread.start()
+
+    def cancel(self) -> None:
+        """Stop the stream, and close the backend's request if it is still running."""
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            if self.finished:
+                # the backend may be answering a newer request by now
+                return
+            try:
+                self.llm.cancel()
+            except Exception as e:
+                logger.warning(f"LLM failover: could not cancel {self.name}: {e}")
+
+    def _run(self, prompt: str, image_base64) -> None:
+        chat_completion = None
+        try:
+            chat_completion = self.llm.chat_iter(prompt, image_base64)
+            if isinstance(chat_completion, str):
+                # the OpenAI compatible backends return the error instead of a stream
+                raise RuntimeError(chat_completion)
+            for chunk in chat_completion:
+                if self.cancelled.is_set():
+                    break
+                if chunk:
+                    self.out.put((self, chunk))
+        except Exception as e:
+            self.out.put((self, e))
+        finally:
+            try:
+                # generators have to be closed by the thread that runs them
+                if hasattr(chat_completion, "close"):
+                    chat_completion.close()
+            except Exception as e:
+                logger.warning(f"LLM failover: closing the {self.name} stream failed: {e}")
+            with self._lock:
+                self.finished = True
+            self.out.put((self, _DONE))
+            self._on_finished(self.name)
+
+
+class _Turn:
+    def __init__(self, prompt: str, reply: str = "") -> None:
+        self.prompt = prompt
+        self.streams: dict[str, _Stream] = {}
+        self.winner: str | None = None
+        self.reply = reply
+        # the reply was replaced after the winner had recorded it
+        self.replaced = False
+        # what the user heard before interrupting the reply, if they did
+        self.heard: str | None = None
+        # nothing will be added to the reply any more
+        self.done = False
+
+
+class FailoverLLM(LLMInterface):
+
+    # how long a new turn waits for a backend that is still stopping, when no other is free
+    catch_up_timeout_s = 5.0
+
+    def __init__(
+        self,
+        primary: LLMInterface,
+        secondary: LLMInterface,
+        primary_name: str = "primary",
+        secondary_name: str = "secondary",
+        first_token_timeout_s: float = 2.0,
+        failure_threshold: int = 3,
+        reset_timeout_s: float = 30.0,
+        probe_interval_s: float = 10.0,
+    ) -> None:
+        """
+        Parameters:
+        - primary (LLMInterface): The backend that is tried first.
+        - secondary (LLMInterface): The backend used as a hedge and fallback.
+        - primary_name (str, optional): Name of the primary, used in logs and metrics.
+        - secondary_name (str, optional): Name of the secondary, used in logs and metrics.
+        - first_token_timeout_s (float, optional): Start the secondary if the primary has not
+            streamed anything after this many seconds. Defaults to 2.0.
+        - failure_threshold (int, optional): Skip a backend after this many failures in a row. Defaults to 3.
+        - reset_timeout_s (float, optional): Try a skipped backend again after this many seconds. Defaults to 30.
+        - probe_interval_s (float, optional): How often a skipped backend's health is checked. Defaults to 10.
+        """
+        if primary_name == secondary_name:
+            secondary_name = f"{secondary_name}_2"
+        self.backends = {primary_name: primary, secondary_name: secondary}
+        self.order = [primary_name, secondary_name]
+        self.first_token_timeout_s = first_token_timeout_s
+        self.probe_interval_s = probe_interval_s
+        self.breakers = {
+            name: CircuitBreaker(name, failure_threshold, reset_timeout_s) for name in self.order
+        }
+        self._turn: _Turn | None = None
+        # the turns each backend has not been given yet, oldest first
+        self._unsettled: dict[str, deque[_Turn]] = {name: deque() for name in self.order}
+        self._lock = threading.RLock()
+        self._caught_up = threading.Condition(self._lock)
+        self._prober: threading.Thread | None = None
+        self._prober_lock = threading.Lock()
+
+    def prefetch(self, query: str) -> None:
+        for llm in self.backends.values():
+            llm.prefetch(query)
+
+    def _free(self) -> list[str]:
+        """The backends that are not catching up with an earlier turn. Call it with the lock held."""
+        return [name for name in self.order if not self._unsettled[name]]
+
+    def _candidates(self, free: list[str]) -> list[str]:
+        """The backends to try, in order: the ones whose breaker is closed first."""
+        allowed = [name for name in free if self.breakers[name].allow()]
+        # with both breakers open, still try (the primary first) rather than not answer
+        return allowed + [name for name in free if name not in allowed]
+
+    def chat_iter(self, prompt: str, image_base64=None) -> Iterator[str]:
+        return self._race(_Turn(prompt), image_base64)
+
+    def _begin(self, turn: _Turn) -> list[str]:
+        """Queue the turn for every backend and return the backends that may answer it."""
+        with self._caught_up:
+            if not self._caught_up.wait_for(self._free, timeout=self.catch_up_timeout_s):
+                # better an answer from a backend whose history is behind than none
+                logger.warning("LLM failover: no backend has stopped its last reply, not waiting any longer")
+            free = self._free() or self.order
+            self._turn = turn
+            for unsettled in self._unsettled.values():
+                unsettled.append(turn)
+        return self._candidates(free)
+
+    def _race(self, turn: _Turn, image_base64) -> Iterator[str]:
+        out = queue.Queue()
+        candidates = []
+        last_error = None
+
+        def start(name: str) -> None:
+            if name != candidates[0]:
+                metrics.incr(f"llm.failover.{name}.hedged")
+                logger.info(f"LLM failover: starting {name}")
+            turn.streams[name] = _Stream(
+                name, self.backends[name], turn.prompt, image_base64, out, self._settle
+            )
+
+        def fail(stream: _Stream, error) -> None:
+            nonlocal last_error
+            stream.failed = True
+            stream.cancel()
+            last_error = str(error)
+            logger.warning(f"LLM failover: {stream.name} failed: {error}")
+            metrics.incr(f"llm.failover.{stream.name}.failures")
+            self.breakers[stream.name].record_failure()
+            self._ensure_prober()
+
+        try:
+            candidates = self._begin(turn)
+            start(candidates[0])
+            deadline = time.perf_counter() + self.first_token_timeout_s
+            first_chunk = None
+            while turn.winner is None:
+                pending = [name for name in candidates if name not in turn.streams]
+                active = [s for s in turn.streams.values() if not s.failed]
+                if not active:
+                    if not pending:
+                        break
+                    # the running backend failed before answering, no need to wait for the deadline
+                    start(pending[0])
+                    continue
+                timeout = None
+                if pending:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0:
+                        start(pending[0])
+                        continue
+                try:
+                    stream, item = out.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if stream.failed:
+                    continue
+                if item is _DONE:
+                    fail(stream, "no reply")
+                elif isinstance(item, Exception):
+                    fail(stream, item)
+                elif isinstance(item, str) and item.startswith(_ERROR_PREFIXES):
+                    fail(stream, item)
+                else:
+                    turn.winner = stream.name
+                    first_chunk = item
+
+            if turn.winner is None:
+                # every backend failed, say so the way a single backend would
+                yield f"Error occurred: {last_error}"
+                return
+
+            winner = turn.streams[turn.winner]
+            metrics.observe(f"llm.failover.{winner.name}.ttft_s", time.perf_counter() - winner.started_at)
+            metrics.incr(f"llm.failover.{winner.name}.wins")
+            self.breakers[winner.name].record_success()
+            for stream in turn.streams.values():
+                if stream is not winner:
+                    stream.cancel()
+                    if not stream.failed and stream.name == candidates[0]:
+                        # lost the race to the hedge: too slow
+                        self.breakers[stream.name].record_failure()
+                        self._ensure_prober()
+
+            turn.reply = first_chunk if isinstance(first_chunk, str) else ""
+            yield first_chunk
+            while True:
+                stream, item = out.get()
+                if stream is not winner:
+                    continue
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    logger.error(f"LLM failover: {winner.name} stopped mid-reply: {item}")
+                    break
+                if isinstance(item, str):
+                    turn.reply += item
+                yield item
+            metrics.observe(f"llm.failover.{winner.name}.latency_s", time.perf_counter() - winner.started_at)
+        finally:
+            # also runs when the consumer stops early (interrupt)
+            for stream in turn.streams.values():
+                stream.cancel()
+            with self._lock:
+                turn.done = True
+            for name in self.order:
+                self._settle(name)
+
+    def _settle(self, name: str) -> None:
+        """
+        Give the backend the turns it has missed, oldest first. A turn is given once its reply
+        is complete and the backend's own (cancelled) stream for it has stopped, so that stream
+        cannot change the history any more. Without a winner (interrupted early, or every
+        backend failed) the reply is empty. Called from the stream threads when they stop.
+        """
+        llm = self.backends[name]
+        with self._lock:
+            unsettled = self._unsettled[name]
+            while unsettled:
+                turn = unsettled[0]
+                stream = turn.streams.get(name)
+                if not turn.done or (stream is not None and not stream.finished):
+                    return
+                unsettled.popleft()
+                try:
+                    if name != turn.winner:
+                        if stream is not None:
+                            llm.replace_last_reply(turn.reply)
+                        else:
+                            llm.add_turn(turn.prompt, turn.reply)
+                    elif turn.replaced:
+                        llm.replace_last_reply(turn.reply)
+                    if turn.heard is not None:
+                        llm.handle_interrupt(turn.heard)
+                except Exception as e:
+                    logger.error(f"LLM failover: could not bring {name} up to date: {e}")
+            self._caught_up.notify_all()
+
+    def replace_last_reply(self, reply: str) -> None:
+        with self._lock:
+            turn = self._turn
+            if turn is not None:
+                turn.reply = reply
+                turn.replaced = True
+            for name, llm in self.backends.items():
+                # a backend that still has the turn queued gets the new reply with it
+                if turn is None or turn not in self._unsettled[name]:
+                    llm.replace_last_reply(reply)
+
+    def add_turn(self, prompt: str, reply: str) -> None:
+        turn = _Turn(prompt, reply)
+        turn.done = True
+        with self._lock:
+            self._turn = turn
+            for unsettled in self._unsettled.values():
+                unsettled.append(turn)
+        for name in self.order:
+            self._settle(name)
+
+    def handle_interrupt(self, heard_response: str) -> None:
+        with self._lock:
+            turn = self._turn
+        if turn is not None:
+            for stream in turn.streams.values():
+                stream.cancel()
+            winner_stream = turn.streams.get(turn.winner)
+            if winner_stream is not None:
+                winner_stream.thread.join(1)
+        with self._lock:
+            if turn is not None:
+                turn.heard = heard_response
+                turn.done = True
+            for name, llm in self.backends.items():
+                # a backend that still has the turn queued is told when it is given the turn
+                if turn is None or turn not in self._unsettled[name]:
+                    llm.handle_interrupt(heard_response)
+        for name in self.order:
+            self._settle(name)
+
+    def health_check(self) -> bool:
+        return any(llm.health_check() for llm in self.backends.values())
+
+    def _ensure_prober(self) -> None:
+        with self._prober_lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe, name="llm-health-probe", daemon=True)
+                self._prober.start()
+
+    def _probe(self) -> None:
+        """Check the health of skipped backends until none is skipped any more."""
+        while True:
+            time.sleep(self.probe_interval_s)
+            with self._prober_lock:
+                open_breakers = [
+                    breaker for breaker in self.breakers.values()
+                    if breaker.state == CircuitBreaker.OPEN
+                ]
+                if not open_breakers:
+                    self._prober = None
+                    return
+            for breaker in open_breakers:
+                try:
+                    healthy = self.backends[breaker.name].health_check()
+                except Exception:
+                    healthy = False
+                metrics.incr(f"llm.failover.{breaker.name}.probes_{'ok' if healthy else 'failed'}")
+                if healthy:
+                    breaker.half_open()
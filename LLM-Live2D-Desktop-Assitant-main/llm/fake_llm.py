@@ -1,15 +1,22 @@
+import re
 from typing import Iterator
-import json
 
 from .llm_interface import LLMInterface
+from .journal import ConversationJournal
 
 class LLM(LLMInterface):
 
-    def __init__(self):
+    def __init__(self, journal: ConversationJournal = None):
         """
         Initializes an instance of the `FakeLLM` class.
+
+        Parameters:
+        - journal (ConversationJournal, optional): Records the conversation. Defaults to None.
         """
         self.memory = []
+        self.journal = journal
+        if journal:
+            self.memory.extend(journal.messages)
         self.sentence_count = 1
         self.response_list = [
             """Hello [smirk]! This is fake_llm. This is sentence 1. [joy]""",
@@ -51,6 +58,7 @@ class LLM(LLMInterface):
                 "content": prompt,
             }
         )
+        self.record_memory()
 
         if len(self.response_list) > 0:
             response = self.response_list.pop(0)
@@ -59,12 +67,12 @@ class LLM(LLMInterface):
             self.sentence_count += 1
 
 
-        # A generator to yield the response one character at a time
+        # A generator to yield the response a word at a time, like a streaming LLM
         def _generate_response():
             complete_response = ""
-            for char in response:
-                yield char
-                complete_response += char
+            for match in re.finditer(r"\s*\S+", response):
+                yield match.group()
+                complete_response += match.group()
             
             # Store the complete response in memory
             self.memory.append(
@@ -74,15 +82,31 @@ class LLM(LLMInterface):
                 }
             )
 
-            # Serialize the memory to a file
-            self.serialize_memory(self.memory, 'mem.json')
+            self.record_memory()
 
         return _generate_response()
 
+    def add_turn(self, prompt: str, reply: str) -> None:
+        self.memory.append({"role": "user", "content": prompt})
+        self.record_memory()
+        self.memory.append({"role": "assistant", "content": reply})
+        self.record_memory()
+
+    def replace_last_reply(self, reply: str) -> None:
+        if self.memory and self.memory[-1]["role"] == "assistant":
+            self.memory[-1]["content"] = reply
+            if self.journal:
+                self.journal.update_last(self.memory[-1])
+        else:
+            self.memory.append({"role": "assistant", "content": reply})
+            self.record_memory()
+
     def handle_interrupt(self, heard_response: str) -> None:
         print(">>>> LLM believe heard response is: ", heard_response)
         if self.memory[-1]["role"] == "assistant":
             self.memory[-1]["content"] = heard_response + "..."
+            if self.journal:
+                self.journal.update_last(self.memory[-1])
         else:
             if heard_response:
                 self.memory.append(
@@ -91,20 +115,18 @@ class LLM(LLMInterface):
                         "content": heard_response + "...",
                     }
                 )
+                self.record_memory()
         self.memory.append(
             {
                 "role": "system",
                 "content": "[Interrupted by user]",
             }
         )
+        self.record_memory()
 
-    def serialize_memory(self, memory, filename):
+    def record_memory(self):
         """
-        Serialize the memory to a file.
-
-        Parameters:
-        - memory (list): The list of memory to be serialized.
-        - filename (str): The name of the file to which memory should be serialized.
+        Record the newest message in the journal (written in the background).
         """
-        with open(filename, 'w') as file:
-            json.dump(memory, file)
+        if self.journal:
+            self.journal.append(self.memory[-1])
@@ -0,0 +1,257 @@
+"""Description: Append-only conversation journal, one JSONL file per session.
+
+Every change to the conversation history is one line in the journal:
+`{"op": "append", "message": {...}}` adds a message and `{"op": "update", "message": {...}}`
+replaces the last one (used when a reply is cut short by an interrupt). Lines are written
+by a background thread, so recording a message never blocks token delivery. Once the
+journal holds `compact_every` lines for replaced messages it is compacted into plain
+`append` lines.
+
+The journal is off unless `CONVERSATION_JOURNAL` is set. Journals are kept in `JOURNAL_DIR`,
+outside `./cache` (which is deleted on exit), and a session is named after the LLM provider
+and persona unless `SESSION_ID` is set, so the conversation continues after a restart.
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from loguru import logger
+
+FSYNC_POLICIES = ("never", "interval", "always")
+JOURNAL_DIR = "conversations"
+
+# seconds without writes after which the writer thread stops (it restarts on the next write)
+IDLE_TIMEOUT = 30
+
+_CLOSE = object()
+_journals = weakref.WeakSet()
+
+
+class ConversationJournal:
+
+    def __init__(
+        self,
+        session_id: str | None = None,
+        directory: str = JOURNAL_DIR,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        compact_every: int = 200,
+    ) -> None:
+        """
+        Opens (and replays) the journal of one session.
+
+        Parameters:
+        - session_id (str, optional): Name of the session. Reusing a session id continues that
+            conversation after a restart. Defaults to a new, unique id.
+        - directory (str, optional): Where the journals are kept. Defaults to `JOURNAL_DIR`.
+        - fsync (str, optional): "never" leaves flushing to disk to the OS, "interval" syncs at most
+            every `fsync_interval` seconds and "always" syncs after every write. Defaults to "interval".
+        - fsync_interval (float, optional): Seconds between syncs for the "interval" policy.
+        - compact_every (int, optional): Compact once this many lines are outdated. Defaults to 200.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+
+        if session_id and any(
+            journal.session_id == session_id and not journal._closed
+            for journal in list(_journals)
+        ):
+            # two live sessions must never write to the same file
+            logger.warning(f"Journal session '{session_id}' is already open, starting a new one")
+            session_id = None
+        self.session_id = session_id or (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        )
+        self.path = Path(directory) / f"{self.session_id}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+
+        # the writer's view of the history, as serialized messages
+        self._state: list[str] = []
+        self._lines = 0
+        self.messages = self._replay()
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread: threading.Thread | None = None
+        self._writer_lock = threading.Lock()
+        _journals.add(self)
+
+    def _replay(self) -> list[dict]:
+        """Read the journal back into a list of messages."""
+        if not self.path.exists():
+            return []
+        messages = []
+        good_bytes = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise json.JSONDecodeError("unterminated line", "", 0)
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # a line torn by a crash can only be the last one, cut it off so
+                    # new lines are not appended to it
+                    logger.warning(f"Journal {self.path}: dropping a torn last line")
+                    break
+                good_bytes += len(line)
+                if record["op"] == "append":
+                    messages.append(record["message"])
+                elif record["op"] == "update" and messages:
+                    messages[-1] = record["message"]
+                self._lines += 1
+        if good_bytes < self.path.stat().st_size:
+            os.truncate(self.path, good_bytes)
+        self._state = [json.dumps(message, ensure_ascii=False) for message in messages]
+        logger.info(f"Replayed {len(messages)} messages from {self.path}")
+        return messages
+
+    def append(self, message: dict) -> None:
+        """Record a message added to the end of the history."""
+        self._record("append", message)
+
+    def update_last(self, message: dict) -> None:
+        """Record that the last message of the history was replaced by `message`."""
+        self._record("update", message)
+
+    def _record(self, op: str, message: dict) -> None:
+        if self._closed:
+            return
+        # serialize now, the caller may keep changing the message afterwards
+        self._queue.put((op, json.dumps(message, ensure_ascii=False)))
+        with self._writer_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"journal-{self.session_id}", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        file = open(self.path, "a", encoding="utf-8")
+        last_sync = time.monotonic()
+        dirty = False
+        try:
+            while True:
+                try:
+                    # wake up to sync pending writes, or to stop after a while without any
+                    timeout = self.fsync_interval if dirty and self.fsync == "interval" else IDLE_TIMEOUT
+                    batch = [self._queue.get(timeout=timeout)]
+                except queue.Empty:
+                    if dirty:
+                        os.fsync(file.fileno())
+                        last_sync = time.monotonic()
+                        dirty = False
+                        continue
+                    with self._writer_lock:
+                        if self._queue.empty():
+                            self._thread = None
+                            break
+                    continue
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                closing = False
+                for item in batch:
+                    if item is _CLOSE:
+                        closing = True
+                        continue
+                    op, message = item
+                    file.write(f'{{"op": "{op}", "message": {message}}}\n')
+                    if op == "append":
+                        self._state.append(message)
+                    elif self._state:
+                        self._state[-1] = message
+                    self._lines += 1
+                file.flush()
+                dirty = True
+
+                now = time.monotonic()
+                if self.fsync == "always" or closing or (
+                    self.fsync == "interval" and now - last_sync >= self.fsync_interval
+                ):
+                    os.fsync(file.fileno())
+                    last_sync = now
+                    dirty = False
+
+                # lines that no longer describe the history (replaced messages)
+                redundant = self._lines - len(self._state)
+                if redundant >= self.compact_every or (closing and redundant):
+                    file = self._compact(file)
+                if closing:
+                    break
+        except Exception as e:
+            logger.error(f"Journal {self.path}: writer stopped: {e}")
+            with self._writer_lock:
+                self._thread = None
+        finally:
+            file.close()
+
+    def _compact(self, file):
+        """Rewrite the journal as one `append` line per message and return the new handle."""
+        tmp_path = self.path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for message in self._state:
+                tmp.write(f'{{"op": "append", "message": {message}}}\n')
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        # the open handle has to be closed first on Windows
+        file.close()
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Journal {self.path}: compacted {self._lines} lines to {len(self._state)}")
+        self._lines = len(self._state)
+        return open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        """Write out everything that is queued and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        with self._writer_lock:
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(_CLOSE)
+        if thread is not None:
+            thread.join(timeout=5)
+
+    @classmethod
+    def from_config(
+        cls, config: dict | bool | None, default_session_id: str | None = None
+    ) -> "ConversationJournal | None":
+        """
+        Build a journal from the `CONVERSATION_JOURNAL` section of conf.yaml.
+        The journal is off without the section (or with `false`), `true` turns it on with the defaults.
+
+        Parameters:
+        - config (dict | bool, optional): The `CONVERSATION_JOURNAL` section.
+        - default_session_id (str, optional): The session id when `SESSION_ID` is not set. Defaults to None (a new id).
+        """
+        if not config:
+            return None
+        config = config if isinstance(config, dict) else {}
+        session_id = config.get("SESSION_ID") or default_session_id
+        return cls(
+            # the session id is the file name
+            session_id=re.sub(r"[^\w.-]+", "_", session_id) if session_id else None,
+            directory=config.get("DIR", JOURNAL_DIR),
+            fsync=config.get("FSYNC", "interval"),
+            fsync_interval=config.get("FSYNC_INTERVAL", 1.0),
+            compact_every=config.get("COMPACT_EVERY", 200),
+        )
+
+
+@atexit.register
+def _close_journals() -> None:
+    for journal in list(_journals):
+        journal.close()
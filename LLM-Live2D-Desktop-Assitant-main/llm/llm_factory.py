@@ -1,9 +1,5 @@
 from typing import Type
 from .llm_interface import LLMInterface
-from .ollama import LLM as OllamaLLM
-from .memGPT import LLM as MemGPTLLM
-from .fake_llm import LLM as FakeLLM
-from .claude import LLM as ClaudeLLM
 
 
 class LLMFactory:
@@ -11,8 +7,10 @@ class LLMFactory:
     def create_llm(llm_provider, **kwargs) -> Type[LLMInterface]:
         # Make provider name case-insensitive
         llm_provider = llm_provider.lower() if llm_provider else ""
-        
+
+        # each backend is imported only when it is used, they pull in their client libraries
         if llm_provider == "ollama":
+            from llm.ollama import LLM as OllamaLLM
             return OllamaLLM(
                 system=kwargs.get("SYSTEM_PROMPT"),
                 tools=kwargs.get("tools"),
@@ -30,7 +28,12 @@ class LLMFactory:
                 v_project_id=kwargs.get("V_PROJECT_ID"),
                 vllm_api_key=kwargs.get("VLLM_API_KEY"),
                 clipboard_history=kwargs.get("CLIPBOARD_HISTORY", False),
-                max_history_cnt=kwargs.get("MAX_HISTORY_CNT", -1),                
+                native_tools=kwargs.get("NATIVE_TOOLS", True),
+                max_history_cnt=kwargs.get("MAX_HISTORY_CNT", -1),
+                max_context_tokens=kwargs.get("MAX_CONTEXT_TOKENS"),
+                context_evict_tokens=kwargs.get("CONTEXT_EVICT_TOKENS", 1024),
+                summarize_context=kwargs.get("SUMMARIZE_CONTEXT", True),
+                journal=kwargs.get("JOURNAL"),
             )
         elif llm_provider == "mem0":
             from llm.mem0_llm import LLM as Mem0LLM
@@ -43,9 +46,19 @@ class LLMFactory:
                 project_id=kwargs.get("PROJECT_ID"),
                 organization_id=kwargs.get("ORGANIZATION_ID"),
                 mem0_config=kwargs.get("MEM0_CONFIG"),
-                verbose=kwargs.get("VERBOSE", False)
+                verbose=kwargs.get("VERBOSE", False),
+                max_history_cnt=kwargs.get("MAX_HISTORY_CNT", -1),
+                max_context_tokens=kwargs.get("MAX_CONTEXT_TOKENS"),
+                context_evict_tokens=kwargs.get("CONTEXT_EVICT_TOKENS", 1024),
+                summarize_context=kwargs.get("SUMMARIZE_CONTEXT", True),
+                journal=kwargs.get("JOURNAL"),
+                memory_budget_ms=kwargs.get("MEMORY_BUDGET_MS", 250),
+                embedding_cache_size=kwargs.get("EMBEDDING_CACHE_SIZE", 256),
+                ingest_batch_size=kwargs.get("INGEST_BATCH_SIZE", 4),
+                ingest_delay_s=kwargs.get("INGEST_DELAY_S", 5.0),
             )
         elif llm_provider == "memgpt":
+            from llm.memGPT import LLM as MemGPTLLM
             return MemGPTLLM(
                 base_url=kwargs.get("BASE_URL"),
                 server_admin_token=kwargs.get("ADMIN_TOKEN"),
@@ -53,15 +66,47 @@ class LLMFactory:
                 verbose=kwargs.get("VERBOSE", False),
             )
         elif llm_provider == "claude":
+            from llm.claude import LLM as ClaudeLLM
             return ClaudeLLM(
                 system=kwargs.get("SYSTEM_PROMPT"),
                 base_url=kwargs.get("BASE_URL"),
                 model=kwargs.get("MODEL"),
                 llm_api_key=kwargs.get("LLM_API_KEY"),
                 verbose=kwargs.get("VERBOSE", False),
+                stream=kwargs.get("STREAM", False),
+                stream_url=kwargs.get("STREAM_URL"),
+                prompt_caching=kwargs.get("PROMPT_CACHING", True),
+                max_history_cnt=kwargs.get("MAX_HISTORY_CNT", -1),
+                max_context_tokens=kwargs.get("MAX_CONTEXT_TOKENS"),
+                context_evict_tokens=kwargs.get("CONTEXT_EVICT_TOKENS", 1024),
+                summarize_context=kwargs.get("SUMMARIZE_CONTEXT", True),
             )
         elif llm_provider == "fakellm":
-            return FakeLLM()
+            from llm.fake_llm import LLM as FakeLLM
+            return FakeLLM(journal=kwargs.get("JOURNAL"))
+        elif llm_provider == "failover":
+            from llm.failover_llm import FailoverLLM
+            shared = {
+                "SYSTEM_PROMPT": kwargs.get("SYSTEM_PROMPT"),
+                "tools": kwargs.get("tools"),
+                "caller": kwargs.get("caller"),
+            }
+            primary, secondary = kwargs.get("PRIMARY"), kwargs.get("SECONDARY")
+            return FailoverLLM(
+                # only the primary keeps the journal, the secondary is kept in sync with it
+                primary=LLMFactory.create_llm(
+                    primary, JOURNAL=kwargs.get("JOURNAL"), **shared, **(kwargs.get("PRIMARY_CONFIG") or {})
+                ),
+                secondary=LLMFactory.create_llm(
+                    secondary, **shared, **(kwargs.get("SECONDARY_CONFIG") or {})
+                ),
+                primary_name=primary.lower(),
+                secondary_name=secondary.lower(),
+                first_token_timeout_s=kwargs.get("FIRST_TOKEN_TIMEOUT_S", 2.0),
+                failure_threshold=kwargs.get("FAILURE_THRESHOLD", 3),
+                reset_timeout_s=kwargs.get("RESET_TIMEOUT_S", 30.0),
+                probe_interval_s=kwargs.get("PROBE_INTERVAL_S", 10.0),
+            )
         else:
             raise ValueError(f"Unsupported LLM provider: {llm_provider}")
 
@@ -18,6 +18,51 @@ class LLMInterface(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
+    def prefetch(self, query: str) -> None:
+        """
+        Called as soon as the user's message is known, before the prompt is put together and `chat_iter` is called.
+        Backends that look things up for a prompt (e.g. memories) can start doing so here. Does nothing by default.
+
+        Parameters:
+        - query (str): The user's message.
+        """
+        pass
+
+    def add_turn(self, prompt: str, reply: str) -> None:
+        """
+        Record an exchange that was answered without calling the LLM (e.g. from the response cache),
+        so later turns still see it in the conversation history. Does nothing by default.
+
+        Parameters:
+        - prompt (str): The message the user sent.
+        - reply (str): The reply the user got.
+        """
+        pass
+
+    def replace_last_reply(self, reply: str) -> None:
+        """
+        Make `reply` the answer to the last prompt in the conversation history, replacing what this LLM
+        answered (if anything). Used when another LLM answered the prompt instead. Does nothing by default.
+
+        Parameters:
+        - reply (str): The reply the user got.
+        """
+        pass
+
+    def cancel(self) -> None:
+        """
+        Called from another thread to stop the reply that is being generated, e.g. by closing its request,
+        so a reply that is still waiting for its first token stops right away. The iterator returned by
+        `chat_iter` may then end early or raise. Does nothing by default.
+        """
+        pass
+
+    def health_check(self) -> bool:
+        """
+        Whether the LLM is reachable. Used to decide when to try a failed LLM again. Defaults to `True`.
+        """
+        return True
+
     def handle_interrupt(self, heard_response: str) -> None:
         """
         This function will be called when the LLM is interrupted by the user.
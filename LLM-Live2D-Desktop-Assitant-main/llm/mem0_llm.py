@@ -3,12 +3,53 @@ This class is responsible for handling the interaction with the OpenAI API for l
 Compatible with all of the OpenAI Compatible endpoints, including Ollama, OpenAI, and more.
 """
 
+import atexit
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from typing import Iterator
 from mem0 import Memory
 from openai import OpenAI
 from loguru import logger
+from utils.metrics import metrics
 from .llm_interface import LLMInterface
-import json
+from .context_window import ContextWindow
+from .journal import ConversationJournal
+from .prompt_assembly import INTERRUPT_NOTE, TailNotes, with_context
+
+_llms = weakref.WeakSet()
+
+
+class EmbeddingCache:
+    """
+    LRU cache in front of a mem0 embedder's `embed`, so a query that was already embedded
+    (a prefetch followed by the real search, a repeated question) is not embedded again.
+    """
+
+    def __init__(self, embed, size: int = 256) -> None:
+        self._embed = embed
+        self.size = size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, text, *args, **kwargs):
+        # some embedders embed differently for "add" and "search", keep them apart
+        key = (text, args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                metrics.incr("llm.mem0.embedding_cache_hits")
+                return self._cache[key]
+        metrics.incr("llm.mem0.embedding_cache_misses")
+        vector = self._embed(text, *args, **kwargs)
+        with self._lock:
+            self._cache[key] = vector
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return vector
 
 
 class LLM(LLMInterface):
@@ -24,6 +65,15 @@ class LLM(LLMInterface):
         project_id: str = "z",
         llm_api_key: str = "z",
         verbose: bool = False,
+        max_history_cnt: int = -1,
+        max_context_tokens: int = None,
+        context_evict_tokens: int = 1024,
+        summarize_context: bool = True,
+        journal: ConversationJournal = None,
+        memory_budget_ms: int = 250,
+        embedding_cache_size: int = 256,
+        ingest_batch_size: int = 4,
+        ingest_delay_s: float = 5.0,
     ):
         """
         Initializes an instance of the `ollama` class.
@@ -36,6 +86,17 @@ class LLM(LLMInterface):
         - project_id (str, optional): The project ID for the OpenAI API. Defaults to an empty string.
         - llm_api_key (str, optional): The API key for the OpenAI API. Defaults to an empty string.
         - verbose (bool, optional): Whether to enable verbose mode. Defaults to `False`.
+        - max_history_cnt (int, optional): Keep at most this many messages in the context. Defaults to -1 (no limit).
+        - max_context_tokens (int, optional): Token budget of the conversation history. Defaults to None (no budget).
+        - context_evict_tokens (int, optional): Evict at least this many tokens at once. Defaults to 1024.
+        - summarize_context (bool, optional): Fold evicted turns into a rolling summary. Defaults to `True`.
+        - journal (ConversationJournal, optional): Records the conversation and restores it on start. Defaults to None.
+        - memory_budget_ms (int, optional): How long the request waits for the memory search before it goes
+            ahead without memories. -1 always waits. Defaults to 250.
+        - embedding_cache_size (int, optional): Number of embeddings kept in the LRU cache, 0 disables it. Defaults to 256.
+        - ingest_batch_size (int, optional): Store at most this many turns in mem0 at once. Defaults to 4.
+        - ingest_delay_s (float, optional): How long finished turns wait for more turns to batch with
+            before they are stored. Defaults to 5.0.
         """
 
         self.base_url = base_url
@@ -44,7 +105,6 @@ class LLM(LLMInterface):
         self.mem0_config = mem0_config
         self.user_id = user_id
 
-        self.conversation_memory = []
         self.verbose = verbose
         self.client = OpenAI(
             base_url=base_url,
@@ -54,67 +114,107 @@ class LLM(LLMInterface):
         )
 
         self.system = system
-        self.conversation_memory = [
-            {
-                "role": "system",
-                "content": system,
-            }
-        ]
+        self.context = ContextWindow(
+            max_tokens=max_context_tokens,
+            evict_tokens=context_evict_tokens,
+            max_history_cnt=max_history_cnt,
+            summarizer=self._complete if summarize_context else None,
+        )
+        # the conversation history, without the system prompt
+        self.conversation_memory = self.context.history
+        self.journal = journal
+        if journal:
+            self.conversation_memory.extend(journal.messages)
+        self.tail_notes = TailNotes()
 
         logger.debug("Initializing Memory...")
         # Initialize Memory with the configuration
         self.mem0 = Memory.from_config(self.mem0_config)
         logger.debug("Memory Initialized...")
 
-        # Add a memory
-        # self.mem0.add("I'm visiting Paris", user_id="john")
-
-    def chat_iter(self, prompt: str, image_base64 = None) -> Iterator[str]:
+        embedding_model = getattr(self.mem0, "embedding_model", None)
+        if embedding_model is not None and embedding_cache_size > 0:
+            embedding_model.embed = EmbeddingCache(embedding_model.embed, embedding_cache_size)
 
-        logger.debug("All Mem:")
-        logger.debug(self.mem0.get_all(user_id=self.user_id))
+        self.memory_budget_ms = memory_budget_ms
+        # two workers, so a slow search does not hold up the next one
+        self._search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="mem0-search")
+        self._prefetched: tuple[str, Future] | None = None
+        self._prefetch_lock = threading.Lock()
 
-        # Get relevant memory
-
-        relevant_memories_list = self.mem0.search(
-            query=prompt, limit=10, user_id=self.user_id
-        )
-        relevant_memories = ""
-        if relevant_memories_list:
-            relevant_memories = "\n".join(
-                mem["memory"] for mem in relevant_memories_list
-            )
+        self.ingest_batch_size = max(1, ingest_batch_size)
+        self.ingest_delay_s = ingest_delay_s
+        self._ingest_queue = queue.Queue()
+        self._ingest_thread: threading.Thread | None = None
+        self._ingest_lock = threading.Lock()
+        _llms.add(self)
 
+    def prefetch(self, query: str) -> None:
+        """
+        Start searching the memories for `query` in the background, so the results are
+        ready (or close to it) by the time `chat_iter` is called with the same text.
+        """
+        if not query or not query.strip():
+            return
+        future = self._search_executor.submit(self._search, query)
+        with self._prefetch_lock:
+            self._prefetched = (query, future)
+
+    def _search(self, query: str) -> str:
+        with metrics.timer("llm.mem0.retrieval_s"):
+            results = self.mem0.search(query=query, limit=10, user_id=self.user_id)
+        # newer mem0 versions wrap the list in {"results": [...]}
+        if isinstance(results, dict):
+            results = results.get("results", [])
+        return "\n".join(mem["memory"] for mem in results or [])
+
+    def _start_search(self, prompt: str) -> Future:
+        """The prefetched search if it was for this prompt, otherwise a new one."""
+        with self._prefetch_lock:
+            prefetched, self._prefetched = self._prefetched, None
+        # the prompt may have clipboard text appended to the transcript
+        if prefetched and prompt.startswith(prefetched[0]):
+            metrics.incr("llm.mem0.prefetch_hits")
+            return prefetched[1]
+        return self._search_executor.submit(self._search, prompt)
+
+    def _await_memories(self, search: Future, deadline: float | None) -> str:
+        """The search result, or "" if it is not ready by `deadline` (or failed)."""
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            relevant_memories = search.result(timeout=timeout)
+        except FutureTimeout:
+            metrics.incr("llm.mem0.retrieval_timeouts")
+            logger.debug("Memory search over its latency budget, continuing without memories...")
+            return ""
+        except Exception as e:
+            logger.warning(f"Memory search failed: {e}")
+            return ""
         if relevant_memories:
             logger.debug("Relevant memories found...")
-            self.conversation_memory[0] = {
-                "role": "system",
-                "content": f"""{self.system}
-                
-                ## Relevant Memories
-                Here are something you recall from the past:
-                ===== Some relevant memories =====
-                {relevant_memories}
-                ===== end of relevant memories =====
-                
-                """,
-            }
         else:
             logger.debug("No relevant memories found...")
-            self.conversation_memory[0] = {
-                "role": "system",
-                "content": f"""{self.system}""",
-            }
+        return relevant_memories
 
-        logger.debug("System:")
-        logger.debug(self.conversation_memory[0])
+    def chat_iter(self, prompt: str, image_base64 = None) -> Iterator[str]:
+
+        # the search runs while the request is put together
+        deadline = (
+            time.perf_counter() + self.memory_budget_ms / 1000
+            if self.memory_budget_ms >= 0
+            else None
+        )
+        search = self._start_search(prompt)
 
+        prompt = self.tail_notes.attach(prompt)
         self.conversation_memory.append(
             {
                 "role": "user",
                 "content": prompt,
             }
         )
+        if self.journal:
+            self.journal.append(self.conversation_memory[-1])
 
         this_conversation_mem = [
             {
@@ -125,10 +225,24 @@ class LLM(LLMInterface):
 
         chat_completion = []
         try:
+            messages = self.context.build(self.system)
+            relevant_memories = self._await_memories(search, deadline)
+            # the memories change every turn, so they only go with the newest message
+            # and the system prompt and history stay cacheable
+            messages[-1] = {
+                "role": "user",
+                "content": with_context(
+                    prompt,
+                    "Relevant Memories",
+                    f"Here are something you recall from the past:\n{relevant_memories}"
+                    if relevant_memories
+                    else "",
+                ),
+            }
             logger.debug("Calling the chat endpoint with...")
-            logger.debug(self.conversation_memory)
+            logger.debug(messages)
             chat_completion = self.client.chat.completions.create(
-                messages=self.conversation_memory,
+                messages=messages,
                 model=self.model,
                 stream=True,
             )
@@ -153,6 +267,8 @@ class LLM(LLMInterface):
                     "content": complete_response,
                 }
             )
+            if self.journal:
+                self.journal.append(self.conversation_memory[-1])
 
             this_conversation_mem.append(
                 {
@@ -161,26 +277,111 @@ class LLM(LLMInterface):
                 }
             )
 
-            # Add the conversation to the memory
-            logger.debug(self.mem0.add(this_conversation_mem, user_id=self.user_id))
-
-            logger.debug(f"Mem0 Added... {this_conversation_mem}")
-
-            logger.debug("All Mem:")
-            logger.debug(self.mem0.get_all(user_id=self.user_id))
-
-            def serialize_memory(memory, filename):
-                with open(filename, "w") as file:
-                    json.dump(memory, file)
-
-            serialize_memory(self.conversation_memory, "mem.json")
+            # storing the turn runs an LLM call to extract facts, keep it off the reply path
+            self._enqueue_ingest(this_conversation_mem)
             return
 
         return _generate_and_store_response()
 
+    def _enqueue_ingest(self, messages: list[dict]) -> None:
+        self._ingest_queue.put(messages)
+        with self._ingest_lock:
+            if self._ingest_thread is None:
+                self._ingest_thread = threading.Thread(
+                    target=self._ingest_worker, name="mem0-ingest", daemon=True
+                )
+                self._ingest_thread.start()
+
+    def _ingest_worker(self) -> None:
+        while True:
+            try:
+                batch = [self._ingest_queue.get(timeout=30)]
+            except queue.Empty:
+                with self._ingest_lock:
+                    if self._ingest_queue.empty():
+                        self._ingest_thread = None
+                        return
+                continue
+            # wait a little for the next turns, one `add` for several turns is cheaper
+            deadline = time.monotonic() + self.ingest_delay_s
+            while len(batch) < self.ingest_batch_size and not isinstance(batch[-1], threading.Event):
+                try:
+                    batch.append(
+                        self._ingest_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    )
+                except queue.Empty:
+                    break
+            turns = [turn for turn in batch if not isinstance(turn, threading.Event)]
+            if turns:
+                self._ingest(turns)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _ingest(self, batch: list[list[dict]]) -> None:
+        messages = [message for turn in batch for message in turn]
+        try:
+            with metrics.timer("llm.mem0.ingest_s"):
+                self.mem0.add(messages, user_id=self.user_id)
+            metrics.incr("llm.mem0.ingested_turns", len(batch))
+            logger.debug(f"Mem0 added {len(batch)} turns")
+        except Exception as e:
+            logger.error(f"Storing {len(batch)} turns in mem0 failed: {e}")
+
+    def flush(self, timeout: float = 30) -> None:
+        """Store the turns that are waiting in the ingestion queue without further delay."""
+        with self._ingest_lock:
+            running = self._ingest_thread is not None
+            if running:
+                done = threading.Event()
+                self._ingest_queue.put(done)
+        if running:
+            done.wait(timeout)
+
+    def _complete(self, system: str, prompt: str) -> str:
+        """
+        A blocking, non-streaming completion, used to summarize evicted turns.
+        """
+        completion = self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            model=self.model,
+        )
+        return completion.choices[0].message.content or ""
+
+    def add_turn(self, prompt: str, reply: str) -> None:
+        for message in (
+            {"role": "user", "content": self.tail_notes.attach(prompt)},
+            {"role": "assistant", "content": reply},
+        ):
+            self.conversation_memory.append(message)
+            if self.journal:
+                self.journal.append(message)
+
+    def replace_last_reply(self, reply: str) -> None:
+        if self.conversation_memory and self.conversation_memory[-1]["role"] == "assistant":
+            self.conversation_memory[-1]["content"] = reply
+            if self.journal:
+                self.journal.update_last(self.conversation_memory[-1])
+        else:
+            self.conversation_memory.append({"role": "assistant", "content": reply})
+            if self.journal:
+                self.journal.append(self.conversation_memory[-1])
+
+    def health_check(self) -> bool:
+        try:
+            self.client.with_options(timeout=5).models.list()
+            return True
+        except Exception:
+            return False
+
     def handle_interrupt(self, heard_response: str) -> None:
-        if self.conversation_memory[-1]["role"] == "assistant":
+        if self.conversation_memory and self.conversation_memory[-1]["role"] == "assistant":
             self.conversation_memory[-1]["content"] = heard_response + "..."
+            if self.journal:
+                self.journal.update_last(self.conversation_memory[-1])
         else:
             if heard_response:
                 self.conversation_memory.append(
@@ -189,12 +390,10 @@ class LLM(LLMInterface):
                         "content": heard_response + "...",
                     }
                 )
-        self.conversation_memory.append(
-            {
-                "role": "system",
-                "content": "[Interrupted by user]",
-            }
-        )
+                if self.journal:
+                    self.journal.append(self.conversation_memory[-1])
+        # sent with the next prompt, the history itself stays append-only
+        self.tail_notes.add(INTERRUPT_NOTE)
 
 
 def test():
@@ -248,5 +447,11 @@ def test():
                 print(chunk, end="")
 
 
+@atexit.register
+def _flush_memories() -> None:
+    for llm in list(_llms):
+        llm.flush()
+
+
 if __name__ == "__main__":
     test()
@@ -1,7 +1,11 @@
 from typing import Iterator
 import json
+import socket
+import threading
+import time
 import requests
 from rich.console import Console
+from utils.metrics import metrics
 from .llm_interface import LLMInterface
 
 console = Console()
@@ -31,31 +35,58 @@ class LLM(LLMInterface):
             "authorization": f"Bearer {self.token}",
         }
         self.verbose = verbose
+        # keep the connection to the server alive between turns
+        self.session = requests.Session()
+        # the reply being streamed, so an interrupt can drop it
+        self._response = None
+        self._response_lock = threading.Lock()
 
     def chat_iter(self, prompt, image_base64 = None) -> Iterator[str]:
-        full_response = self._send_message_to_agent(prompt, callback_function=print)
         # memGPT will handle the memory, so no need to deal with it here
-        return full_response
+        return self._send_message_to_agent(prompt)
 
     def handle_interrupt(self, heard_response: str) -> None:
+        self._abort_stream()
         print(
             "\n>> (MemGPT doesn't know you interrupted it for now. I don't know how to tell it about the interruption.) \n"
         )
 
-    def _send_message_to_agent(self, message, callback_function=print):
+    def cancel(self) -> None:
+        self._abort_stream()
+
+    def _abort_stream(self) -> None:
         """
-        Sends a message to the specified agent, invokes the callback with the assistant's full message if given, and return the assistant's full response. The response will NOT be streamed back word by word.
+        Drop the reply that is being streamed, if any.
 
-        Utilizes Server-Sent Events (SSE) for streaming assistant_messages back to the client. If verbose mode is enabled, messages of other types will be printed out. The callback is exclusively for assistant messages.
+        Closing a response only takes effect at its next read, so the socket is shut down
+        first: that also ends a read that is waiting for the agent.
+        """
+        with self._response_lock:
+            response, self._response = self._response, None
+        if response is None:
+            return
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        response.close()
+
+    def _send_message_to_agent(self, message) -> Iterator[str]:
+        """
+        Sends a message to the specified agent and yields the assistant's message as it is streamed back.
+
+        Utilizes Server-Sent Events (SSE) for streaming assistant_messages back to the client. If verbose mode is enabled, messages of other types will be printed out.
 
         This function uses REST API endpoint to avoid installing the memGPT python package, because it currently has a dependency conflict with fastapi.
 
         Parameters:
         - message (str): The message to send to the agent.
-        - callback_function (function): The function to call with the assistant's message. Defaults to print.
 
-        Returns:
-        - str: The assistant's full response.
+        Yields:
+        - str: The assistant_message deltas, as the events arrive.
         """
 
         url = f"{self.base_url}/api/agents/{self.agent_id}/messages"
@@ -66,33 +97,53 @@ class LLM(LLMInterface):
             "stream": True,
             "role": "user",
         }
-        response = requests.post(
-            url, headers=self.headers, data=json.dumps(data), stream=True, timeout=30
+        start = time.perf_counter()
+        first_token_at = None
+        response = self.session.post(
+            url,
+            headers=self.headers,
+            json=data,
+            stream=True,
+            timeout=(10, 60),  # connect, and max gap between events
         )
 
         if response.status_code != 200:
+            response.close()
             raise ValueError(f"Failed to send message: {response.text}")
 
-        result = ""
-
-        for line in response.iter_lines():
-            if line:
-                decoded_line = line.decode("utf-8").strip()
+        with self._response_lock:
+            self._response = response
+        try:
+            # chunk_size=None hands over data as it arrives instead of filling 512-byte blocks
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if not line:
+                    continue
+                decoded_line = line.strip()
                 if decoded_line.startswith("data:"):
                     decoded_line = decoded_line[len("data:") :].strip()
-                if decoded_line:
-                    try:
-                        json_line = json.loads(decoded_line)
-                        if self.verbose:
-                            console.print(json_line)
-                        if "assistant_message" in json_line:
-                            result += json_line["assistant_message"]
-                            if callable(callback_function):
-                                callback_function(json_line["assistant_message"])
-
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON: {e} for line: {decoded_line}")
-                else:
-                    print("Received an empty line or non-JSON data.")
-
-        return result
+                if not decoded_line or decoded_line.startswith("["):
+                    # "[DONE]", "[DONE_STEP]", ... markers between the steps of the agent
+                    continue
+                try:
+                    json_line = json.loads(decoded_line)
+                except json.JSONDecodeError as e:
+                    print(f"Error decoding JSON: {e} for line: {decoded_line}")
+                    continue
+                if self.verbose:
+                    console.print(json_line)
+                if json_line.get("assistant_message"):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        metrics.observe("llm.memgpt.ttft_s", first_token_at - start)
+                    yield json_line["assistant_message"]
+            metrics.observe("llm.memgpt.latency_s", time.perf_counter() - start)
+        except (requests.RequestException, AttributeError, OSError):
+            # the stream was dropped by an interrupt
+            if response is self._response:
+                raise
+        finally:
+            # also runs when the consumer stops early, which drops the stream
+            with self._response_lock:
+                if self._response is response:
+                    self._response = None
+            response.close()
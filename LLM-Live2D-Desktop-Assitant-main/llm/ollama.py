@@ -6,10 +6,14 @@ OpenAI, and more.
 """
 
 from typing import Iterator
-import json
 from openai import OpenAI
 from zhipuai import ZhipuAI
 from .llm_interface import LLMInterface
+from .context_window import ContextWindow
+from .journal import ConversationJournal
+from .prompt_assembly import INTERRUPT_NOTE, TailNotes, record_cache_usage, tool_call_note
+from .tool_calls import ToolCallAssembler
+from utils.image_preprocessor import image_mime_type
 
 
 class LLM(LLMInterface):
@@ -33,7 +37,12 @@ class LLM(LLMInterface):
         vllm_api_key: str = "z",
         verbose: bool = False,
         clipboard_history: bool = None,
-        max_history_cnt: int = -1
+        max_history_cnt: int = -1,
+        max_context_tokens: int = None,
+        context_evict_tokens: int = 1024,
+        summarize_context: bool = True,
+        journal: ConversationJournal = None,
+        native_tools: bool = True,
     ):
         """
         Initializes an instance of the `ollama` class.
@@ -47,6 +56,12 @@ class LLM(LLMInterface):
         - project_id (str, optional): The project ID for the OpenAI API. Defaults to an empty string.
         - llm_api_key (str, optional): The API key for the OpenAI API. Defaults to an empty string.
         - verbose (bool, optional): Whether to enable verbose mode. Defaults to `False`.
+        - max_history_cnt (int, optional): Keep at most this many messages in the context. Defaults to -1 (no limit).
+        - max_context_tokens (int, optional): Token budget of the conversation history. Defaults to None (no budget).
+        - context_evict_tokens (int, optional): Evict at least this many tokens at once. Defaults to 1024.
+        - summarize_context (bool, optional): Fold evicted turns into a rolling summary. Defaults to `True`.
+        - journal (ConversationJournal, optional): Records the conversation and restores it on start. Defaults to None.
+        - native_tools (bool, optional): Send `tools` with the requests and yield the calls as `ToolCall`s. Defaults to `True`.
         """
 
         self.base_url = base_url
@@ -54,7 +69,22 @@ class LLM(LLMInterface):
         self.v_model = v_model
         self.system = system
         self.callback = callback
-        self.memory = []
+        # function definitions for native tool calls (not sent with vision requests)
+        self.tools = tools if native_tools and tools else None
+        self.context = ContextWindow(
+            max_tokens=max_context_tokens,
+            evict_tokens=context_evict_tokens,
+            max_history_cnt=max_history_cnt,
+            summarizer=self._complete if summarize_context else None,
+        )
+        # the conversation history, without the system prompt
+        self.memory = self.context.history
+        self.journal = journal
+        if journal:
+            self.memory.extend(journal.messages)
+        self.tail_notes = TailNotes()
+        # the reply being streamed, so it can be cancelled
+        self._stream = None
         self.verbose = verbose
         try:
             if "glm" in model:
@@ -103,13 +133,22 @@ class LLM(LLMInterface):
         system: str
             the system prompt
         """
-        self.system = system
-        self.memory.append(
-            {
-                "role": "system",
-                "content": system,
-            }
+        # part of the stable prefix, instead of being appended to every prompt
+        self.system = f"{system}\nPlease reply in English."
+
+    def _complete(self, system: str, prompt: str) -> str:
+        """
+        A blocking, non-streaming completion, used to summarize evicted turns.
+        """
+        completion = self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+            model=self.model,
+            max_tokens=512,
         )
+        return completion.choices[0].message.content or ""
 
     def __print_memory(self):
         """
@@ -126,7 +165,7 @@ class LLM(LLMInterface):
         print(" -- System: " + self.system)
 
     def chat_iter(self, prompt: str, image_base64 = None) -> Iterator[str]:
-        prompt += "\nPlease reply in English."
+        prompt = self.tail_notes.attach(prompt)
         clipboard_flag = False
         vision_flag = False
 
@@ -154,7 +193,7 @@ class LLM(LLMInterface):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": image_base64 if "glm" in self.v_model else f"data:image/jpeg;base64,{image_base64}"
+                                "url": image_base64 if "glm" in self.v_model else f"data:{image_mime_type(image_base64)};base64,{image_base64}"
                             }
                         }
                     ]
@@ -178,29 +217,75 @@ class LLM(LLMInterface):
 
         chat_completion = []
         try:
-            chat_completion = client_to_use.chat.completions.create(
-                messages=self.memory,
-                model=model_to_use,
-                stream=True,
-                max_tokens=512,
-            )
+            extra_args = {}
+            if isinstance(client_to_use, OpenAI):
+                # the last chunk reports the prompt tokens (and cached tokens, where supported)
+                extra_args["stream_options"] = {"include_usage": True}
+            if self.tools and not vision_flag:
+                extra_args["tools"] = self.tools
+            try:
+                chat_completion = client_to_use.chat.completions.create(
+                    messages=self.context.build(self.system),
+                    model=model_to_use,
+                    stream=True,
+                    max_tokens=512,
+                    **extra_args,
+                )
+            except Exception as e:
+                if "tools" not in extra_args:
+                    raise
+                # not every model (or endpoint) supports function calling
+                print(f"The chat endpoint refused the tools, continuing without them (set NATIVE_TOOLS: false): {e}")
+                self.tools = None
+                del extra_args["tools"]
+                chat_completion = client_to_use.chat.completions.create(
+                    messages=self.context.build(self.system),
+                    model=model_to_use,
+                    stream=True,
+                    max_tokens=512,
+                    **extra_args,
+                )
         except Exception as e:
             print("Error calling the chat endpoint: " + str(e))
             self.__printDebugInfo()
             return "Error calling the chat endpoint: " + str(e)
         
+        self._stream = chat_completion
+
         if not self.clipboard_history and clipboard_flag:
             self.memory.pop()
+        elif self.journal:
+            self.journal.append(self.memory[-1])
 
         # a generator to give back an iterator to the response that will store
         # the complete response in memory once the iteration is done
         def _generate_and_store_response():
             complete_response = ""
+            tool_calls = ToolCallAssembler()
             for chunk in chat_completion:
-                if chunk.choices[0].delta.content is None:
-                    chunk.choices[0].delta.content = ""
-                yield chunk.choices[0].delta.content
-                complete_response += chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    record_cache_usage(
+                        "ollama",
+                        input_tokens=chunk.usage.prompt_tokens,
+                        cached_tokens=getattr(details, "cached_tokens", None),
+                    )
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if getattr(delta, "tool_calls", None):
+                    tool_calls.add(delta.tool_calls)
+                if delta.content:
+                    yield delta.content
+                    complete_response += delta.content
+                if chunk.choices[0].finish_reason:
+                    for tool_call in tool_calls.finish():
+                        # the history has no tool messages, the model learns about the call with the next prompt
+                        self.tail_notes.add(tool_call_note(tool_call))
+                        yield tool_call
+            for tool_call in tool_calls.finish():
+                self.tail_notes.add(tool_call_note(tool_call))
+                yield tool_call
 
             if self.clipboard_history or not clipboard_flag:
                 self.memory.append(
@@ -209,19 +294,50 @@ class LLM(LLMInterface):
                         "content": complete_response,
                     }
                 )
-
-            def serialize_memory(memory, filename):
-                with open(filename, "w") as file:
-                    json.dump(memory, file)
-
-            serialize_memory(self.memory, "mem.json")
+                if self.journal:
+                    self.journal.append(self.memory[-1])
             return
 
         return _generate_and_store_response()
 
+    def add_turn(self, prompt: str, reply: str) -> None:
+        for message in (
+            {"role": "user", "content": self.tail_notes.attach(prompt)},
+            {"role": "assistant", "content": reply},
+        ):
+            self.memory.append(message)
+            if self.journal:
+                self.journal.append(message)
+
+    def replace_last_reply(self, reply: str) -> None:
+        if self.memory and self.memory[-1]["role"] == "assistant":
+            self.memory[-1]["content"] = reply
+            if self.journal:
+                self.journal.update_last(self.memory[-1])
+        else:
+            self.memory.append({"role": "assistant", "content": reply})
+            if self.journal:
+                self.journal.append(self.memory[-1])
+
+    def cancel(self) -> None:
+        stream, self._stream = self._stream, None
+        close = getattr(stream, "close", None)
+        if close is not None:
+            # closes the HTTP response, the stream then ends at its next read
+            close()
+
+    def health_check(self) -> bool:
+        try:
+            self.client.with_options(timeout=5).models.list()
+            return True
+        except Exception:
+            return False
+
     def handle_interrupt(self, heard_response: str) -> None:
-        if self.memory[-1]["role"] == "assistant":
+        if self.memory and self.memory[-1]["role"] == "assistant":
             self.memory[-1]["content"] = heard_response + "..."
+            if self.journal:
+                self.journal.update_last(self.memory[-1])
         else:
             if heard_response:
                 self.memory.append(
@@ -230,12 +346,10 @@ class LLM(LLMInterface):
                         "content": heard_response + "...",
                     }
                 )
-        self.memory.append(
-            {
-                "role": "system",
-                "content": "[Interrupted by user]",
-            }
-        )
+                if self.journal:
+                    self.journal.append(self.memory[-1])
+        # sent with the next prompt, the history itself stays append-only
+        self.tail_notes.add(INTERRUPT_NOTE)
 
 
 def test():
@@ -0,0 +1,110 @@
+"""Description: Prompt assembly that keeps the prompt prefix byte-stable.
+
+Ollama / llama.cpp reuse their KV cache, and Anthropic models their prompt cache, only for
+the exact prefix they have already processed. The backends therefore build the system prompt
+(persona, tools, song list) once, only ever append to the history, and put everything that
+changes from turn to turn (retrieved memories, interrupt notes) into the newest user message.
+"""
+
+import json
+import threading
+
+from utils.metrics import metrics
+
+INTERRUPT_NOTE = "[Interrupted by user]"
+
+
+def tool_call_note(tool_call) -> str:
+    """The note that tells the model, with the next prompt, which tool it called."""
+    return f"[You called {tool_call.name} with {json.dumps(tool_call.arguments, ensure_ascii=False)}]"
+
+# Anthropic prompt caching: everything up to a block marked like this is cached
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class TailNotes:
+    """
+    Notes for the model that come up between turns (e.g. an interrupt) and are sent at
+    the start of the next user message instead of being inserted into the history.
+    """
+
+    def __init__(self) -> None:
+        self._notes: list[str] = []
+        self._lock = threading.Lock()
+
+    def add(self, note: str) -> None:
+        with self._lock:
+            self._notes.append(note)
+
+    def attach(self, prompt: str) -> str:
+        """Return `prompt` with the pending notes in front of it, and clear them."""
+        with self._lock:
+            notes, self._notes = self._notes, []
+        if not notes:
+            return prompt
+        return "\n".join(notes) + "\n" + prompt
+
+
+def with_context(prompt: str, title: str, context: str) -> str:
+    """Append a section of per-turn context (e.g. retrieved memories) to a user prompt."""
+    if not context:
+        return prompt
+    return f"{prompt}\n\n## {title}\n{context}"
+
+
+def anthropic_system(stable: str, dynamic: str = "") -> list[dict]:
+    """
+    System prompt blocks for Claude, with a cache breakpoint after the stable part.
+
+    Parameters:
+    - stable (str): The part that never changes within a session (persona, tools, songs).
+    - dynamic (str, optional): The part that changes now and then (conversation summary).
+    """
+    blocks = [{"type": "text", "text": stable, "cache_control": CACHE_CONTROL}]
+    if dynamic:
+        blocks.append({"type": "text", "text": dynamic})
+    return blocks
+
+
+def anthropic_messages(messages: list[dict]) -> list[dict]:
+    """
+    Copy of `messages` with a cache breakpoint on the newest one, so the next turn can
+    read the whole conversation so far from the cache.
+    """
+    if not messages:
+        return []
+    messages = list(messages)
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = [dict(block) for block in content]
+    content[-1]["cache_control"] = CACHE_CONTROL
+    messages[-1] = {**last, "content": content}
+    return messages
+
+
+def record_cache_usage(
+    provider: str,
+    input_tokens: int | None = None,
+    cached_tokens: int | None = None,
+    cache_write_tokens: int | None = None,
+) -> None:
+    """
+    Record the prompt cache usage a backend reported for one request.
+
+    Parameters:
+    - provider (str): Name of the backend, used in the metric names.
+    - input_tokens (int, optional): Prompt tokens that were processed.
+    - cached_tokens (int, optional): Prompt tokens read from the cache.
+    - cache_write_tokens (int, optional): Prompt tokens written to the cache.
+    """
+    if input_tokens is None and cached_tokens is None:
+        return
+    metrics.incr(f"llm.{provider}.cache_hits" if cached_tokens else f"llm.{provider}.cache_misses")
+    if input_tokens is not None:
+        metrics.observe(f"llm.{provider}.input_tokens", input_tokens)
+    if cached_tokens is not None:
+        metrics.observe(f"llm.{provider}.cached_tokens", cached_tokens)
+    if cache_write_tokens is not None:
+        metrics.observe(f"llm.{provider}.cache_write_tokens", cache_write_tokens)
@@ -0,0 +1,230 @@
+"""Description: Opt-in cache of complete LLM replies, for personas that answer the same
+questions over and over (e.g. `service_assistant`).
+
+`CachedLLM` wraps any `LLMInterface`. Replies are keyed by persona, model, the normalized
+last few turns and the normalized user message, and kept in a process-wide TTL + LRU
+store. A hit is streamed back in word-sized chunks without delay (TTS, not the stream,
+sets the pace of the reply), so it goes through the normal sentence / TTS pipeline, and the wrapped backend is told about the turn so its
+history stays complete. Prompts with an image, or with anything added to the user's
+message (clipboard text), always go to the LLM.
+"""
+
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Iterator
+from loguru import logger
+
+from utils.metrics import metrics
+from .llm_interface import LLMInterface
+from .tool_calls import ToolCall
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_WORD_CHUNK = re.compile(r"\s*\S+\s*")
+# backends report failures as reply text, those must not be cached
+_ERROR_PREFIXES = ("Error", "HTTP error")
+
+
+def normalize(text: str) -> str:
+    """Case, width, punctuation and whitespace insensitive form of `text`."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class ResponseCache:
+    """A thread-safe store of replies with a time-to-live and an LRU size bound."""
+
+    def __init__(self, ttl_s: float = 3600, max_entries: int = 512) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, reply = entry
+            if time.monotonic() - stored_at > self.ttl_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return reply
+
+    def put(self, key: str, reply: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_shared_cache: ResponseCache | None = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache(ttl_s: float = 3600, max_entries: int = 512) -> ResponseCache:
+    """The process-wide cache, shared by all sessions. Created on first use."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(ttl_s=ttl_s, max_entries=max_entries)
+        return _shared_cache
+
+
+class CachedLLM(LLMInterface):
+
+    def __init__(
+        self,
+        llm: LLMInterface,
+        cache: ResponseCache,
+        persona: str,
+        model: str = "",
+        context_turns: int = 1,
+    ) -> None:
+        """
+        Parameters:
+        - llm (LLMInterface): The backend that answers on a miss.
+        - cache (ResponseCache): Where replies are kept.
+        - persona (str): Name of the persona, part of the key.
+        - model (str, optional): Name of the model, part of the key.
+        - context_turns (int, optional): Number of previous exchanges that are part of the key. Defaults to 1.
+        """
+        self.llm = llm
+        self.cache = cache
+        self.persona = persona
+        self.model = model or ""
+        # normalized (user, reply) pairs, as the user saw them
+        self.context_turns = max(0, context_turns)
+        self._recent: deque[list[str]] = deque(maxlen=max(1, self.context_turns))
+        self._query: str | None = None
+
+    def prefetch(self, query: str) -> None:
+        self._query = query
+        self.llm.prefetch(query)
+
+    def _key(self, prompt: str) -> str:
+        context = list(self._recent)[-self.context_turns:] if self.context_turns else []
+        material = "\x1f".join(
+            [self.persona, self.model]
+            + [part for turn in context for part in turn]
+            + [normalize(prompt)]
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _cacheable(self, prompt: str, image_base64) -> bool:
+        if image_base64 is not None:
+            return False
+        # the conversation manager announces the bare user message; a longer prompt has
+        # clipboard text (or something else that changes each time) appended
+        return self._query is None or prompt == self._query
+
+    def chat_iter(self, prompt: str, image_base64=None) -> Iterator[str]:
+        cacheable = self._cacheable(prompt, image_base64)
+        self._query = None
+        if not cacheable:
+            metrics.incr("llm.response_cache.bypass")
+            return self._track(prompt, None, self.llm.chat_iter(prompt, image_base64))
+
+        key = self._key(prompt)
+        reply = self.cache.get(key)
+        if reply is not None:
+            metrics.incr("llm.response_cache.hits")
+            logger.debug(f"Response cache hit for persona '{self.persona}'")
+            self.llm.add_turn(prompt, reply)
+            self._remember(prompt, reply)
+            return self._replay(reply)
+
+        metrics.incr("llm.response_cache.misses")
+        return self._track(prompt, key, self.llm.chat_iter(prompt, image_base64))
+
+    @staticmethod
+    def _replay(reply: str) -> Iterator[str]:
+        for match in _WORD_CHUNK.finditer(reply):
+            yield match.group()
+
+    def _track(self, prompt: str, key: str | None, chat_completion) -> Iterator[str]:
+        """Pass the reply through, and cache it under `key` once it is complete."""
+        # a plain string is how the OpenAI compatible backends report a failed request
+        failed = isinstance(chat_completion, str)
+        turn = self._remember(prompt, "")
+        reply = ""
+        for chunk in chat_completion:
+            if isinstance(chunk, ToolCall):
+                # the call would not be made again on a hit
+                key = None
+                yield chunk
+                continue
+            reply += chunk
+            turn[1] = normalize(reply)
+            yield chunk
+        # only reached if the reply was not interrupted
+        if key and not failed and reply.strip() and not reply.startswith(_ERROR_PREFIXES):
+            self.cache.put(key, reply)
+
+    def _remember(self, prompt: str, reply: str) -> list[str]:
+        turn = [normalize(prompt), normalize(reply)]
+        self._recent.append(turn)
+        return turn
+
+    def add_turn(self, prompt: str, reply: str) -> None:
+        self._remember(prompt, reply)
+        self.llm.add_turn(prompt, reply)
+
+    def replace_last_reply(self, reply: str) -> None:
+        if self._recent:
+            self._recent[-1][1] = normalize(reply)
+        self.llm.replace_last_reply(reply)
+
+    def handle_interrupt(self, heard_response: str) -> None:
+        if self._recent:
+            self._recent[-1][1] = normalize(heard_response)
+        self.llm.handle_interrupt(heard_response)
+
+    def cancel(self) -> None:
+        self.llm.cancel()
+
+    def health_check(self) -> bool:
+        return self.llm.health_check()
+
+    def __getattr__(self, name):
+        # anything else (journal, context, ...) is the wrapped backend's; the methods of
+        # LLMInterface are found on this class and have to be forwarded above
+        return getattr(self.llm, name)
+
+    @classmethod
+    def from_config(
+        cls, llm: LLMInterface, config: dict | None, persona: str | None, model: str | None = None
+    ) -> LLMInterface:
+        """
+        Wrap `llm` according to the `RESPONSE_CACHE` section of conf.yaml, if the persona
+        is on its allowlist. Otherwise `llm` is returned as is.
+        """
+        if not config or not config.get("ENABLED", True) or not persona:
+            return llm
+        if persona not in (config.get("PERSONAS") or []):
+            return llm
+        cache = get_shared_cache(
+            ttl_s=config.get("TTL_S", 3600), max_entries=config.get("MAX_ENTRIES", 512)
+        )
+        logger.info(f"Response cache enabled for persona '{persona}'")
+        return cls(
+            llm,
+            cache,
+            persona=persona,
+            model=model or "",
+            context_turns=config.get("CONTEXT_TURNS", 1),
+        )
@@ -0,0 +1,86 @@
+"""Description: Tool calls, as they come out of `chat_iter`.
+
+Backends with native function calling yield a `ToolCall` among the text chunks of a reply,
+once the call is complete. It is not text: consumers run it instead of speaking it.
+The OpenAI compatible streaming API sends a call in pieces (`delta.tool_calls`, the
+arguments as a JSON string cut anywhere); `ToolCallAssembler` puts them back together.
+"""
+
+import json
+from dataclasses import dataclass, field
+
+from loguru import logger
+
+
+@dataclass
+class ToolCall:
+    """A complete call of one of the tools the LLM was given."""
+
+    name: str
+    arguments: dict = field(default_factory=dict)
+    id: str | None = None
+
+    @classmethod
+    def from_text(cls, text: str) -> "ToolCall | None":
+        """
+        Parse a call written into the reply as JSON, by a backend without native tool calls.
+
+        Understands the format asked for in `prompts/utils/tools_prompt.txt`
+        (`{"sing_song": "song name"}`) and the `{"name": ..., "arguments": {...}}` form some
+        models fall back to. Returns None for anything else.
+        """
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        if "sing_song" in data:
+            return cls("sing_song", {"song_name": data["sing_song"]})
+        if isinstance(data.get("name"), str) and isinstance(data.get("arguments"), dict):
+            return cls(data["name"], data["arguments"])
+        return None
+
+
+class ToolCallAssembler:
+    """Collects the `tool_calls` deltas of a streamed reply."""
+
+    def __init__(self) -> None:
+        # index -> [id, name, argument pieces]
+        self._calls: dict[int, list] = {}
+
+    def add(self, deltas) -> None:
+        """Add the `delta.tool_calls` of one chunk."""
+        for delta in deltas:
+            index = getattr(delta, "index", None)
+            if index is None:
+                index = len(self._calls)
+            call = self._calls.setdefault(index, [None, "", []])
+            if getattr(delta, "id", None):
+                call[0] = delta.id
+            function = getattr(delta, "function", None)
+            if function is None:
+                continue
+            if function.name:
+                call[1] += function.name
+            if function.arguments:
+                call[2].append(function.arguments)
+
+    def finish(self) -> list[ToolCall]:
+        """Return the complete calls, in order, and start over."""
+        calls, self._calls = self._calls, {}
+        tool_calls = []
+        for index in sorted(calls):
+            call_id, name, pieces = calls[index]
+            if not name:
+                continue
+            text = "".join(pieces)
+            try:
+                arguments = json.loads(text) if text.strip() else {}
+            except json.JSONDecodeError:
+                logger.warning(f"Tool call {name} has invalid arguments: {text}")
+                arguments = {}
+            if not isinstance(arguments, dict):
+                arguments = {}
+            tool_calls.append(ToolCall(name, arguments, call_id))
+        return tool_calls
@@ -1,6 +1,5 @@
 import os
 import sys
-import re
 import random
 import shutil
 import atexit
@@ -10,8 +9,6 @@ import uuid
 from typing import Callable, Iterator, Optional
 from loguru import logger
 import numpy as np
-import yaml
-import chardet
 
 import __init__
 from asr.asr_factory import ASRFactory
@@ -19,12 +16,15 @@ from asr.asr_interface import ASRInterface
 from live2d_model import Live2dModel
 from llm.llm_factory import LLMFactory
 from llm.llm_interface import LLMInterface
-from prompts import prompt_loader
+from module.sentence_splitter import SentenceSplitter
+from prompts.prompt_catalog import prompt_catalog
 from tts.tts_factory import TTSFactory
 from tts.tts_interface import TTSInterface
 from translate.translate_interface import TranslateInterface
 from translate.translate_factory import TranslateFactory
-from utils.audio_preprocessor import audio_filter
+from utils.config_loader import load_config_with_env
+from utils.console_sink import ConsoleSink, NullSink
+from utils.text_normalizer import TextNormalizer
 
 
 class OpenLLMVTuberMain:
@@ -53,6 +53,10 @@ class OpenLLMVTuberMain:
         self.config: dict = configs
         self.verbose = self.config.get("VERBOSE", False)
         self.live2d: Live2dModel | None = self.init_live2d()
+        # every sentence TTS speaks is cleaned up by it
+        self.text_normalizer = TextNormalizer.from_config(self.config, self.live2d)
+        # echo of the LLM output on the console
+        self.echo = ConsoleSink() if self.config.get("ECHO_LLM_OUTPUT", True) else NullSink()
         self._continue_exec_flag = threading.Event()
         self._continue_exec_flag.set()  # Set the flag to continue execution
         self.session_id: str = str(uuid.uuid4().hex)
@@ -172,17 +176,12 @@ class OpenLLMVTuberMain:
         """
         Construct and return the system prompt based on the configuration file.
         """
-        if self.config.get("PERSONA_CHOICE"):
-            system_prompt = prompt_loader.load_persona(
-                self.config.get("PERSONA_CHOICE")
-            )
-        else:
-            system_prompt = self.config.get("DEFAULT_PERSONA_PROMPT_IN_YAML")
-
-        if self.live2d is not None:
-            system_prompt += prompt_loader.load_util(
-                self.config.get("LIVE2D_Expression_Prompt")
-            ).replace("[<insert_emomap_keys>]", self.live2d.emo_str)
+        system_prompt = prompt_catalog.system_prompt(
+            persona_choice=self.config.get("PERSONA_CHOICE"),
+            default_prompt=self.config.get("DEFAULT_PERSONA_PROMPT_IN_YAML"),
+            expression_prompt=self.config.get("LIVE2D_Expression_Prompt"),
+            emo_str=self.live2d.emo_str if self.live2d is not None else None,
+        )
 
         if self.verbose:
             print("\n === System Prompt ===")
@@ -245,15 +244,16 @@ class OpenLLMVTuberMain:
         chat_completion: Iterator[str] = self.llm.chat_iter(user_input)
 
         if not self.config.get("TTS_ON", False):
-            full_response = ""
-            for char in chat_completion:
+            response_parts = []
+            for chunk in chat_completion:
                 if not self._continue_exec_flag.is_set():
                     self._interrupt_post_processing()
                     print("\nInterrupted!")
                     return None
-                full_response += char
-                print(char, end="")
-            return full_response
+                response_parts.append(chunk)
+                self.echo.write(chunk)
+            self.echo.end_reply()
+            return "".join(response_parts)
 
         full_response = self.speak(chat_completion)
         if self.verbose:
@@ -293,15 +293,16 @@ class OpenLLMVTuberMain:
         if self.config.get("SAY_SENTENCE_SEPARATELY", True):
             full_response = self.speak_by_sentence_chain(chat_completion)
         else:  # say the full response at once? how stupid
-            full_response = ""
-            for char in chat_completion:
+            response_parts = []
+            for chunk in chat_completion:
                 if not self._continue_exec_flag.is_set():
                     print("\nInterrupted!")
                     self._interrupt_post_processing()
                     return None
-                print(char, end="")
-                full_response += char
-            print("\n")
+                self.echo.write(chunk)
+                response_parts.append(chunk)
+            self.echo.end_reply()
+            full_response = "".join(response_parts)
             filename = self._generate_audio_file(full_response, "temp")
 
             if self._continue_exec_flag.is_set():
@@ -331,8 +332,7 @@ class OpenLLMVTuberMain:
         if not self.tts:
             return None
 
-        if self.live2d:
-            sentence = self.live2d.remove_emotion_keywords(sentence)
+        sentence = self.text_normalizer.normalize(sentence)
 
         if sentence.strip() == "":
             return None
@@ -415,69 +415,66 @@ class OpenLLMVTuberMain:
         Now properly handles interrupts in a multi-threaded environment using the existing _continue_exec_flag.
         """
         task_queue = queue.Queue()
-        full_response = [""]  # Use a list to store the full response
+        response_parts = []
         interrupted_error_event = threading.Event()
 
         def producer_worker():
+            sentence_buffer = ""
             try:
-                index = 0
-                sentence_buffer = ""
+                splitter = SentenceSplitter(
+                    min_chars=self.config.get("SENTENCE_MIN_CHARS", 3),
+                    max_chars=self.config.get("SENTENCE_MAX_CHARS", 200),
+                )
 
-                for char in chat_completion:
+                def produce(sentence: str) -> None:
                     if not self._continue_exec_flag.is_set():
                         raise InterruptedError("Producer interrupted")
-
-                    if char:
-                        print(char, end="", flush=True)
-                        sentence_buffer += char
-                        full_response[0] += char
-                        if self.is_complete_sentence(sentence_buffer):
-                            if self.verbose:
-                                print("\n")
-                            if not self._continue_exec_flag.is_set():
-                                raise InterruptedError("Producer interrupted")
-                            tts_target_sentence = sentence_buffer
-
-                            tts_target_sentence = audio_filter(
-                                tts_target_sentence,
-                                translator=(
-                                    self.translator
-                                    if self.config.get("TRANSLATE_AUDIO", False)
-                                    else None
-                                ),
-                                remove_special_char=self.config.get(
-                                    "REMOVE_SPECIAL_CHAR", True
-                                ),
-                            )
-
-                            audio_filepath = self._generate_audio_file(
-                                tts_target_sentence, file_name_no_ext=uuid.uuid4()
+                    # normalized by _generate_audio_file
+                    tts_target_sentence = sentence
+                    if self.translator and self.config.get("TRANSLATE_AUDIO", False):
+                        try:
+                            print("Translating...")
+                            tts_target_sentence = self.translator.translate(
+                                self.text_normalizer.strip_tags(sentence)
                             )
+                            print(f"Translated: {tts_target_sentence}")
+                        except Exception as e:
+                            print(f"Error translating: {e}")
+                            print(f"Text: {sentence}")
+                            print("Skipping...")
 
-                            if not self._continue_exec_flag.is_set():
-                                raise InterruptedError("Producer interrupted")
-                            audio_info = {
-                                "sentence": sentence_buffer,
-                                "audio_filepath": audio_filepath,
-                            }
-                            task_queue.put(audio_info)
-                            index += 1
-                            sentence_buffer = ""
+                    audio_filepath = self._generate_audio_file(
+                        tts_target_sentence, file_name_no_ext=uuid.uuid4()
+                    )
 
-                # Handle any remaining text in the buffer
-                if sentence_buffer:
                     if not self._continue_exec_flag.is_set():
                         raise InterruptedError("Producer interrupted")
-                    print("\n")
-                    audio_filepath = self._generate_audio_file(
-                        sentence_buffer, file_name_no_ext=uuid.uuid4()
-                    )
                     audio_info = {
-                        "sentence": sentence_buffer,
+                        "sentence": sentence,
                         "audio_filepath": audio_filepath,
                     }
                     task_queue.put(audio_info)
 
+                for chunk in chat_completion:
+                    if not self._continue_exec_flag.is_set():
+                        raise InterruptedError("Producer interrupted")
+
+                    if chunk:
+                        self.echo.write(chunk)
+                        response_parts.append(chunk)
+                        for sentence in splitter.feed(chunk):
+                            self.echo.end_sentence()
+                            if self.verbose:
+                                print("\n")
+                            sentence_buffer = sentence
+                            produce(sentence)
+
+                # Handle any remaining text in the buffer
+                self.echo.end_reply()
+                for sentence in splitter.flush():
+                    sentence_buffer = sentence
+                    produce(sentence)
+
             except InterruptedError:
                 print("\nProducer interrupted")
                 interrupted_error_event.set()
@@ -540,7 +537,7 @@ class OpenLLMVTuberMain:
             )
 
         print("\n\n --- Audio generation and playback completed ---")
-        return full_response[0]
+        return "".join(response_parts)
 
     def interrupt(self, heard_sentence: str = "") -> None:
         """Set the interrupt flag to stop the conversation chain.
@@ -562,60 +559,6 @@ class OpenLLMVTuberMain:
         if not self._continue_exec_flag.is_set():
             raise InterruptedError("Conversation chain interrupted: checked")
 
-    def is_complete_sentence(self, text: str):
-        """
-        Check if the text is a complete sentence.
-        text: str
-            the text to check
-        """
-
-        white_list = [
-            "...",
-            "Dr.",
-            "Mr.",
-            "Ms.",
-            "Mrs.",
-            "Jr.",
-            "Sr.",
-            "St.",
-            "Ave.",
-            "Rd.",
-            "Blvd.",
-            "Dept.",
-            "Univ.",
-            "Prof.",
-            "Ph.D.",
-            "M.D.",
-            "U.S.",
-            "U.K.",
-            "U.N.",
-            "E.U.",
-            "U.S.A.",
-            "U.K.",
-            "U.S.S.R.",
-            "U.A.E.",
-        ]
-
-        for item in white_list:
-            if text.strip().endswith(item):
-                return False
-
-        punctuation_blacklist = [
-            ".",
-            "?",
-            "!",
-            "。",
-            "；",
-            "？",
-            "！",
-            "…",
-            "〰",
-            "〜",
-            "～",
-            "！",
-        ]
-        return any(text.strip().endswith(punct) for punct in punctuation_blacklist)
-
     def clean_cache(self):
         cache_dir = "./cache"
         if os.path.exists(cache_dir):
@@ -629,14 +572,14 @@ class OpenLLMVTuberMain:
         Parameters:
         - config_file (str): The path to the alternative configuration file.
         """
-        with open(config_file, "r", encoding="utf-8") as file:
-            new_config = yaml.safe_load(file)
+        new_config = load_config_with_env(config_file)
 
         # Update the current configuration with the new settings
         self.config.update(new_config)
 
         # Reinitialize components with the new configuration
         self.live2d = self.init_live2d()
+        self.text_normalizer = TextNormalizer.from_config(self.config, self.live2d)
         self.asr = self.init_asr()
         self.tts = self.init_tts()
         self.translator = self.init_translator()
@@ -665,64 +608,6 @@ class OpenLLMVTuberMain:
             return None
 
 
-def load_config_with_env(path) -> dict:
-    """
-    Load the configuration file with environment variables.
-
-    Parameters:
-    - path (str): The path to the configuration file.
-
-    Returns:
-    - dict: The configuration dictionary.
-
-    Raises:
-    - FileNotFoundError if the configuration file is not found.
-    - yaml.YAMLError if the configuration file is not a valid YAML file.
-    """
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"Config file not found: {path}")
-
-    # Try common encodings first
-    encodings = ["utf-8", "utf-8-sig", "gbk", "gb2312", "ascii"]
-    content = None
-
-    for encoding in encodings:
-        try:
-            with open(path, "r", encoding=encoding) as file:
-                content = file.read()
-                break
-        except UnicodeDecodeError:
-            continue
-
-    if content is None:
-        # Try detecting encoding as last resort
-        try:
-            with open(path, "rb") as file:
-                raw_data = file.read()
-            detected = chardet.detect(raw_data)
-            if detected["encoding"]:
-                content = raw_data.decode(detected["encoding"])
-        except Exception as e:
-            logger.error(f"Error detecting encoding for config file {path}: {e}")
-            raise UnicodeError(f"Failed to decode config file {path} with any encoding")
-
-    # Match ${VAR_NAME}
-    pattern = re.compile(r"\$\{(\w+)\}")
-
-    # replace ${VAR_NAME} with os.getenv('VAR_NAME')
-    def replacer(match):
-        env_var = match.group(1)
-        return os.getenv(env_var, match.group(0))
-
-    content = pattern.sub(replacer, content)
-
-    try:
-        return yaml.safe_load(content)
-    except yaml.YAMLError as e:
-        logger.error(f"Error parsing YAML from {path}: {e}")
-        raise
-
-
 if __name__ == "__main__":
 
     logger.add(sys.stderr, level="DEBUG")
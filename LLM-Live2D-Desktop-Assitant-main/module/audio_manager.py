@@ -1,6 +1,7 @@
 import re
 import uuid
-import unicodedata
+
+from utils.text_normalizer import TextNormalizer
 
 class AudioManager:
     def __init__(self, tts, live2d, translator, config, verbose=False):
@@ -9,31 +10,11 @@ class AudioManager:
         self.translator = translator
         self.config = config
         self.verbose = verbose
-        self.remove_special_char = config.get("REMOVE_SPECIAL_CHAR", True)
-        
+        self.text_normalizer = TextNormalizer.from_config(config, live2d)
+
     def clean_text(self, text: str) -> str:
-        text = re.sub(r'[^\u4e00-\u9fffA-Za-z0-9,]', ' ', text)
-        
-        if self.remove_special_char:
-            text = self.remove_special_characters(text)
-            
-        return text
-        
-    def remove_special_characters(self, text: str) -> str:
-        """Filter text to remove all non-letter, non-number, and non-punctuation characters."""
-        normalized_text = unicodedata.normalize("NFKC", text)
-
-        def is_valid_char(char: str) -> bool:
-            category = unicodedata.category(char)
-            return (
-                category.startswith("L")
-                or category.startswith("N")
-                or category.startswith("P")
-                or char.isspace()
-            )
-
-        filtered_text = "".join(char for char in normalized_text if is_valid_char(char))
-        return filtered_text
+        """Remove the emotion tags and the characters TTS should not read, see `TextNormalizer`."""
+        return self.text_normalizer.normalize(text)
 
     def generate_audio_file(self, sentence: str, file_name_no_ext: str) -> str | None:
         """
@@ -53,9 +34,6 @@ class AudioManager:
         if not self.tts:
             return None
 
-        if self.live2d:
-            sentence = self.live2d.remove_emotion_keywords(sentence)
-
         if sentence.strip() == "":
             return None
 
@@ -94,12 +72,13 @@ class AudioManager:
             sentences = re.split(r'(?<=[.!?。！？])\s*', text)
             sentences = [s for s in sentences if s.strip()] 
 
-            for sentence in sentences:                
-                tts_target_sentence = self.live2d.remove_emotion_keywords(sentence)
+            for sentence in sentences:
+                # normalized by generate_audio_file
+                tts_target_sentence = sentence
 
                 if self.translator and self.config.get("TRANSLATE_AUDIO",   False):
                     print("Translating...")
-                    tts_target_sentence = self.translator.translate (tts_target_sentence)
+                    tts_target_sentence = self.translator.translate(self.text_normalizer.strip_tags(sentence))
                     print(f"Translated: {tts_target_sentence}")
 
                 audio_filepath = self.generate_audio_file(
@@ -13,9 +13,16 @@ from .computer_utils import get_clipboard_content, copy_selected_content, input_
 if platform.system() == 'Darwin':
     from .computer_utils import control_computer as utils_control_computer
 import re
+from utils.console_sink import ConsoleSink, NullSink
+from utils.image_preprocessor import ImagePreprocessor
+from .sentence_splitter import SentenceSplitter
+from llm.tool_calls import ToolCall
 
 class ConversationManager:
-    def __init__(self, config, llm, asr, tts, live2d, translator, audio_manager, interrupt_manager, claude_api_key = None, verbose=False, loop=None):
+    # the tools the LLM is offered, each one is run by the method of the same name
+    TOOLS = ("sing_song",)
+
+    def __init__(self, config, llm, asr, tts, live2d, translator, audio_manager, interrupt_manager, claude_api_key = None, verbose=False, loop=None, language_tracker=None):
         self.config = config
         self.llm = llm
         self.asr = asr
@@ -29,6 +36,11 @@ class ConversationManager:
         assert self.loop is not None, "loop is None"
         self.verbose = verbose
         self.heard_sentence = ""
+        self.language_tracker = language_tracker
+        # echo of the LLM output on the console
+        self.echo = ConsoleSink() if config.get("ECHO_LLM_OUTPUT", True) else NullSink()
+        # clipboard images are downscaled before they go to the vision model
+        self.image_preprocessor = ImagePreprocessor.from_config(config.get("VISION_IMAGE"))
         # self.functions = self.get_tool_functions()
         
     def get_prompt_and_image(self, user_input: str | np.ndarray | None = None, clipboard_data: dict | None = None) -> tuple[str, str | None]:
@@ -39,7 +51,7 @@ class ConversationManager:
                 user_input += f"\nThe text from my clipboard (between two delimiter):###\n{clipboard_data['text']}###\n"
             
             if "image" in clipboard_data:
-                image_base64 = clipboard_data["image"]
+                image_base64 = self.image_preprocessor.prepare(clipboard_data["image"])
                 
         return user_input, image_base64
         
@@ -66,28 +78,33 @@ class ConversationManager:
             user_input = self.get_user_input()
         elif isinstance(user_input, np.ndarray):
             print("transcribing...")
-            user_input = self.asr.transcribe_np(user_input)
+            user_input = self.transcribe(user_input)
 
         if user_input.strip().lower() == self.config.get("EXIT_PHRASE", "exit").lower():
             print("Exiting...")
             exit()
 
         print(f"User input: {user_input}")
+        self.llm.prefetch(user_input)
 
         prompt, image_base64 = self.get_prompt_and_image(user_input, clipboard_data)
         
         chat_completion: Iterator[str] = self.llm.chat_iter(prompt, image_base64)
 
         if not self.config.get("TTS_ON", False):
-            full_response = ""
-            for char in chat_completion:
+            response_parts = []
+            for chunk in chat_completion:
                 if self.interrupt_manager.in_interrupt():
                     self.interrupt_manager.interrupt_post_processing()
                     print("\nInterrupted!")
                     return None
-                full_response += char
-                print(char, end="")
-            return full_response
+                if isinstance(chunk, ToolCall):
+                    self.run_tool_call(chunk)
+                    continue
+                response_parts.append(chunk)
+                self.echo.write(chunk)
+            self.echo.end_reply()
+            return "".join(response_parts)
 
         full_response = self.speak(chat_completion, user_input)
         if self.verbose:
@@ -97,6 +114,11 @@ class ConversationManager:
         return full_response
 
 
+    def transcribe(self, audio: np.ndarray) -> str:
+        if self.language_tracker is None:
+            return self.asr.transcribe_np(audio)
+        return self.language_tracker.transcribe(self.asr, audio).text
+
     def get_user_input(self) -> str:
         if self.config.get("VOICE_INPUT_ON", False):
             print("Listening from the microphone...")
@@ -111,24 +133,28 @@ class ConversationManager:
                 chat_completion, user_input
             )
         else:
-            full_response = ""
-            for char in chat_completion:
+            response_parts = []
+            for chunk in chat_completion:
                 if self.interrupt_manager.in_interrupt():
                     print("\nInterrupted!")
                     self.interrupt_manager.interrupt_post_processing()
                     return None
-                print(char, end="")
-                full_response += char
-            print("\n")
-            
-            if self.live2d:
-                tts_target_sentence = self.live2d.remove_emotion_keywords(full_response[0])
-            else:
-                tts_target_sentence = full_response[0]
-                
+                if isinstance(chunk, ToolCall):
+                    self.run_tool_call(chunk)
+                    continue
+                self.echo.write(chunk)
+                response_parts.append(chunk)
+            self.echo.end_reply()
+            full_response = "".join(response_parts)
+
+            # normalized by generate_audio_file
+            tts_target_sentence = full_response
+
             if self.translator and self.config.get("TRANSLATE_AUDIO", False):
                 print("Translating...")
-                tts_target_sentence = self.translator.translate(tts_target_sentence)
+                tts_target_sentence = self.translator.translate(
+                    self.audio_manager.text_normalizer.strip_tags(full_response)
+                )
                 print(f"Translated: {tts_target_sentence}")
 
             filename = self.audio_manager.generate_audio_file(tts_target_sentence, "temp")
@@ -145,79 +171,62 @@ class ConversationManager:
         return full_response
 
     def speak_by_sentence_chain(self, chat_completion: Iterator[str], user_input: str) -> str:
-        full_response = [""]
+        response_parts = []
 
         sentence_queue = queue.Queue()
         audio_queue = queue.Queue()
         index = 0
+        translate = bool(self.translator and self.config.get("TRANSLATE_AUDIO", False))
 
         def producer_worker():
             nonlocal index
-            try:
-                sentence_buffer = ""
-                for char in chat_completion:
+            splitter = SentenceSplitter(
+                min_chars=self.config.get("SENTENCE_MIN_CHARS", 3),
+                max_chars=self.config.get("SENTENCE_MAX_CHARS", 200),
+            )
+
+            def dispatch(sentences: list[str]) -> bool:
+                """Queue the sentences for TTS (or run the tool calls). False if interrupted."""
+                nonlocal index
+                for sentence in sentences:
+                    if sentence.startswith('{"') and self.run_text_tool_call(sentence):
+                        # a tool call written as JSON by a backend without native tool calls
+                        continue
+                    self.echo.end_sentence()
+                    if self.verbose:
+                        print("\n")
                     if self.interrupt_manager.in_interrupt():
                         self.interrupt_manager.interrupt_post_processing()
                         print("Producer interrupted")
-                        return None
-                    
-                    if char:
-                        print(char, end="", flush=True)
-                        sentence_buffer += char
-                        full_response[0] += char
-                        check_result = self.check(sentence_buffer)
-                        if check_result == "sing-song":
-                            match = re.search(r'\{.*?\}', sentence_buffer)
-                            if match:
-                                self.sing_song(match.group(0))
-                                sentence_buffer = re.sub(r'\{.*?\}', '', sentence_buffer)
-                            else:
-                                print("Invalid JSON format in sing mode")
-                        # elif check_result == "computer-control":
-                        #     match = re.search(r'\{.*?\}', sentence_buffer)
-                        #     if match:
-                        #         future = asyncio.run_coroutine_threadsafe(
-                        #             self.control_computer(match.group(0)),
-                        #             self.loop
-                        #         )
-                        #         try:
-                        #             _ = future.result() 
-                        #         except Exception as e:
-                        #             print(f"Error running control_computer coroutine: {e}")
-                        #         sentence_buffer = re.sub(r'\{.*?\}', '', sentence_buffer)
-                        #     else:
-                        #         print("Invalid JSON format in computer control mode")
-                        # elif check_result == "input-text":
-                        #     match = re.search(r'\[text_input_start\](.*?)\[text_input_end\]', sentence_buffer, re.DOTALL)
-                        #     if match:
-                        #         text_to_input = match.group(1)
-                        #         self.input_text(text_to_input)
-                        #         sentence_buffer = ""
-                        #     else:
-                        #         match = re.search(r'\[text_input_start\](.*)', sentence_buffer, re.DOTALL)
-                        #         if match:
-                        #             text_to_input = match.group(1)
-                        #             self.input_text(text_to_input)
-                        #             sentence_buffer = "[text_input_start]"
-                        elif check_result:
-                            if self.verbose:
-                                print("\n")
-                            if self.interrupt_manager.in_interrupt():
-                                self.interrupt_manager.interrupt_post_processing()
-                                print("Producer interrupted")
-                                return None
-                            sentence_queue.put((index, sentence_buffer))
-                            index += 1
-                            sentence_buffer = ""
-
-                if sentence_buffer:
+                        return False
+                    translation = None
+                    if translate:
+                        # translated in the background, ready by the time TTS gets to it
+                        translation = self.translator.submit(
+                            self.audio_manager.text_normalizer.strip_tags(sentence)
+                        )
+                    sentence_queue.put((index, sentence, translation))
+                    index += 1
+                return True
+
+            try:
+                for chunk in chat_completion:
                     if self.interrupt_manager.in_interrupt():
                         self.interrupt_manager.interrupt_post_processing()
                         print("Producer interrupted")
                         return None
-                    print("\n")
-                    sentence_queue.put((index, sentence_buffer))
-                    index += 1
+
+                    if isinstance(chunk, ToolCall):
+                        self.run_tool_call(chunk)
+                    elif chunk:
+                        self.echo.write(chunk)
+                        response_parts.append(chunk)
+                        if not dispatch(splitter.feed(chunk)):
+                            return None
+
+                self.echo.end_reply()
+                if not dispatch(splitter.flush()):
+                    return None
 
             except Exception as e:
                 print(
@@ -226,7 +235,7 @@ class ConversationManager:
                 )
                 return
             finally:
-                sentence_queue.put((None, None))
+                sentence_queue.put((None, None, None))
 
         def tts_worker():
             try:
@@ -235,20 +244,17 @@ class ConversationManager:
                         self.interrupt_manager.interrupt_post_processing()
                         print("TTS worker interrupted")
                         return None
-                    idx, sentence = sentence_queue.get()
+                    idx, sentence, translation = sentence_queue.get()
                     if idx is None:
-                        sentence_queue.put((None, None))
+                        sentence_queue.put((None, None, None))
                         break
 
-                    if self.live2d:
-                        tts_target_sentence = self.live2d.remove_emotion_keywords(sentence)
-                    else:
-                        tts_target_sentence = sentence
+                    # normalized by generate_audio_file
+                    tts_target_sentence = sentence
 
-                    if self.translator and self.config.get("TRANSLATE_AUDIO", False):
+                    if translation is not None:
                         try:
-                            print("Translating...")
-                            tts_target_sentence = self.translator.translate(tts_target_sentence)
+                            tts_target_sentence = translation.result()
                             print(f"Translated: {tts_target_sentence}")
                         except Exception as e:
                             print(f"Error translating: {e}")
@@ -328,40 +334,29 @@ class ConversationManager:
         tts_thread.join()
         consumer_thread.join()
 
-        return full_response[0]
+        return "".join(response_parts)
     
 
-    def check(self, text: str):
-        """
-        Check if the text contains a tool call / is the end of a sentence.
-        """
-        if ("sing_song" in text and "}" in text): 
-            return "sing-song"
-        
-        # if ("computer_control" in text and "}" in text):
-        #     return "computer-control"
-        # if ("[text_input_start]" in text):
-        #     return False if text.count('[') >= 2 and text.count(']') < 2 else "input-text"
-
-        white_list = ["...", "Dr.", "Mr.", "Ms.", "Mrs.", "Jr.", "Sr.", "St.", "Ave.", "Rd.", 
-                     "Blvd.", "Dept.", "Univ.", "Prof.", "Ph.D.", "M.D.", "U.S.", "U.K.", 
-                     "U.N.", "E.U.", "U.S.A.", "U.K.", "U.S.S.R.", "U.A.E."]
-        
-        if any(text.strip().endswith(item) for item in white_list): 
+    def run_tool_call(self, tool_call: ToolCall) -> None:
+        """Run a tool the LLM called, with the arguments it gave."""
+        if tool_call.name not in self.TOOLS:
+            print(f"Function {tool_call.name} not found")
+            return
+        try:
+            getattr(self, tool_call.name)(**tool_call.arguments)
+        except TypeError as e:
+            print(f"Invalid arguments for {tool_call.name}: {tool_call.arguments} ({e})")
+
+    def run_text_tool_call(self, text: str) -> bool:
+        """Run a tool call the LLM wrote into its reply. False if the text is not one, it is spoken then."""
+        tool_call = ToolCall.from_text(text)
+        if tool_call is None:
             return False
+        self.run_tool_call(tool_call)
+        return True
 
-        punctuation_blacklist = [".", "?", "!", "。", "；", "？", "！", "…", "〰", "〜", "～", "！"]
-        return any(text.strip().endswith(punct) for punct in punctuation_blacklist)  # and not "sing_song" in text and not "computer_control" in text and not "input_text" in text
-
-    def sing_song(self, sentence):
+    def sing_song(self, song_name: str | None = None):
         print("sing mode activated")
-        try:
-            data = json.loads(sentence)
-            song_name = data.get("song_name")
-        except json.JSONDecodeError:
-            print("Invalid JSON format in response")
-            return
-
         if not song_name:
             self.audio_manager.play_text("This song, even I have yet to master.")
             return
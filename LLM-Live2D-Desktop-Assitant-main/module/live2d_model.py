@@ -1,5 +1,10 @@
+import functools
 import json
-import chardet
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
 from loguru import logger
 
 # This class will only prepare the payload for the live2d model
@@ -7,88 +12,138 @@ from loguru import logger
 # This class is **Not responsible** for sending the payload to the server
 
 
-class Live2dModel:
+@dataclass(frozen=True)
+class EmotionTags:
     """
-    A class to represent a Live2D model. This class only prepares and stores the information of the Live2D model. It does not send anything to the frontend or server or anything.
+    The emotion tags found in a piece of text.
 
     Attributes:
-        model_dict_path (str): The path to the model dictionary file.
-        live2d_model_name (str): The name of the Live2D model.
-        model_info (dict): The information of the Live2D model.
-        emo_map (dict): The emotion map of the Live2D model.
-        emo_str (str): The string representation of the emotion map of the Live2D model.
+        text (str): The text with the tags removed.
+        expressions (tuple): The values (expression indices) of the tags, in order.
+        spans (tuple): The (start, end) offsets of each tag in the original text.
     """
 
-    model_dict_path: str
-    live2d_model_name: str
-    model_info: dict
-    emo_map: dict
-    emo_str: str
+    text: str
+    expressions: tuple = ()
+    spans: tuple = ()
 
-    def __init__(
-        self, live2d_model_name: str, model_dict_path: str = "model_dict.json"
-    ):
 
-        self.model_dict_path: str = model_dict_path
-        self.live2d_model_name: str = live2d_model_name
-        self.set_model(live2d_model_name)
+# the same sentence is parsed by several pipeline stages (TTS text, subtitles, expressions)
+EMOTION_CACHE_SIZE = 256
 
-    def set_model(self, model_name: str) -> None:
-        """
-        Set the model with its name and load the model information. This method will initialize the `self.model_info`, `self.emo_map`, and `self.emo_str` attributes.
-        This method is called in the constructor.
 
-        Parameters:
-            model_name (str): The name of the live2d model.
+class EmotionMatcher:
+    """
+    Finds the emotion tags of one model in a single pass, with one compiled case-insensitive regex.
+    Shared by every session that uses the model, and so is its cache of parsed sentences.
+    """
+
+    def __init__(self, emo_map: dict) -> None:
+        # tags are matched case-insensitively, the first key of a case-insensitive duplicate wins
+        self._lookup: dict = {}
+        for key, value in emo_map.items():
+            self._lookup.setdefault(key.lower(), value)
+        self._pattern = None
+        if self._lookup:
+            alternatives = "|".join(
+                re.escape(key) for key in sorted(self._lookup, key=len, reverse=True)
+            )
+            self._pattern = re.compile(rf"\[({alternatives})\]", re.IGNORECASE)
+        self.parse = functools.lru_cache(maxsize=EMOTION_CACHE_SIZE)(self.parse_uncached)
+
+    def parse_uncached(self, text: str) -> EmotionTags:
+        if self._pattern is None or "[" not in text:
+            return EmotionTags(text)
+        parts = []
+        expressions = []
+        spans = []
+        last = 0
+        for match in self._pattern.finditer(text):
+            parts.append(text[last : match.start()])
+            expressions.append(self._lookup[match.group(1).lower()])
+            spans.append(match.span())
+            last = match.end()
+        if not spans:
+            return EmotionTags(text)
+        parts.append(text[last:])
+        return EmotionTags("".join(parts), tuple(expressions), tuple(spans))
+
+
+@dataclass(frozen=True)
+class ModelEntry:
+    """
+    One model of the model dictionary, with everything derived from it precomputed.
+
+    Attributes:
+        info (dict): The information of the model, as in the dictionary. Not to be modified.
+        emo_map (dict): The emotion map of the model.
+        emo_str (str): The emotion tags, as listed in the prompt.
+        emotions (EmotionMatcher): The tag matcher of the model.
+    """
+
+    info: dict
+    emo_map: dict
+    emo_str: str
+    emotions: EmotionMatcher
 
-            Returns:
-            None
-        """
 
-        self.model_info: dict = self._lookup_model_info(model_name)
-        self.emo_map: dict = self.model_info["emotionMap"]
-        self.emo_str: str = " ".join([f"[{key}]," for key in self.emo_map.keys()])
-        # emo_str is a string of the keys in the emoMap dictionary. The keys are enclosed in square brackets.
-        # example: `"[fear], [anger], [disgust], [sadness], [joy], [neutral], [surprise]"`
+def _load_file_content(file_path: str) -> str:
+    """Load the content of a file with robust encoding handling."""
+    # Try common encodings first
+    encodings = ["utf-8", "utf-8-sig", "gbk", "gb2312", "ascii"]
+
+    for encoding in encodings:
+        try:
+            with open(file_path, "r", encoding=encoding) as file:
+                return file.read()
+        except UnicodeDecodeError:
+            continue
 
-    def _load_file_content(self, file_path: str) -> str:
-        """Load the content of a file with robust encoding handling."""
-        # Try common encodings first
-        encodings = ["utf-8", "utf-8-sig", "gbk", "gb2312", "ascii"]
+    # If all common encodings fail, try to detect encoding
+    import chardet
 
-        for encoding in encodings:
+    try:
+        with open(file_path, "rb") as file:
+            raw_data = file.read()
+        detected = chardet.detect(raw_data)
+        detected_encoding = detected["encoding"]
+
+        if detected_encoding:
             try:
-                with open(file_path, "r", encoding=encoding) as file:
-                    return file.read()
+                return raw_data.decode(detected_encoding)
             except UnicodeDecodeError:
-                continue
+                pass
+    except Exception as e:
+        logger.error(f"Error detecting encoding for {file_path}: {e}")
+
+    raise UnicodeError(f"Failed to decode {file_path} with any encoding")
 
-        # If all common encodings fail, try to detect encoding
-        try:
-            with open(file_path, "rb") as file:
-                raw_data = file.read()
-            detected = chardet.detect(raw_data)
-            detected_encoding = detected["encoding"]
-
-            if detected_encoding:
-                try:
-                    return raw_data.decode(detected_encoding)
-                except UnicodeDecodeError:
-                    pass
-        except Exception as e:
-            logger.error(f"Error detecting encoding for {file_path}: {e}")
 
-        raise UnicodeError(f"Failed to decode {file_path} with any encoding")
+class ModelRegistry:
+    """
+    Process-wide index of the model dictionaries, by model name.
 
-    def _lookup_model_info(self, model_name: str) -> dict:
+    A dictionary file is read and parsed once. It is read again when its modification time
+    or size changes, which is checked at most every `check_interval_s` seconds, so setting up
+    a session does not touch the disk.
+    """
+
+    def __init__(self, check_interval_s: float = 2.0) -> None:
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        # absolute path -> (mtime and size, time of the last check, models by name)
+        self._indexes: dict[str, tuple[tuple, float, dict[str, ModelEntry]]] = {}
+
+    def lookup(self, model_dict_path: str, model_name: str) -> ModelEntry:
         """
-        Find the model information from the model dictionary and return the information about the matched model.
+        Find the model in the model dictionary.
 
         Parameters:
+            model_dict_path (str): The path to the model dictionary file.
             model_name (str): The name of the live2d model.
 
         Returns:
-            dict: The dictionary with the information of the matched model.
+            ModelEntry: The matched model.
 
         Raises:
             FileNotFoundError if the model dictionary file is not found.
@@ -96,47 +151,145 @@ class Live2dModel:
             json.JSONDecodeError if the model dictionary file is not a valid JSON file.
 
             KeyError if the model name is not found in the model dictionary.
-
         """
-
-        self.live2d_model_name = model_name
-
+        models = self._models(model_dict_path)
+        entry = models.get(model_name)
+        if entry is None:
+            print(f"Unable to find {model_name} in {model_dict_path}.")
+            raise KeyError(
+                f"{model_name} not found in model dictionary {model_dict_path}."
+            )
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def _models(self, model_dict_path: str) -> dict[str, ModelEntry]:
+        path = os.path.abspath(model_dict_path)
+        with self._lock:
+            index = self._indexes.get(path)
+            now = time.monotonic()
+            if index is not None and now - index[1] < self.check_interval_s:
+                return index[2]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError as file_e:
+                print(f"Model dictionary file not found at {model_dict_path}.")
+                raise file_e
+            version = (stat.st_mtime_ns, stat.st_size)
+            if index is not None and index[0] == version:
+                self._indexes[path] = (version, now, index[2])
+                return index[2]
+            models = self._load(model_dict_path)
+            self._indexes[path] = (version, now, models)
+            return models
+
+    @staticmethod
+    def _load(model_dict_path: str) -> dict[str, ModelEntry]:
         try:
-            file_content = self._load_file_content(self.model_dict_path)
+            file_content = _load_file_content(model_dict_path)
             model_dict = json.loads(file_content)
         except FileNotFoundError as file_e:
-            print(f"Model dictionary file not found at {self.model_dict_path}.")
+            print(f"Model dictionary file not found at {model_dict_path}.")
             raise file_e
         except json.JSONDecodeError as json_e:
             print(
-                f"Error decoding JSON from model dictionary file at {self.model_dict_path}."
+                f"Error decoding JSON from model dictionary file at {model_dict_path}."
             )
             raise json_e
         except UnicodeError as uni_e:
-            print(f"Error reading model dictionary file at {self.model_dict_path}.")
+            print(f"Error reading model dictionary file at {model_dict_path}.")
             raise uni_e
         except Exception as e:
             print(
-                f"Error occurred while reading model dictionary file at {self.model_dict_path}."
+                f"Error occurred while reading model dictionary file at {model_dict_path}."
             )
             raise e
 
-        # Find the model in the model_dict
-        matched_model = next(
-            (model for model in model_dict if model["name"] == model_name), None
-        )
+        # The feature: "translate model url to full url if it starts with '/' " is no longer implemented here
 
-        if matched_model is None:
-            print(f"Unable to find {model_name} in {self.model_dict_path}.")
-            raise KeyError(
-                f"{model_name} not found in model dictionary {self.model_dict_path}."
+        models = {}
+        for model in model_dict:
+            if model["name"] in models:
+                # the first model with a name is the one that is used
+                continue
+            emo_map = model.get("emotionMap") or {}
+            models[model["name"]] = ModelEntry(
+                info=model,
+                emo_map=emo_map,
+                # emo_str is a string of the keys in the emoMap dictionary. The keys are enclosed in square brackets.
+                # example: `"[fear], [anger], [disgust], [sadness], [joy], [neutral], [surprise]"`
+                emo_str=" ".join([f"[{key}]," for key in emo_map.keys()]),
+                emotions=EmotionMatcher(emo_map),
             )
 
-        # The feature: "translate model url to full url if it starts with '/' " is no longer implemented here
+        print(f"Model dictionary loaded: {len(models)} models.")
+        return models
+
+
+model_registry = ModelRegistry()
+
+
+class Live2dModel:
+    """
+    A class to represent a Live2D model. This class only prepares and stores the information of the Live2D model. It does not send anything to the frontend or server or anything.
+
+    Attributes:
+        model_dict_path (str): The path to the model dictionary file.
+        live2d_model_name (str): The name of the Live2D model.
+        model_info (dict): The information of the Live2D model.
+        emo_map (dict): The emotion map of the Live2D model.
+        emo_str (str): The string representation of the emotion map of the Live2D model.
+    """
 
-        print("Model Information Loaded.")
+    model_dict_path: str
+    live2d_model_name: str
+    model_info: dict
+    emo_map: dict
+    emo_str: str
 
-        return matched_model
+    def __init__(
+        self, live2d_model_name: str, model_dict_path: str = "model_dict.json"
+    ):
+
+        self.model_dict_path: str = model_dict_path
+        self.live2d_model_name: str = live2d_model_name
+        self.set_model(live2d_model_name)
+
+    def set_model(self, model_name: str) -> None:
+        """
+        Set the model with its name and load the model information. This method will initialize the `self.model_info`, `self.emo_map`, and `self.emo_str` attributes.
+        This method is called in the constructor. The model dictionary is looked up in the process-wide `model_registry`.
+
+        Parameters:
+            model_name (str): The name of the live2d model.
+
+            Returns:
+            None
+        """
+
+        entry = model_registry.lookup(self.model_dict_path, model_name)
+        self.live2d_model_name = model_name
+        self.model_info: dict = entry.info
+        self.emo_map: dict = entry.emo_map
+        self.emo_str: str = entry.emo_str
+        self._emotions: EmotionMatcher = entry.emotions
+
+    def parse_emotions(self, text: str) -> EmotionTags:
+        """
+        Find the emotion tags (`[joy]`, case-insensitive) in the text in a single pass.
+
+        The results of the last few sentences are cached, so the pipeline stages that
+        each need the clean text or the expressions of a sentence share one parse.
+
+        Parameters:
+            text (str): The text to check for emotions.
+
+        Returns:
+            EmotionTags: The text without the tags, the expressions and the offsets of the tags.
+        """
+        return self._emotions.parse(text)
 
     def extract_emotion(self, str_to_check: str) -> list:
         """
@@ -148,30 +301,7 @@ class Live2dModel:
         Returns:
             list: A list of values of the emotions found in the string. An empty list is returned if no emotions are found.
         """
-        
-        if self.emo_map is None:
-            return []
-
-        expression_list = []
-        str_to_check = str_to_check.lower()
-
-        i = 0
-        while i < len(str_to_check):
-            if str_to_check[i] != "[":
-                i += 1
-                continue
-            for key in self.emo_map.keys():
-                emo_tag = f"[{key}]"
-                if str_to_check[i : i + len(emo_tag)] == emo_tag:
-                    expression_list.append(self.emo_map[key])
-                    i += len(emo_tag) - 1
-                    break
-            i += 1
-        
-        # print_with_color(str_to_check)
-        # print_with_color(expression_list)
-
-        return expression_list
+        return list(self.parse_emotions(str_to_check).expressions)
 
     def remove_emotion_keywords(self, target_str: str) -> str:
         """
@@ -183,20 +313,7 @@ class Live2dModel:
         Returns:
             str: The cleaned string with the emotion keywords removed.
         """
-
-        lower_str = target_str.lower()
-
-        if self.emo_map is None:
-            return target_str
-        
-        for key in self.emo_map.keys():
-            lower_key = f"[{key}]".lower()
-            while lower_key in lower_str:
-                start_index = lower_str.find(lower_key)
-                end_index = start_index + len(lower_key)
-                target_str = target_str[:start_index] + target_str[end_index:]
-                lower_str = lower_str[:start_index] + lower_str[end_index:]
-        return target_str
+        return self.parse_emotions(target_str).text
 
 
 if __name__ == "__main__":
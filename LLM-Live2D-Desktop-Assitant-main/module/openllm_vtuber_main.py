@@ -4,16 +4,23 @@ import shutil
 from loguru import logger
 import __init__
 from llm.llm_factory import LLMFactory
+from llm.journal import ConversationJournal
+from llm.response_cache import CachedLLM
 from asr.asr_factory import ASRFactory
+from asr.endpointer import AdaptiveEndpointer
+from asr.language_tracker import LanguageTracker
 from tts.tts_factory import TTSFactory
 from translate.translate_factory import TranslateFactory
-from prompts import prompt_loader
+from prompts.prompt_catalog import prompt_catalog
 
 from .live2d_model import Live2dModel
 from .audio_manager import AudioManager
 from .conversation_manager import ConversationManager
 from .interrupt_manager import InterruptManager
 
+# LLM providers that send the tools as function definitions and yield the calls
+NATIVE_TOOL_PROVIDERS = ("ollama",)
+
 class OpenLLMVTuberMain:
 
     def __init__(
@@ -42,6 +49,7 @@ class OpenLLMVTuberMain:
                 self.asr = custom_asr
         else:
             self.asr = None
+        self.language_tracker = self.init_language_tracker()
 
         # TTS
         if self.config.get("TTS_ON", False):
@@ -77,7 +85,8 @@ class OpenLLMVTuberMain:
         self.claude_api_key = self.config.get("CLAUDE_API_KEY", None)
 
         self.conversation_manager = ConversationManager(
-            self.config, self.llm, self.asr, self.tts, self.live2d, self.translator, self.audio_manager, self.interrupt_manager, self.claude_api_key, self.verbose, self.loop
+            self.config, self.llm, self.asr, self.tts, self.live2d, self.translator, self.audio_manager, self.interrupt_manager, self.claude_api_key, self.verbose, self.loop,
+            language_tracker=self.language_tracker,
         )
         
         if "REMOVE_SPECIAL_CHAR" not in self.config:
@@ -98,52 +107,114 @@ class OpenLLMVTuberMain:
     def init_llm(self):
         llm_provider = self.config.get("LLM_PROVIDER")
         llm_config = self.config.get(llm_provider, {})
+        if llm_provider == "failover":
+            # the two backends are configured in their own sections
+            llm_config = {
+                **llm_config,
+                "PRIMARY_CONFIG": self.config.get(llm_config.get("PRIMARY"), {}),
+                "SECONDARY_CONFIG": self.config.get(llm_config.get("SECONDARY"), {}),
+            }
         system_prompt, tools = self.get_system_prompt_and_tools()
+        self.journal = ConversationJournal.from_config(
+            self.config.get("CONVERSATION_JOURNAL"),
+            # the same provider and persona continue their conversation after a restart
+            default_session_id=f"{llm_provider}-{self.config.get('PERSONA_CHOICE') or 'default'}",
+        )
 
         llm = LLMFactory.create_llm(
             llm_provider=llm_provider, SYSTEM_PROMPT=system_prompt,
             tools = tools, caller=None,
+            JOURNAL=self.journal,
             **llm_config
         )
-        return llm
+        return CachedLLM.from_config(
+            llm,
+            self.config.get("RESPONSE_CACHE"),
+            persona=self.config.get("PERSONA_CHOICE"),
+            model=llm_config.get("MODEL"),
+        )
 
     def init_asr(self):
         asr_model = self.config.get("ASR_MODEL")
         asr_config = self.config.get(asr_model, {})
-        asr = ASRFactory.get_asr_system(asr_model, **asr_config)
+        worker_processes = self.config.get("ASR_WORKER_PROCESSES", 0)
+        if worker_processes:
+            asr = ASRFactory.get_pooled_asr_system(asr_model, worker_processes, **asr_config)
+        else:
+            asr = ASRFactory.get_asr_system(asr_model, **asr_config)
+
+        wake_word_config = self.config.get("LOCAL_WAKE_WORD")
+        if wake_word_config and wake_word_config.get("WORD"):
+            wake_word_asr = None
+            if wake_word_config.get("ASR_MODEL"):
+                wake_word_asr = ASRFactory.get_asr_system(
+                    wake_word_config["ASR_MODEL"],
+                    **wake_word_config.get("ASR_CONFIG", {}),
+                )
+            asr.enable_wake_word(
+                wake_word_config["WORD"],
+                awake_window=wake_word_config.get("AWAKE_WINDOW", 30),
+                wake_word_asr=wake_word_asr,
+            )
+
+        endpointing_config = self.config.get("ASR_ENDPOINTING")
+        if isinstance(endpointing_config, dict):
+            asr.endpointing_options = {
+                "adaptive_endpointing": endpointing_config.get("ADAPTIVE", True),
+                "endpointer": AdaptiveEndpointer(
+                    short_pause_ms=endpointing_config.get("SHORT_PAUSE_MS", 400),
+                    max_pause_ms=endpointing_config.get("MAX_PAUSE_MS", 1300),
+                ),
+            }
         return asr
 
+    def init_language_tracker(self):
+        pinning_config = self.config.get("ASR_LANGUAGE_PINNING", {})
+        if pinning_config is False or self.asr is None:
+            return None
+        if not isinstance(pinning_config, dict):
+            pinning_config = {}
+        return LanguageTracker(
+            pin_after=pinning_config.get("PIN_AFTER", 3),
+            min_probability=pinning_config.get("MIN_PROBABILITY", 0.8),
+            redetect_logprob=pinning_config.get("REDETECT_LOGPROB", -1.0),
+        )
+
     def init_tts(self):
         tts_model = self.config.get("TTS_MODEL", "pyttsx3TTS")
         tts_config = self.config.get(tts_model, {})
         return TTSFactory.get_tts_engine(tts_model, **tts_config)
     
     def get_song_list(self) -> list[str]:
-        song_file_path = "./sing/original"
-        song_list = os.listdir(song_file_path)
-        song_list = [os.path.splitext(song)[0] for song in song_list]
-        return song_list
+        return prompt_catalog.song_list()
     
-    def get_system_prompt_and_tools(self) -> tuple[str, list[dict], callable]:
-        if self.config.get("PERSONA_CHOICE"):
-            system_prompt = prompt_loader.load_persona(
-                self.config.get("PERSONA_CHOICE")
-            )
-        else:
-            system_prompt = self.config.get("DEFAULT_PERSONA_PROMPT_IN_YAML")
-
-        system_prompt += prompt_loader.load_util(
-            "tools_prompt"
-        ).replace("[<insert_song_list>]", str(self.get_song_list()))            
-
-        # Tool functions calling, temporary no use, because I don't know how to use it when stream=True
-        if self.live2d is not None:
-            system_prompt += prompt_loader.load_util(
-                self.config.get("LIVE2D_Expression_Prompt")
-            ).replace("[<insert_emomap_keys>]", self.live2d.emo_str)
-        tools = prompt_loader.load_util_json("tools")
-        tools[0]["function"]["parameters"]["properties"]["song_name"]["enum"] = self.get_song_list()
-        
+    def uses_native_tools(self) -> bool:
+        """Whether every LLM backend gets the tools as function definitions (`NATIVE_TOOLS`, on by default)."""
+        llm_provider = self.config.get("LLM_PROVIDER")
+        providers = [llm_provider]
+        if llm_provider == "failover":
+            failover_config = self.config.get("failover", {})
+            providers = [failover_config.get("PRIMARY"), failover_config.get("SECONDARY")]
+        return all(
+            provider in NATIVE_TOOL_PROVIDERS
+            and self.config.get(provider, {}).get("NATIVE_TOOLS", True)
+            for provider in providers
+        )
+
+    def get_system_prompt_and_tools(self) -> tuple[str, list[dict]]:
+        song_list = self.get_song_list()
+        # the same settings give the same string in every session, see PromptCatalog
+        system_prompt = prompt_catalog.system_prompt(
+            persona_choice=self.config.get("PERSONA_CHOICE"),
+            default_prompt=self.config.get("DEFAULT_PERSONA_PROMPT_IN_YAML"),
+            expression_prompt=self.config.get("LIVE2D_Expression_Prompt"),
+            emo_str=self.live2d.emo_str if self.live2d is not None else None,
+            # without native tools, the tool calls are written into the reply as JSON
+            song_list=None if self.uses_native_tools() else song_list,
+        )
+        # only the tools the conversation manager can run, and no songs without songs
+        tools = prompt_catalog.tools(ConversationManager.TOOLS, song_list)
+
         if self.verbose:
             print("\n === System Prompt ===")
             print(system_prompt)
@@ -154,6 +225,11 @@ class OpenLLMVTuberMain:
     ) -> None:
         self.audio_manager.play_audio_file = audio_output_func
 
+    def close(self) -> None:
+        """End the session: write out and close the conversation journal."""
+        if self.journal is not None:
+            self.journal.close()
+
     def clean_cache(self):
         cache_dir = "./cache"
         if os.path.exists(cache_dir):
@@ -166,5 +242,12 @@ class OpenLLMVTuberMain:
             clipboard_data=clipboard_data
         )
 
+    async def transcribe_async(self, audio) -> str:
+        """Transcribe the audio without blocking the event loop, tracking the session language."""
+        if self.language_tracker is None:
+            return await self.asr.transcribe_np_async(audio)
+        result = await self.language_tracker.transcribe_async(self.asr, audio)
+        return result.text
+
     def interrupt(self, heard_sentence: str = "") -> None:
         self.interrupt_manager.interrupt(heard_sentence)
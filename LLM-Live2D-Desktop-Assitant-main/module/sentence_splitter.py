@@ -0,0 +1,258 @@
+"""Description: Splits streamed LLM output into sentences for TTS.
+
+The LLM streams text in chunks of any size. `SentenceSplitter.feed` takes one chunk and
+returns the sentences it completed. It is a small state machine that only looks at the
+new chunk, and only at the characters that matter (sentence and clause punctuation,
+`[tags]` and `{blocks}`); the pending sentence is kept as a list of parts.
+
+Rules:
+- `.`, `?` and `!` (with any closing quotes or brackets after them) end a sentence when
+  followed by whitespace, a tag, non-latin text or the end of the reply. One that is
+  followed by a letter or digit is part of a number, URL or abbreviation ("3.14",
+  "example.com/?q=1", "e.g."). A `.` after a known abbreviation or an initial ("Dr.", "J.") does
+  not end a sentence either.
+- CJK sentence punctuation ends a sentence right away.
+- Ellipses ("...", "…") are pauses, not sentence ends.
+- Bracketed emotion tags (`[joy]`) and JSON tool calls (`{"sing_song": ...}`) are never
+  split. A tool call is returned as a segment of its own as soon as it is closed. Only a
+  `{` followed by `"` starts one; other braces (`{laughs}`) are text, and so is a `{"`
+  that is not closed within `MAX_BLOCK_CHARS` characters.
+- Segments with fewer than `min_chars` speakable characters are merged into the next one,
+  and a sentence that grows past `max_chars` is split at its last clause boundary (comma,
+  semicolon, ...), or else at a space.
+"""
+
+import re
+
+# endings that look like the end of a sentence but are not
+ABBREVIATIONS = frozenset((
+    "Dr.", "Mr.", "Ms.", "Mrs.", "Jr.", "Sr.", "St.", "Ave.", "Rd.", "Blvd.", "Dept.",
+    "Univ.", "Prof.", "Ph.D.", "M.D.", "U.S.", "U.K.", "U.N.", "E.U.", "U.S.A.",
+    "U.S.S.R.", "U.A.E.", "e.g.", "i.e.", "vs.", "approx.", "Fig.", "Inc.", "Ltd.", "Co.",
+))
+_INITIAL = re.compile(r"^[A-Z]\.$")
+
+LATIN_END = ".?!"
+CJK_END = "。？！；～〜〰"
+ELLIPSIS = "…"
+CLOSERS = "\"'”’」』）)]"
+CLAUSE = ",;:，、；："
+# the longest tag that is still treated as one (`[text_input_start]`)
+MAX_TAG_CHARS = 40
+# the longest JSON block that is still held back as a tool call
+MAX_BLOCK_CHARS = 500
+
+_END_CHARS = LATIN_END + CJK_END + ELLIPSIS
+# one event: a tag or block delimiter, a run of sentence punctuation (with its closers),
+# or a clause mark
+_EVENT = re.compile(
+    "[\\[\\]{}]"
+    + "|[" + re.escape(_END_CHARS) + "]+[" + re.escape(CLOSERS) + "]*"
+    + "|[" + re.escape(CLAUSE) + "]"
+)
+_RUN_CONTINUATION = re.compile("[" + re.escape(_END_CHARS + CLOSERS) + "]*")
+_TAG = re.compile(r"\[[^\[\]]{0,%d}\]" % MAX_TAG_CHARS)
+_LOOKBEHIND = 12
+
+
+def _speakable_length(text: str) -> int:
+    return len(_TAG.sub("", text).strip())
+
+
+class SentenceSplitter:
+    """Incremental sentence splitter, see the module description for the rules."""
+
+    def __init__(self, min_chars: int = 3, max_chars: int = 200) -> None:
+        """
+        Parameters:
+        - min_chars (int, optional): Merge segments with fewer speakable characters into the next one. Defaults to 3.
+        - max_chars (int, optional): Split sentences longer than this at a clause boundary. 0 disables it. Defaults to 200.
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._reset()
+
+    def _reset(self) -> None:
+        self._parts: list[str] = []
+        self._length = 0
+        # the last few characters of the pending text, to recognize abbreviations
+        self._tail = ""
+        # offsets in the pending text right after each clause mark
+        self._clauses: list[int] = []
+        # offset of the open `[`, -1 outside of a tag
+        self._tag_at = -1
+        self._block: list[str] = []
+        self._block_length = 0
+        self._depth = 0
+        # a `.` run at the very end of the last chunk, decided by the next character
+        self._pending_run = ""
+
+    def feed(self, chunk: str) -> list[str]:
+        """Add a chunk of text and return the segments it completed."""
+        if not chunk:
+            return []
+        segments = []
+        start = 0
+        if self._pending_run:
+            # the run may go on in this chunk ("." + "..")
+            more = _RUN_CONTINUATION.match(chunk).end()
+            run = self._pending_run + chunk[:more]
+            self._pending_run = ""
+            if more == len(chunk):
+                self._pending_run = run
+                return segments
+            start = more
+            self._end_run(run, chunk[more], segments)
+        elif self._block_length == 1 and not chunk.startswith('"'):
+            # the last chunk ended with a `{` that does not start a tool call after all
+            self._release_block(segments)
+
+        for match in _EVENT.finditer(chunk, start):
+            event = match.group()
+            head = event[0]
+            if self._depth:
+                if head == "{":
+                    self._depth += 1
+                elif head == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._block.append(chunk[start:match.end()])
+                        start = match.end()
+                        self._emit_block(segments)
+                continue
+            if head == "{":
+                if match.end() < len(chunk) and chunk[match.end()] != '"':
+                    # a brace in the text ("{laughs}"), not a tool call
+                    continue
+                self._add(chunk[start:match.start()])
+                start = match.start()
+                self._depth = 1
+                continue
+            if self._tag_at >= 0:
+                if "]" in event:
+                    self._tag_at = -1
+                    continue
+                if self._length + match.start() - start - self._tag_at <= MAX_TAG_CHARS:
+                    continue
+                # too long for a tag, it was just a bracket
+                self._tag_at = -1
+            if head == "[":
+                self._tag_at = self._length + match.start() - start
+            elif head in CLAUSE:
+                self._clauses.append(self._length + match.end() - start)
+            elif head in _END_CHARS:
+                self._add(chunk[start:match.start()])
+                start = match.end()
+                if start == len(chunk) and self._needs_lookahead(event):
+                    self._pending_run = event
+                    break
+                self._end_run(event, chunk[start] if start < len(chunk) else "", segments)
+
+        rest = chunk[start:]
+        if self._depth:
+            self._block.append(rest)
+            self._block_length += len(rest)
+            if self._block_length > MAX_BLOCK_CHARS:
+                # too long for a tool call, do not hold back the rest of the reply
+                self._release_block(segments)
+        else:
+            self._add(rest)
+            self._split_long(segments)
+        return segments
+
+    def flush(self) -> list[str]:
+        """Return what is left at the end of the reply."""
+        segments = []
+        while self._depth:
+            # never closed, so not a tool call
+            self._release_block(segments)
+        if self._pending_run:
+            run, self._pending_run = self._pending_run, ""
+            self._end_run(run, None, segments)
+        rest = self._take()
+        if rest.strip():
+            segments.append(rest)
+        self._reset()
+        return segments
+
+    def _needs_lookahead(self, run: str) -> bool:
+        # a latin mark can turn out to be part of a number or URL ("3.14", "?q=1")
+        return not any(char in run for char in CJK_END)
+
+    def _end_run(self, run: str, next_char: str | None, segments: list[str]) -> None:
+        """Add a run of sentence punctuation and end the sentence if it is one."""
+        self._add(run)
+        if self._tag_at >= 0 or not self._is_sentence_end(run, next_char):
+            return
+        self._split_long(segments)
+        text = "".join(self._parts)
+        if next_char is not None and _speakable_length(text) < self.min_chars:
+            # too short to be said on its own, wait for the next sentence
+            return
+        segments.append(self._take())
+
+    def _is_sentence_end(self, run: str, next_char: str | None) -> bool:
+        marks = run.rstrip(CLOSERS)
+        if any(char in marks for char in CJK_END):
+            return True
+        if all(char == "." for char in marks) and len(marks) > 1 or all(char == ELLIPSIS for char in marks):
+            return False
+        if next_char and next_char.isascii() and not next_char.isspace() and next_char not in "[{":
+            # "3.14", "example.com", "e.g", "?q=1"
+            return False
+        if marks == ".":
+            words = self._tail.split()
+            word = words[-1].rstrip(CLOSERS) if words else ""
+            if word in ABBREVIATIONS or _INITIAL.match(word):
+                return False
+        return True
+
+    def _add(self, text: str) -> None:
+        if text:
+            self._parts.append(text)
+            self._length += len(text)
+            self._tail = (self._tail + text[-_LOOKBEHIND:])[-_LOOKBEHIND:]
+
+    def _take(self) -> str:
+        text = "".join(self._parts)
+        self._parts = []
+        self._length = 0
+        self._tail = ""
+        self._clauses = []
+        self._tag_at = -1
+        return text
+
+    def _emit_block(self, segments: list[str]) -> None:
+        pending = self._take()
+        if pending.strip():
+            segments.append(pending)
+        segments.append("".join(self._block))
+        self._block = []
+        self._block_length = 0
+
+    def _release_block(self, segments: list[str]) -> None:
+        """The open block is not a tool call: split it like the rest of the text."""
+        text = "".join(self._block)
+        self._block = []
+        self._block_length = 0
+        self._depth = 0
+        # the `{` itself cannot start a block again
+        self._add(text[0])
+        segments.extend(self.feed(text[1:]))
+
+    def _split_long(self, segments: list[str]) -> None:
+        """Split the pending text while it is longer than `max_chars`."""
+        while self.max_chars and self._length > self.max_chars and self._tag_at < 0:
+            text = "".join(self._parts)
+            clauses = [at for at in self._clauses if self.min_chars <= at <= self.max_chars]
+            if clauses:
+                cut = clauses[-1]
+            else:
+                cut = text.rfind(" ", self.min_chars, self.max_chars + 1)
+                if cut <= 0:
+                    cut = self.max_chars
+            remaining = [at - cut for at in self._clauses if at > cut]
+            segments.append(text[:cut])
+            self._take()
+            self._add(text[cut:])
+            self._clauses = remaining
@@ -0,0 +1,165 @@
+"""Description: Builds the system prompt and the tools once and shares them between sessions.
+
+The persona and util prompts, `tools.json` and the song catalog (the files in
+`./sing/original`) are read once. A file is read again only when its modification time
+or size changes, and the song catalog is listed again only when the directory changes.
+Both are checked at most every `check_interval_s` seconds. A rendered system prompt is
+kept for each persona, Live2D expression list and song catalog, and every session with
+the same settings gets the very same string. The prompt stays byte-identical between
+sessions, so the LLM's prefix cache keeps working.
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+
+from loguru import logger
+
+from . import prompt_loader
+
+SONG_DIR = "./sing/original"
+
+
+class PromptCatalog:
+    """
+    Process-wide cache of the prompt files, the song catalog and the rendered system prompts.
+    """
+
+    def __init__(self, check_interval_s: float = 2.0) -> None:
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        # absolute path -> [mtime and size, time of the last check, content]
+        self._files: dict[str, list] = {}
+        # absolute directory -> [mtime, time of the last check, song names]
+        self._songs: dict[str, list] = {}
+        # prompt settings -> (versions of the files it was rendered from, system prompt)
+        self._prompts: dict[tuple, tuple] = {}
+
+    def song_list(self, song_dir: str = SONG_DIR) -> list[str]:
+        """
+        The names of the songs in `song_dir`, sorted, so the system prompt and tools are
+        byte-identical between runs.
+
+        Raises:
+        - FileNotFoundError if the directory does not exist.
+        """
+        song_dir = os.path.abspath(song_dir)
+        with self._lock:
+            entry = self._songs.get(song_dir)
+            now = time.monotonic()
+            if entry is None or now - entry[1] >= self.check_interval_s:
+                version = os.stat(song_dir).st_mtime_ns
+                if entry is None or entry[0] != version:
+                    songs = sorted(os.path.splitext(song)[0] for song in os.listdir(song_dir))
+                    entry = [version, now, songs]
+                    self._songs[song_dir] = entry
+                entry[1] = now
+            return list(entry[2])
+
+    def system_prompt(
+        self,
+        persona_choice: str | None = None,
+        default_prompt: str | None = None,
+        expression_prompt: str | None = None,
+        emo_str: str | None = None,
+        song_list: list[str] | None = None,
+    ) -> str:
+        """
+        Render the system prompt, or return the one rendered before from the same files.
+
+        Parameters:
+        - persona_choice (str, optional): Persona prompt in `prompts/persona`. Defaults to None (use `default_prompt`).
+        - default_prompt (str, optional): The prompt when there is no persona (`DEFAULT_PERSONA_PROMPT_IN_YAML`). Defaults to None.
+        - expression_prompt (str, optional): Util prompt listing the Live2D expressions. Defaults to None.
+        - emo_str (str, optional): The expressions of the Live2D model, the prompt is added only with them. Defaults to None.
+        - song_list (list[str], optional): Describe the tools in the prompt, with these songs. Defaults to None (no tools prompt).
+
+        Raises:
+        - FileNotFoundError if a prompt file is not found.
+        - UnicodeError if a prompt file cannot be decoded.
+        """
+        paths = []
+        if persona_choice:
+            paths.append(os.path.join(prompt_loader.PERSONA_PROMPT_DIR, f"{persona_choice}.txt"))
+        if song_list is not None:
+            paths.append(os.path.join(prompt_loader.UTIL_PROMPT_DIR, "tools_prompt.txt"))
+        if emo_str is not None:
+            paths.append(os.path.join(prompt_loader.UTIL_PROMPT_DIR, f"{expression_prompt}.txt"))
+        key = (
+            persona_choice,
+            None if persona_choice else default_prompt,
+            expression_prompt if emo_str is not None else None,
+            emo_str,
+            None if song_list is None else tuple(song_list),
+        )
+
+        with self._lock:
+            files = [self._read(path, prompt_loader._load_file_content) for path in paths]
+            versions = tuple(version for version, _ in files)
+            cached = self._prompts.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+
+            contents = iter(content for _, content in files)
+            system_prompt = next(contents) if persona_choice else default_prompt
+            if song_list is not None:
+                # the tool calls are written into the reply as JSON
+                system_prompt += next(contents).replace("[<insert_song_list>]", str(list(song_list)))
+            if emo_str is not None:
+                system_prompt += next(contents).replace("[<insert_emomap_keys>]", emo_str)
+            self._prompts[key] = (versions, system_prompt)
+            return system_prompt
+
+    def tools(self, names, song_list: list[str]) -> list[dict]:
+        """
+        A copy of the tools in `tools.json` called one of `names`. `sing_song` is left out
+        without songs, and its `song_name` is one of `song_list` otherwise.
+        """
+        path = os.path.join(prompt_loader.UTIL_PROMPT_DIR, "tools.json")
+        with self._lock:
+            _, all_tools = self._read(path, _load_json)
+            tools = [
+                copy.deepcopy(tool) for tool in all_tools
+                if tool["function"]["name"] in names
+                and (tool["function"]["name"] != "sing_song" or song_list)
+            ]
+        for tool in tools:
+            if tool["function"]["name"] == "sing_song":
+                tool["function"]["parameters"]["properties"]["song_name"]["enum"] = list(song_list)
+        return tools
+
+    def _read(self, path: str, load) -> tuple:
+        """(version, content) of the file, read with `load` if it changed. Call it with the lock held."""
+        path = os.path.abspath(path)
+        entry = self._files.get(path)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < self.check_interval_s:
+            return entry[0], entry[2]
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+            if entry is None or entry[0] != version:
+                entry = [version, now, load(path)]
+                self._files[path] = entry
+                logger.info(f"Loaded prompt {path}")
+        except Exception as e:
+            logger.error(f"Error loading prompt {path}: {e}")
+            raise
+        entry[1] = now
+        return entry[0], entry[2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._files.clear()
+            self._songs.clear()
+            self._prompts.clear()
+
+
+def _load_json(path: str):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+prompt_catalog = PromptCatalog()
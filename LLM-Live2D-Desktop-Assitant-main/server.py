@@ -1,29 +1,39 @@
+import sys
+
+if "--profile-imports" in sys.argv:
+    # installed before anything else is imported, so every module is timed
+    from utils.import_profiler import import_profiler
+
+    import_profiler.install()
+
 import os
-import re
 import shutil
 import atexit
 import json
 import asyncio
 import socket
 import signal
-import sys
-from typing import List, Dict, Any
-import yaml
-import numpy as np
-import chardet
+from typing import TYPE_CHECKING, List, Dict, Any
 from loguru import logger
-from fastapi import FastAPI, WebSocket, APIRouter, HTTPException
+from fastapi import FastAPI, WebSocket, APIRouter, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.websockets import WebSocketDisconnect
 from pydantic import BaseModel
-from module.openllm_vtuber_main import OpenLLMVTuberMain
 from module.live2d_model import Live2dModel
-from tts.stream_audio import AudioPayloadPreparer
 from port_config import get_available_port, cleanup_ports, get_current_port
+from utils.metrics import metrics
+from utils.claude_proxy import ClaudeProxy, ClaudeProxyError, sse as _sse
+from utils.config_loader import config_store, load_config_with_env
 import argparse
 
+# the session components (and the LLM, ASR and TTS backends behind them) are imported
+# when the first client connects, so the server starts without them
+if TYPE_CHECKING:
+    from module.openllm_vtuber_main import OpenLLMVTuberMain
+    from tts.stream_audio import AudioPayloadPreparer
+
 
 def find_available_port(start_port: int = 1025, max_attempts: int = 25) -> int:
     """
@@ -81,6 +91,12 @@ class WebSocketServer:
         self.router = APIRouter()
         self.connected_clients: List[WebSocket] = []
         self.open_llm_vtuber_main_config = open_llm_vtuber_main_config
+        # one warm upstream connection pool for the Claude requests of all clients
+        self.claude_proxy = ClaudeProxy.from_config(
+            open_llm_vtuber_main_config.get("claude"),
+            open_llm_vtuber_main_config.get("CLAUDE_PROXY"),
+        )
+        self.app.add_event_handler("shutdown", self.claude_proxy.aclose)
 
         # Add CORS middleware - Updated for Vite development
         self.app.add_middleware(
@@ -125,8 +141,11 @@ class WebSocketServer:
         
 
     async def _handle_config_switch(
-        self, websocket: WebSocket, config_file: str
-    ) -> tuple[Live2dModel, OpenLLMVTuberMain] | None:
+        self,
+        websocket: WebSocket,
+        config_file: str,
+        previous: "OpenLLMVTuberMain | None" = None,
+    ) -> "tuple[Live2dModel, OpenLLMVTuberMain] | None":
         new_config = self._load_config_from_file(config_file)
         if new_config:
             try:
@@ -134,6 +153,9 @@ class WebSocketServer:
                     self.model_manager.update_models(new_config)
 
                 self.open_llm_vtuber_main_config.update(new_config)
+                # the session ends here, the new one may continue the same journal
+                if previous is not None:
+                    previous.close()
 
                 loop = asyncio.get_event_loop()
                 l2d, open_llm_vtuber, _ = self._initialize_components(websocket, loop)
@@ -168,8 +190,11 @@ class WebSocketServer:
 
     def _initialize_components(
         self, websocket: WebSocket, loop
-    ) -> tuple[Live2dModel, OpenLLMVTuberMain, AudioPayloadPreparer]:
+    ) -> "tuple[Live2dModel, OpenLLMVTuberMain, AudioPayloadPreparer]":
         """Initialize or reinitialize components with current configuration."""
+        from module.openllm_vtuber_main import OpenLLMVTuberMain
+        from tts.stream_audio import AudioPayloadPreparer
+
         l2d = Live2dModel(self.open_llm_vtuber_main_config["LIVE2D_MODEL"])
 
         # Use cached models if available
@@ -280,6 +305,11 @@ class WebSocketServer:
                 "version": "1.0.0"
             }
 
+        @self.app.get("/metrics")
+        async def metrics_endpoint():
+            """Counters and latency/size summaries collected by the pipeline stages"""
+            return metrics.snapshot()
+
         # Mock TTS endpoint for development
         class TTSRequest(BaseModel):
             text: str
@@ -321,43 +351,82 @@ class WebSocketServer:
         class ClaudeRequest(BaseModel):
             text: str
             max_tokens: int = 500
+            system: str | List[Dict[str, Any]] | None = None  # blocks may carry cache_control
+            messages: List[Dict[str, Any]] | None = None
+            stream: bool = False
+
+        def _claude_client_id(http_request: Request) -> str:
+            # desktop clients on one machine share an address, they can tell themselves apart
+            return http_request.headers.get("x-client-id") or (
+                http_request.client.host if http_request.client else "unknown"
+            )
+
+        def _claude_events(request: ClaudeRequest, http_request: Request) -> StreamingResponse:
+            payload = request.model_dump(exclude_none=True, exclude={"stream"})
+            client_id = _claude_client_id(http_request)
+
+            async def relay_events():
+                try:
+                    async for chunk in self.claude_proxy.stream(payload, client_id):
+                        yield chunk
+                except ClaudeProxyError as e:
+                    yield _sse({"error": str(e)})
+
+            async def mock_events():
+                # Same event format as the AWS endpoint, for frontend development
+                for word in f"Mock Claude response to: {request.text}".split(" "):
+                    yield _sse({"delta": word + " "})
+                    await asyncio.sleep(0.02)
+                yield _sse({"done": True})
+
+            return StreamingResponse(
+                relay_events() if self.claude_proxy.base_url or self.claude_proxy.stream_url else mock_events(),
+                media_type="text/event-stream",
+                headers={"cache-control": "no-cache"},
+            )
 
         @self.app.post("/claude")
-        async def claude_endpoint(request: ClaudeRequest):
-            """Claude API endpoint - Proxy to AWS Claude API"""
+        async def claude_endpoint(request: ClaudeRequest, http_request: Request):
+            """Claude API endpoint - Proxy to AWS Claude API
+
+            Answers with the JSON reply, or with server-sent events when the caller asks for
+            `text/event-stream` (or sends `"stream": true`).
+            """
             logger.info(f"Claude request: {request.text[:50]}...")
-            
-            try:
-                # Use the existing OpenLLMVTuberMain to handle Claude requests
-                # This ensures we use the same Claude configuration as the WebSocket interface
-                if hasattr(self, 'open_llm_vtuber_main_config'):
-                    claude_config = self.open_llm_vtuber_main_config.get('claude', {})
-                    base_url = claude_config.get('BASE_URL')
-                    model = claude_config.get('MODEL')
-                    
-                    if base_url and model:
-                        # For now, return a mock response that matches the expected format
-                        # TODO: Implement actual AWS Claude API call
-                        return {
-                            "reply": f"Mock Claude response to: {request.text}. (AWS endpoint: {base_url}, Model: {model})",
-                            "status": "success",
-                            "tokens_used": len(request.text.split()) * 2
-                        }
-                
-                # Fallback mock response
+            if request.stream or "text/event-stream" in http_request.headers.get("accept", ""):
+                return _claude_events(request, http_request)
+
+            if not self.claude_proxy.base_url:
+                # Fallback mock response, for frontend development
                 return {
                     "reply": f"Mock Claude response to: {request.text}",
                     "status": "success",
                     "tokens_used": len(request.text.split()) * 2
                 }
-                
-            except Exception as e:
-                logger.error(f"Claude endpoint error: {e}")
+
+            try:
+                data = await self.claude_proxy.complete(
+                    request.model_dump(exclude_none=True, exclude={"stream"}),
+                    _claude_client_id(http_request),
+                )
+                usage = data.get("usage") or {}
                 return {
-                    "reply": f"Error processing request: {str(e)}",
-                    "status": "error",
-                    "tokens_used": 0
+                    **data,
+                    "status": "success",
+                    "tokens_used": usage.get("input_tokens", 0) + usage.get("output_tokens", 0),
                 }
+            except ClaudeProxyError as e:
+                logger.error(f"Claude endpoint error: {e}")
+                return JSONResponse(
+                    status_code=e.status_code if e.status_code == 429 else 502,
+                    content={"error": str(e), "reply": f"Error processing request: {e}", "status": "error", "tokens_used": 0},
+                )
+
+        @self.app.post("/claude/stream")
+        async def claude_stream_endpoint(request: ClaudeRequest, http_request: Request):
+            """Streaming Claude endpoint - relays server-sent events from the AWS streaming endpoint"""
+            logger.info(f"Claude stream request: {request.text[:50]}...")
+            return _claude_events(request, http_request)
 
         # WebSocket echo endpoint for testing
         @self.app.websocket("/ws/echo")
@@ -433,6 +502,8 @@ class WebSocketServer:
 
         @self.app.websocket("/client-ws")
         async def websocket_endpoint(websocket: WebSocket):
+            import numpy as np
+
             loop = asyncio.get_event_loop()
             await websocket.accept()
             await websocket.send_text(
@@ -577,9 +648,24 @@ class WebSocketServer:
                                         "text": "conversation-chain-start",
                                     })
                                 )
+                                conversation_input = user_input
+                                if isinstance(conversation_input, np.ndarray) and open_llm_vtuber.asr:
+                                    # transcribe here so that a long decode never blocks the event loop
+                                    conversation_input = await open_llm_vtuber.transcribe_async(
+                                        conversation_input
+                                    )
+                                    tracker = open_llm_vtuber.language_tracker
+                                    if tracker is not None and tracker.language:
+                                        await websocket.send_text(
+                                            json.dumps({
+                                                "type": "asr-language",
+                                                "language": tracker.language,
+                                                "pinned": tracker.pinned_language is not None,
+                                            })
+                                        )
                                 await asyncio.to_thread(
                                     open_llm_vtuber.conversation_chain,
-                                    user_input=user_input,
+                                    user_input=conversation_input,
                                     clipboard_data=clipboard_data if "clipboard_data" in locals() else None
                                 )
                                 await websocket.send_text(
@@ -621,7 +707,7 @@ class WebSocketServer:
                         config_file = data.get("file")
                         if config_file:
                             result = await self._handle_config_switch(
-                                websocket, config_file
+                                websocket, config_file, previous=open_llm_vtuber
                             )
                             if result:
                                 l2d, open_llm_vtuber = result
@@ -638,6 +724,8 @@ class WebSocketServer:
             except WebSocketDisconnect:
                 print("Client disconnected")
                 self.connected_clients.remove(websocket)
+                if open_llm_vtuber is not None:
+                    open_llm_vtuber.close()
                 open_llm_vtuber = None
 
     def _scan_config_alts_directory(self) -> List[str]:
@@ -645,28 +733,17 @@ class WebSocketServer:
         config_alts_dir = self.open_llm_vtuber_main_config.get(
             "CONFIG_ALTS_DIR", "config_alts"
         )
-        
-        # Check if the directory exists
-        if not os.path.exists(config_alts_dir):
-            logger.warning(f"Config alternatives directory {config_alts_dir} does not exist")
-            return config_files
-            
-        # Scan the directory for YAML files
         try:
-            for root, _, files in os.walk(config_alts_dir):
-                for file in files:
-                    if file.endswith((".yaml", ".yml")):
-                        # Only add the file name, not the full path
-                        config_files.append(file)
-                        logger.info(f"Found config file: {file}")
+            # Only the file names, not the full paths
+            config_files.extend(config_store.list_configs(config_alts_dir))
         except Exception as e:
             logger.error(f"Error scanning config directory: {e}")
-            
+
         return config_files
 
     def _load_config_from_file(self, filename: str) -> Dict:
         """
-        Load configuration from a YAML file with robust encoding handling.
+        Load a configuration file, from the config cache when it has not changed.
 
         Args:
             filename: Name of the config file
@@ -675,63 +752,20 @@ class WebSocketServer:
             Dict: Loaded configuration or None if loading fails
         """
         if filename == "conf.yaml":
-            try:
-                config = load_config_with_env("conf.yaml")
-                logger.info("Successfully loaded conf.yaml")
-                return config
-            except Exception as e:
-                logger.error(f"Error loading conf.yaml: {e}")
-                return None
-
-        config_alts_dir = self.open_llm_vtuber_main_config.get(
-            "CONFIG_ALTS_DIR", "config_alts"
-        )
-        file_path = os.path.join(config_alts_dir, filename)
-
-        if not os.path.exists(file_path):
-            logger.error(f"Config file not found: {file_path}")
-            return None
-
-        logger.info(f"Loading config file: {file_path}")
-        
-        # Try common encodings first
-        encodings = ["utf-8", "utf-8-sig", "gbk", "gb2312", "ascii"]
-        content = None
-
-        for encoding in encodings:
-            try:
-                with open(file_path, "r", encoding=encoding) as file:
-                    content = file.read()
-                    logger.info(f"Successfully read file with encoding: {encoding}")
-                    break
-            except UnicodeDecodeError:
-                continue
-
-        if content is None:
-            # Try detecting encoding as last resort
-            try:
-                with open(file_path, "rb") as file:
-                    raw_data = file.read()
-                detected = chardet.detect(raw_data)
-                if detected["encoding"]:
-                    content = raw_data.decode(detected["encoding"])
-                    logger.info(f"Successfully read file with detected encoding: {detected['encoding']}")
-            except Exception as e:
-                logger.error(
-                    f"Error detecting encoding for config file {file_path}: {e}"
-                )
+            file_path = "conf.yaml"
+        else:
+            config_alts_dir = self.open_llm_vtuber_main_config.get(
+                "CONFIG_ALTS_DIR", "config_alts"
+            )
+            file_path = config_store.list_configs(config_alts_dir).get(filename)
+            if file_path is None:
+                logger.error(f"Config file not found: {filename} in {config_alts_dir}")
                 return None
 
         try:
-            config = yaml.safe_load(content)
-            logger.info(f"Successfully parsed YAML from {file_path}")
-            
-            # Log the loaded configuration for debugging
-            logger.info(f"Loaded configuration: {config}")
-            
-            return config
-        except yaml.YAMLError as e:
-            logger.error(f"Error parsing YAML from {file_path}: {e}")
+            return load_config_with_env(file_path)
+        except Exception as e:
+            logger.error(f"Error loading config file {file_path}: {e}")
             return None
 
     def _scan_bg_directory(self) -> List[str]:
@@ -815,39 +849,6 @@ class WebSocketServer:
         self.model_manager.cache.clear()
 
 
-def load_config_with_env(path) -> dict:
-    """
-    Load the configuration file with environment variables.
-
-    Parameters:
-    - path (str): The path to the configuration file.
-
-    Returns:
-    - dict: The configuration dictionary.
-
-    Raises:
-    - FileNotFoundError if the configuration file is not found.
-    - yaml.YAMLError if the configuration file is not a valid YAML file.
-    """
-    with open(path, "r", encoding="utf-8") as file:
-        content = file.read()
-
-    # Match ${VAR_NAME}
-    pattern = re.compile(r"\$\{(\w+)\}")
-
-    # replace ${VAR_NAME} with os.getenv('VAR_NAME')
-    def replacer(match):
-        env_var = match.group(1)
-        return os.getenv(
-            env_var, match.group(0)
-        )  # return the original string if the env var is not found
-
-    content = pattern.sub(replacer, content)
-
-    # Load the yaml file
-    return yaml.safe_load(content)
-
-
 class ModelCache:
     """Manager for caching ASR and TTS models"""
 
@@ -892,7 +893,12 @@ class ModelManager:
 
         asr_model = self.config.get("ASR_MODEL")
         asr_config = self.config.get(asr_model, {})
-        self.cache.set("asr", ASRFactory.get_asr_system(asr_model, **asr_config))
+        worker_processes = self.config.get("ASR_WORKER_PROCESSES", 0)
+        if worker_processes:
+            asr = ASRFactory.get_pooled_asr_system(asr_model, worker_processes, **asr_config)
+        else:
+            asr = ASRFactory.get_asr_system(asr_model, **asr_config)
+        self.cache.set("asr", asr)
         logger.info(f"ASR model {asr_model} loaded successfully")
 
     def _init_tts(self) -> None:
@@ -1000,9 +1006,17 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="")
     parser.add_argument("--web", action="store_true", help="Web mode")
     parser.add_argument("--port", type=int, help="Port to run the server on")
+    parser.add_argument(
+        "--profile-imports",
+        action="store_true",
+        help="Print the import time of every module once the server is set up",
+    )
     args = parser.parse_args()
 
+    from asr.asr_worker_pool import shutdown_worker_pools
+
     atexit.register(WebSocketServer.clean_cache)
+    atexit.register(shutdown_worker_pools)
     
     # Load configurations from yaml file
     config = load_config_with_env("conf.yaml")
@@ -1023,6 +1037,12 @@ if __name__ == "__main__":
     
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
-    
+
+    if args.profile_imports:
+        from utils.import_profiler import import_profiler
+
+        print(import_profiler.report(), file=sys.stderr)
+        print(import_profiler.report(top=20), file=sys.stderr)
+
     logger.info(f"Starting server with configuration: HOST={config.get('HOST', '0.0.0.0')}, PORT={port}")
     server.run(host=config.get("HOST", "0.0.0.0"), port=port)
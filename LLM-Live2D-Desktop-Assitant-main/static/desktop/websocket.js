@@ -339,6 +339,12 @@ function handleWebSocketMessage(data) {
             }
             break;
             
+        case 'asr-language':
+            // Language detected (or pinned) by the server-side ASR for this session
+            window.asrLanguage = data.language;
+            window.asrLanguagePinned = data.pinned;
+            break;
+            
         case 'set-model':
             // Update Live2D model
             if (window.updateLive2DModel) {
@@ -0,0 +1,87 @@
+"""
+Test that the ASR worker pool survives a worker that dies while it holds a job.
+
+The workers run a fake model: the first sample of the audio says how long the decode
+takes, so a job can be kept in a worker while the test kills it.
+"""
+
+import os
+import sys
+import time
+import unittest
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from asr.asr_interface import TranscriptionResult
+from asr.asr_worker_pool import ASRWorkerPool, _serve
+
+
+class SleepingASR:
+    """Sleeps for `audio[0]` seconds and returns the number of samples."""
+
+    def transcribe_np_detailed(self, audio, language=None):
+        time.sleep(float(audio[0]))
+        return TranscriptionResult(text=str(audio.size), language=language)
+
+
+def _fake_worker(system_name, asr_kwargs, job_queue, connection):
+    _serve(SleepingASR(), job_queue, connection)
+
+
+class FakePool(ASRWorkerPool):
+    _worker_target = staticmethod(_fake_worker)
+
+
+def wait_until(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestASRWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FakePool("fake", num_workers=1)
+        self.assertTrue(self.pool.wait_ready(timeout=30))
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_transcribe(self):
+        result = self.pool.submit(np.zeros(160, dtype=np.float32), language="en").result(timeout=10)
+        self.assertEqual(result.text, "160")
+        self.assertEqual(result.language, "en")
+
+    def test_worker_killed_with_a_job(self):
+        audio = np.full(320, 60, dtype=np.float32)
+        future = self.pool.submit(audio)
+        self.assertTrue(wait_until(lambda: self.pool._jobs))
+        shm_name = self.pool._pending[self.pool._jobs[0]][1].name
+        # a job that waits for the worker
+        queued = self.pool.submit(np.zeros(80, dtype=np.float32))
+        old_process = self.pool._processes[0]
+        old_process.kill()
+
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=10)
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=shm_name)
+
+        # the worker is started again and takes the queued job
+        self.assertEqual(queued.result(timeout=30).text, "80")
+        self.assertIsNot(self.pool._processes[0], old_process)
+        self.assertTrue(self.pool._processes[0].is_alive())
+        self.assertEqual(self.pool.submit(np.zeros(16, dtype=np.float32)).result(timeout=10).text, "16")
+
+
+if __name__ == "__main__":
+    unittest.main()
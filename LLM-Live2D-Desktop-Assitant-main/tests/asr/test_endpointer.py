@@ -0,0 +1,177 @@
+"""
+Test when the adaptive endpointer ends a turn, and that the recognizer reuses the partial
+transcript it was given.
+
+The recognizer is fed frames directly; the audio stream and the VAD model are not opened.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from asr.asr_with_vad import SAMPLE_RATE, VAD_SIZE, VoiceRecognitionVAD
+from asr.endpointer import AdaptiveEndpointer
+
+FRAME = np.zeros(SAMPLE_RATE * VAD_SIZE // 1000, dtype=np.float32)
+
+
+class FakeStream:
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FrameFedRecognizer(VoiceRecognitionVAD):
+    """Takes its frames and their VAD result from the test instead of the microphone."""
+
+    def _setup_audio_stream(self):
+        self.input_stream = FakeStream()
+
+    def _setup_vad_model(self):
+        self.vad_model = None
+
+
+class FakeTranscriber:
+    """Returns the given texts in turn and counts the frames of each call."""
+
+    def __init__(self, *texts: str) -> None:
+        self.texts = list(texts)
+        self.frames = []
+
+    def __call__(self, audio: np.ndarray) -> str:
+        self.frames.append(len(audio) // len(FRAME))
+        return self.texts.pop(0)
+
+
+class TestLooksComplete(unittest.TestCase):
+
+    def test_terminal_punctuation(self):
+        self.assertTrue(AdaptiveEndpointer.looks_complete("I went to the store."))
+        self.assertTrue(AdaptiveEndpointer.looks_complete('He said "stop!"'))
+        self.assertFalse(AdaptiveEndpointer.looks_complete("I went to the store"))
+        self.assertFalse(AdaptiveEndpointer.looks_complete("  "))
+        self.assertFalse(AdaptiveEndpointer.looks_complete(None))
+
+    def test_dangling_word_after_whisper_period(self):
+        for text in ("I went to the.", "I was tired and.", "It was, um...", "Because?"):
+            with self.subTest(text=text):
+                self.assertFalse(AdaptiveEndpointer.looks_complete(text))
+        # only as the last word
+        self.assertTrue(AdaptiveEndpointer.looks_complete("Bread and butter."))
+
+    def test_cjk_terminator(self):
+        for text in ("今天天气很好。", "本当ですか？", "やった！", "他说「好了。」"):
+            with self.subTest(text=text):
+                self.assertTrue(AdaptiveEndpointer.looks_complete(text))
+        self.assertFalse(AdaptiveEndpointer.looks_complete("今天天气"))
+
+    def test_question_without_punctuation(self):
+        self.assertTrue(AdaptiveEndpointer.looks_complete("what time is it"))
+        self.assertTrue(AdaptiveEndpointer.looks_complete("Can you hear me"))
+        # too short to be sure, or cut off
+        self.assertFalse(AdaptiveEndpointer.looks_complete("what is"))
+        self.assertFalse(AdaptiveEndpointer.looks_complete("what is the"))
+        self.assertFalse(AdaptiveEndpointer.looks_complete("the weather is nice"))
+
+
+class TestAdaptiveEndpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.endpointer = AdaptiveEndpointer(short_pause_ms=400, max_pause_ms=1300, margin_ms=200)
+
+    def test_should_end(self):
+        self.assertFalse(self.endpointer.should_end(350, "What time is it?"))
+        self.assertTrue(self.endpointer.should_end(400, "What time is it?"))
+        self.assertFalse(self.endpointer.should_end(1250, "I went to the."))
+        self.assertFalse(self.endpointer.should_end(1250, None))
+        self.assertTrue(self.endpointer.should_end(1300, None))
+
+    def test_learned_pause(self):
+        self.endpointer.observe_pause(600)
+        self.endpointer.observe_pause(700)
+        # too few pauses to go by
+        self.assertEqual(self.endpointer.long_pause_ms, 1300)
+        self.endpointer.observe_pause(650)
+        self.assertEqual(self.endpointer.long_pause_ms, 900)
+        self.endpointer.observe_pause(0)
+        self.assertEqual(self.endpointer.long_pause_ms, 900)
+
+    def test_learned_pause_is_clamped(self):
+        for _ in range(3):
+            self.endpointer.observe_pause(100)
+        self.assertEqual(self.endpointer.long_pause_ms, 400)
+        self.endpointer.observe_pause(2000)
+        self.assertEqual(self.endpointer.long_pause_ms, 1300)
+
+    def test_old_pauses_are_forgotten(self):
+        endpointer = AdaptiveEndpointer(short_pause_ms=400, max_pause_ms=1300, margin_ms=200, history=3)
+        for pause_ms in (1000, 300, 300, 300):
+            endpointer.observe_pause(pause_ms)
+        self.assertEqual(endpointer.long_pause_ms, 500)
+
+
+class TestPartialTranscript(unittest.TestCase):
+
+    def make_recognizer(self, transcriber: FakeTranscriber) -> FrameFedRecognizer:
+        recognizer = FrameFedRecognizer(transcriber)
+        self.addCleanup(recognizer._asr_executor.shutdown)
+        return recognizer
+
+    def speak(self, recognizer: FrameFedRecognizer, *frames: bool, max_silence: int = 100):
+        """Feed frames with the given VAD results, then silence until the turn ends."""
+        for voiced in frames:
+            result = recognizer._handle_audio_sample(FRAME, voiced)
+            self.assertIsNone(result)
+        for silent in range(1, max_silence + 1):
+            result = recognizer._handle_audio_sample(FRAME, False)
+            if result is not None:
+                return result, silent * VAD_SIZE
+            # let a partial transcript finish before the next frame, as a real pause would
+            if recognizer._partial is not None:
+                recognizer._partial.exception()
+        self.fail("the turn did not end")
+
+    def test_complete_partial_ends_the_turn_early(self):
+        transcriber = FakeTranscriber("What time is it?")
+        recognizer = self.make_recognizer(transcriber)
+        text, pause_ms = self.speak(recognizer, *[True] * 10)
+        self.assertEqual(text, "What time is it?")
+        self.assertLess(pause_ms, 1300)
+        # the partial transcript is the final one
+        self.assertEqual(len(transcriber.frames), 1)
+
+    def test_incomplete_partial_is_reused(self):
+        transcriber = FakeTranscriber("I went to the")
+        recognizer = self.make_recognizer(transcriber)
+        text, pause_ms = self.speak(recognizer, *[True] * 10)
+        self.assertEqual(text, "I went to the")
+        self.assertEqual(pause_ms, 1300)
+        # only silence came after it, so it was not transcribed again
+        self.assertEqual(len(transcriber.frames), 1)
+
+    def test_speech_after_the_partial_discards_it(self):
+        transcriber = FakeTranscriber("I went to the", "I went to the store.")
+        recognizer = self.make_recognizer(transcriber)
+        for voiced in [True] * 10 + [False] * 9:
+            recognizer._handle_audio_sample(FRAME, voiced)
+        recognizer._partial.exception()
+        text, _ = self.speak(recognizer, *[True] * 5)
+        self.assertEqual(text, "I went to the store.")
+        # the second partial includes the new speech and is the final transcript
+        self.assertEqual(len(transcriber.frames), 2)
+        self.assertGreater(transcriber.frames[1], transcriber.frames[0] + 5)
+        # the pause inside the turn was learned
+        self.assertEqual(list(recognizer.endpointer._pauses), [9 * VAD_SIZE])
+
+
+if __name__ == "__main__":
+    unittest.main()
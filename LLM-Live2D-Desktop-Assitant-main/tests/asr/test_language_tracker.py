@@ -0,0 +1,60 @@
+"""
+Test when the language tracker pins the session language and when it lets go.
+"""
+
+import os
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from asr.asr_interface import TranscriptionResult
+from asr.language_tracker import LanguageTracker
+
+
+def whisper_result(language: str, probability: float = 0.95, avg_logprob: float = -0.3):
+    return TranscriptionResult(
+        text="hello", language=language, language_probability=probability, avg_logprob=avg_logprob
+    )
+
+
+class TestLanguageTracker(unittest.TestCase):
+
+    def test_pins_confident_detections(self):
+        tracker = LanguageTracker(pin_after=3)
+        for _ in range(2):
+            tracker.observe(whisper_result("en"))
+        self.assertIsNone(tracker.pinned_language)
+        tracker.observe(whisper_result("en"))
+        self.assertEqual(tracker.pinned_language, "en")
+
+    def test_unsure_detection_resets_the_streak(self):
+        tracker = LanguageTracker(pin_after=2)
+        tracker.observe(whisper_result("en"))
+        tracker.observe(whisper_result("en", probability=0.5))
+        tracker.observe(whisper_result("en"))
+        self.assertIsNone(tracker.pinned_language)
+
+    def test_low_confidence_drops_the_pin(self):
+        tracker = LanguageTracker(pin_after=1, redetect_logprob=-1.0)
+        tracker.observe(whisper_result("en"))
+        tracker.observe(whisper_result("en", avg_logprob=-2.0))
+        self.assertIsNone(tracker.pinned_language)
+
+    def test_no_confidence_never_pins(self):
+        # FunASR reports the language tag only
+        tracker = LanguageTracker(pin_after=1)
+        for _ in range(5):
+            tracker.observe(TranscriptionResult(text="你好", language="zh"))
+        self.assertIsNone(tracker.pinned_language)
+        self.assertEqual(tracker.language, "zh")
+
+        tracker.observe(TranscriptionResult(text="hi", language="en", language_probability=0.99))
+        self.assertIsNone(tracker.pinned_language)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Test the wake word gate of the recognizer: the fuzzy match, the awake window, and speech
+dropped before the full transcription.
+
+The recognizer is fed frames directly; the audio stream and the VAD model are not opened.
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from asr.asr_with_vad import (
+    PAUSE_LIMIT,
+    SAMPLE_RATE,
+    VAD_SIZE,
+    WAKE_CHECK_SIZE,
+    VoiceRecognitionVAD,
+    _levenshtein,
+)
+
+FRAME = np.zeros(SAMPLE_RATE * VAD_SIZE // 1000, dtype=np.float32)
+
+
+class FakeStream:
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FrameFedRecognizer(VoiceRecognitionVAD):
+    """Takes its frames and their VAD result from the test instead of the microphone."""
+
+    def _setup_audio_stream(self):
+        self.input_stream = FakeStream()
+
+    def _setup_vad_model(self):
+        self.vad_model = None
+
+
+class FakeTranscriber:
+    """Always returns `text` and counts the frames of each call."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.frames = []
+
+    def __call__(self, audio: np.ndarray) -> str:
+        self.frames.append(len(audio) // len(FRAME))
+        return self.text
+
+
+class TestWakeWordMatch(unittest.TestCase):
+
+    def make_recognizer(self, wake_word: str) -> FrameFedRecognizer:
+        recognizer = FrameFedRecognizer(FakeTranscriber(""), wake_word=wake_word)
+        self.addCleanup(recognizer._asr_executor.shutdown)
+        return recognizer
+
+    def test_levenshtein(self):
+        self.assertEqual(_levenshtein("computer", "computer"), 0)
+        self.assertEqual(_levenshtein("computer", "compute"), 1)
+        self.assertEqual(_levenshtein("commuter", "computer"), 1)
+        self.assertEqual(_levenshtein("", "abc"), 3)
+
+    def test_single_word(self):
+        recognizer = self.make_recognizer("Computer")
+        self.assertTrue(recognizer._wakeword_detected("Computer, lights on."))
+        self.assertTrue(recognizer._wakeword_detected("ok computor what time is it"))
+        self.assertFalse(recognizer._wakeword_detected("put it on the compost"))
+        self.assertFalse(recognizer._wakeword_detected(""))
+
+    def test_multi_word_phrase(self):
+        recognizer = self.make_recognizer("hey computer")
+        self.assertTrue(recognizer._wakeword_detected("Hey, computer! What time is it?"))
+        self.assertTrue(recognizer._wakeword_detected("so hey computor turn it off"))
+        # the words have to be next to each other
+        self.assertFalse(recognizer._wakeword_detected("hey there computer"))
+        # one edit over the whole phrase is allowed, two are not
+        self.assertFalse(recognizer._wakeword_detected("hay computor"))
+        self.assertFalse(recognizer._wakeword_detected("computer"))
+
+
+class TestWakeWordGate(unittest.TestCase):
+
+    def setUp(self):
+        self.wake = FakeTranscriber("computer")
+        self.full = FakeTranscriber("computer, turn on the lights")
+        self.recognizer = FrameFedRecognizer(
+            self.full,
+            wake_word="computer",
+            wake_word_transcribe_func=self.wake,
+            awake_window=30,
+            adaptive_endpointing=False,
+        )
+        self.addCleanup(self.recognizer._asr_executor.shutdown)
+
+    def speak(self, voiced_frames: int):
+        """An utterance of `voiced_frames` frames followed by the pause that ends it."""
+        results = []
+        for voiced in [True] * voiced_frames + [False] * (PAUSE_LIMIT // VAD_SIZE):
+            result = self.recognizer._handle_audio_sample(FRAME, voiced)
+            if result is not None:
+                results.append(result)
+                self.recognizer.reset()
+        return results
+
+    def test_wake_word_opens_the_awake_window(self):
+        self.assertTrue(self.recognizer._wake_word_gate_active())
+        self.assertEqual(self.speak(40), ["computer, turn on the lights"])
+        # only the start of the utterance was checked
+        self.assertEqual(self.wake.frames, [WAKE_CHECK_SIZE // VAD_SIZE])
+        self.assertEqual(len(self.full.frames), 1)
+        self.assertFalse(self.recognizer._wake_word_gate_active())
+
+        # while awake, speech is not checked and every utterance extends the window
+        awake_until = self.recognizer.awake_until
+        self.full.text = "and the kitchen"
+        self.assertEqual(self.speak(40), ["and the kitchen"])
+        self.assertEqual(len(self.wake.frames), 1)
+        self.assertGreater(self.recognizer.awake_until, awake_until)
+
+    def test_window_closes(self):
+        self.speak(40)
+        self.recognizer.awake_until = 0.0
+        self.assertTrue(self.recognizer._wake_word_gate_active())
+        self.wake.text = "turn on the lights"
+        self.assertEqual(self.speak(WAKE_CHECK_SIZE // VAD_SIZE), [])
+        self.assertEqual(len(self.wake.frames), 2)
+
+    def test_speech_without_the_wake_word_is_dropped(self):
+        self.wake.text = "turn on the lights"
+        self.assertEqual(self.speak(WAKE_CHECK_SIZE // VAD_SIZE), [])
+        # dropped as soon as WAKE_CHECK_SIZE ms were heard, without the full transcription
+        self.assertEqual(self.wake.frames, [WAKE_CHECK_SIZE // VAD_SIZE])
+        self.assertEqual(self.full.frames, [])
+        self.assertFalse(self.recognizer.recording_started)
+        self.assertTrue(self.recognizer._wake_word_gate_active())
+
+    def test_short_utterance(self):
+        """An utterance that ends before WAKE_CHECK_SIZE ms were recorded is checked when it ends."""
+        self.wake.text = "lights"
+        self.assertEqual(self.speak(3), [])
+        self.assertEqual(self.full.frames, [])
+        checked = self.wake.frames[0]
+        self.assertLess(checked, WAKE_CHECK_SIZE // VAD_SIZE)
+
+        self.wake.text = "computer"
+        self.full.text = "computer"
+        self.assertEqual(self.speak(3), ["computer"])
+        self.assertFalse(self.recognizer._wake_word_gate_active())
+
+
+if __name__ == "__main__":
+    unittest.main()
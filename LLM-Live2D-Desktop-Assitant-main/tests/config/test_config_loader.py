@@ -0,0 +1,107 @@
+"""
+Test the cached, validated configuration loader on temporary configuration files.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from utils import config_loader
+from utils.config_loader import ConfigError, ConfigStore, validate_config
+
+
+class TestValidateConfig(unittest.TestCase):
+
+    def test_wrong_type(self):
+        with self.assertRaises(ConfigError) as error:
+            validate_config({"TTS_ON": "yes", "SERVER_PORT": 12393}, "conf.yaml")
+        self.assertEqual(error.exception.problems, ["TTS_ON should be bool, not str"])
+
+    def test_bool_is_not_an_int(self):
+        with self.assertRaises(ConfigError) as error:
+            validate_config({"SERVER_PORT": True})
+        self.assertEqual(error.exception.problems, ["SERVER_PORT should be int, not bool"])
+
+    def test_unknown_llm_provider(self):
+        self.assertEqual(validate_config({"LLM_PROVIDER": "Ollama"}), {"LLM_PROVIDER": "Ollama"})
+        with self.assertRaises(ConfigError) as error:
+            validate_config({"LLM_PROVIDER": "gpt"})
+        self.assertIn("LLM_PROVIDER 'gpt'", error.exception.problems[0])
+
+    def test_not_a_mapping(self):
+        with self.assertRaises(ConfigError):
+            validate_config(["LLM_PROVIDER"])
+
+
+class TestConfigStore(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "conf.yaml")
+        self.write("LLM_PROVIDER: ollama\n")
+        self.store = ConfigStore(check_interval_s=0)
+        self.parse_config = mock.patch.object(config_loader, "parse_config", wraps=config_loader.parse_config)
+        self.parsed = self.parse_config.start()
+        self.addCleanup(self.parse_config.stop)
+
+    def write(self, content: str) -> None:
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+    def test_environment_variables(self):
+        self.write("CLAUDE_API_KEY: ${CONFIG_LOADER_TEST_KEY}\nHOST: ${CONFIG_LOADER_TEST_UNSET}\n")
+        with mock.patch.dict(os.environ, {"CONFIG_LOADER_TEST_KEY": "secret"}):
+            os.environ.pop("CONFIG_LOADER_TEST_UNSET", None)
+            config = self.store.load(self.path)
+        # a variable that is not set is left as it is
+        self.assertEqual(config, {"CLAUDE_API_KEY": "secret", "HOST": "${CONFIG_LOADER_TEST_UNSET}"})
+
+    def test_unchanged_file_is_not_read_again(self):
+        first = self.store.load(self.path)
+        first["LLM_PROVIDER"] = "changed by the caller"
+        self.assertEqual(self.store.load(self.path), {"LLM_PROVIDER": "ollama"})
+        self.assertEqual(self.parsed.call_count, 1)
+
+    def test_changed_mtime_is_read_again(self):
+        self.store.load(self.path)
+        stat = os.stat(self.path)
+        self.write("LLM_PROVIDER: claude\n")
+        # same size, only the modification time tells the files apart
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(self.store.load(self.path), {"LLM_PROVIDER": "claude"})
+        self.assertEqual(self.parsed.call_count, 2)
+
+    def test_changed_size_is_read_again(self):
+        self.store.load(self.path)
+        stat = os.stat(self.path)
+        self.write("LLM_PROVIDER: failover\n")
+        # same modification time, only the size changed
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(self.store.load(self.path), {"LLM_PROVIDER": "failover"})
+        self.assertEqual(self.parsed.call_count, 2)
+
+    def test_check_interval(self):
+        store = ConfigStore(check_interval_s=60)
+        store.load(self.path)
+        self.write("LLM_PROVIDER: claude\n")
+        # within the interval the file is not looked at
+        self.assertEqual(store.load(self.path), {"LLM_PROVIDER": "ollama"})
+        self.assertEqual(self.parsed.call_count, 1)
+
+    def test_invalid_file(self):
+        self.write("LLM_PROVIDER: ollama\nVOICE_INPUT_ON: 1\n")
+        with self.assertRaises(ConfigError) as error:
+            self.store.load(self.path)
+        self.assertEqual(error.exception.path, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
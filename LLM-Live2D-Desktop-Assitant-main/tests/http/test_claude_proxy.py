@@ -0,0 +1,144 @@
+"""
+Test the Claude proxy of the server: identical requests sent upstream once, the per-client
+limit (429) and callers that hang up.
+
+The upstream endpoint is an `httpx.MockTransport`. Its replies wait for `release`, so the
+requests can be kept in flight while the test sends more.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+import httpx
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from utils.claude_proxy import ClaudeProxy, ClaudeProxyError, sse
+
+EVENTS = [sse({"delta": "Hello"}), sse({"delta": " there"}), sse({"done": True})]
+
+
+class FakeEndpoint:
+    """Counts the requests and answers them once `release` is set."""
+
+    def __init__(self) -> None:
+        self.requests = []
+        self.release = asyncio.Event()
+        self.streams_closed = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(json.loads(request.content))
+        if request.url.path.endswith("/stream"):
+            return httpx.Response(
+                200, headers={"content-type": "text/event-stream"}, content=self._events()
+            )
+        await self.release.wait()
+        return httpx.Response(200, json={"reply": f"reply {len(self.requests)}"})
+
+    async def _events(self):
+        try:
+            for event in EVENTS:
+                await self.release.wait()
+                yield event
+        finally:
+            self.streams_closed += 1
+
+
+async def read_all(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+class TestClaudeProxy(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.endpoint = FakeEndpoint()
+        self.proxy = ClaudeProxy(
+            "http://claude.test", stream_url="http://claude.test/stream", max_per_client=1, max_queued_per_client=1
+        )
+        self.proxy._client = httpx.AsyncClient(transport=httpx.MockTransport(self.endpoint.handle))
+
+    async def asyncTearDown(self):
+        self.endpoint.release.set()
+        await self.proxy.aclose()
+
+    async def test_identical_requests_are_sent_once(self):
+        payload = {"message": "hi"}
+        first = asyncio.create_task(self.proxy.complete(payload, "a"))
+        second = asyncio.create_task(self.proxy.complete(dict(payload), "b"))
+        await asyncio.sleep(0.05)
+        self.endpoint.release.set()
+        self.assertEqual(await first, {"reply": "reply 1"})
+        self.assertEqual(await second, {"reply": "reply 1"})
+        self.assertEqual(len(self.endpoint.requests), 1)
+
+        # once the reply is in, the same request is sent again
+        self.assertEqual(await self.proxy.complete(payload, "a"), {"reply": "reply 2"})
+        self.assertEqual(self.proxy._slots, {})
+
+    async def test_identical_streams_are_shared(self):
+        payload = {"message": "hi"}
+        first = asyncio.create_task(read_all(self.proxy.stream(payload, "a")))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(read_all(self.proxy.stream(payload, "b")))
+        await asyncio.sleep(0.05)
+        self.endpoint.release.set()
+        self.assertEqual(await first, b"".join(EVENTS))
+        self.assertEqual(await second, b"".join(EVENTS))
+        self.assertEqual(len(self.endpoint.requests), 1)
+
+    async def test_too_many_requests_from_one_client(self):
+        running = asyncio.create_task(self.proxy.complete({"message": "1"}, "a"))
+        queued = asyncio.create_task(self.proxy.complete({"message": "2"}, "a"))
+        await asyncio.sleep(0.05)
+        with self.assertRaises(ClaudeProxyError) as refused:
+            await self.proxy.complete({"message": "3"}, "a")
+        self.assertEqual(refused.exception.status_code, 429)
+        # the limit is per client
+        other = asyncio.create_task(self.proxy.complete({"message": "4"}, "b"))
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.endpoint.requests), 2)
+
+        self.endpoint.release.set()
+        await asyncio.gather(running, queued, other)
+        self.assertEqual(len(self.endpoint.requests), 3)
+        self.assertEqual(self.proxy._slots, {})
+
+    async def test_caller_hangs_up(self):
+        payload = {"message": "hi"}
+        leaving = asyncio.create_task(read_all(self.proxy.stream(payload, "a")))
+        staying = asyncio.create_task(read_all(self.proxy.stream(payload, "b")))
+        await asyncio.sleep(0.05)
+        leaving.cancel()
+        await asyncio.sleep(0.05)
+        # the other caller still gets the whole reply
+        self.endpoint.release.set()
+        self.assertEqual(await staying, b"".join(EVENTS))
+        self.assertEqual(len(self.endpoint.requests), 1)
+
+    async def test_every_caller_hangs_up(self):
+        payload = {"message": "hi"}
+        callers = [asyncio.create_task(read_all(self.proxy.stream(payload, client))) for client in "ab"]
+        await asyncio.sleep(0.05)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        # the upstream stream is closed and the slot given back
+        self.assertEqual(self.endpoint.streams_closed, 1)
+        self.assertEqual(self.proxy._streams, {})
+        self.assertEqual(self.proxy._slots, {})
+
+        # a new caller sends the request again
+        self.endpoint.release.set()
+        self.assertEqual(await read_all(self.proxy.stream(payload, "a")), b"".join(EVENTS))
+        self.assertEqual(len(self.endpoint.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
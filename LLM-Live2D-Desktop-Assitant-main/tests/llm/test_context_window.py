@@ -0,0 +1,81 @@
+"""
+Test the eviction of old turns from the context window into the summary.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from llm.context_window import SUMMARY_RETRIES, ContextWindow
+
+
+def conversation(turns: int) -> list[dict]:
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn}"})
+        messages.append({"role": "assistant", "content": f"answer {turn}"})
+    return messages
+
+
+class TestContextWindow(unittest.TestCase):
+
+    def make_window(self, summarizer) -> ContextWindow:
+        window = ContextWindow(max_history_cnt=4, evict_tokens=1, summarizer=summarizer)
+        for message in conversation(3):
+            window.append(message)
+        return window
+
+    def wait(self, window: ContextWindow) -> None:
+        # the summary runs on the window's single thread
+        window._executor.submit(lambda: None).result(timeout=5)
+
+    def test_summary_replaces_the_evicted_turns(self):
+        window = self.make_window(lambda system, prompt: "they talked")
+        window.trim()
+        self.wait(window)
+        self.assertEqual(window.summary, "they talked")
+        self.assertEqual(window.history, conversation(3)[2:])
+
+    def test_failed_summary_keeps_the_turns(self):
+        def fail(system, prompt):
+            raise RuntimeError("summarizer down")
+
+        window = self.make_window(fail)
+        for _ in range(SUMMARY_RETRIES):
+            window.trim()
+            self.wait(window)
+            self.assertEqual(window.history, conversation(3))
+            self.assertEqual(window.summary, "")
+        # then the chunk is dropped explicitly
+        window.trim()
+        self.wait(window)
+        self.assertEqual(window.history, conversation(3)[2:])
+        self.assertEqual(window.summary, "")
+
+    def test_clear_during_summary(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(system, prompt):
+            started.set()
+            release.wait(5)
+            return "stale summary"
+
+        window = self.make_window(slow)
+        window.trim()
+        self.assertTrue(started.wait(5))
+        window.clear()
+        release.set()
+        self.wait(window)
+        self.assertEqual(window.history, [])
+        self.assertEqual(window.summary, "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Test the circuit breaker and the race between the backends of the failover LLM.
+
+The backends are fakes that keep their history the way the real ones do. A backend with a
+gate holds its reply back until the gate is set, like a request waiting for its first
+token, and is closed by `cancel` unless it ignores it.
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from llm.failover_llm import CircuitBreaker, FailoverLLM
+from llm.llm_interface import LLMInterface
+
+
+class FakeLLM(LLMInterface):
+
+    def __init__(self, chunks: list[str], gate: threading.Event | None = None, ignore_cancel: bool = False):
+        self.chunks = chunks
+        self.gate = gate
+        self.ignore_cancel = ignore_cancel
+        self.history = []
+        self.cancelled = threading.Event()
+        self.cancel_calls = 0
+
+    def chat_iter(self, prompt, image_base64=None):
+        self.history.append({"role": "user", "content": prompt})
+        self.cancelled = cancelled = threading.Event()
+
+        def stream():
+            while self.gate is not None and not self.gate.is_set():
+                if cancelled.wait(0.01):
+                    raise ConnectionError("the request was closed")
+            yield from self.chunks
+            self.history.append({"role": "assistant", "content": "".join(self.chunks)})
+
+        return stream()
+
+    def cancel(self):
+        self.cancel_calls += 1
+        if not self.ignore_cancel:
+            self.cancelled.set()
+
+    def add_turn(self, prompt, reply):
+        self.history.append({"role": "user", "content": prompt})
+        self.history.append({"role": "assistant", "content": reply})
+
+    def replace_last_reply(self, reply):
+        if self.history and self.history[-1]["role"] == "assistant":
+            self.history[-1]["content"] = reply
+        else:
+            self.history.append({"role": "assistant", "content": reply})
+
+    def handle_interrupt(self, heard_response):
+        if self.history and self.history[-1]["role"] == "assistant":
+            self.history[-1]["content"] = heard_response + "..."
+        elif heard_response:
+            self.history.append({"role": "assistant", "content": heard_response + "..."})
+
+
+def conversation(*turns) -> list[dict]:
+    messages = []
+    for prompt, reply in turns:
+        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": reply})
+    return messages
+
+
+def wait_until(condition, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_after_the_threshold(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout_s=60)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_the_count(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout_s=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_trial_request_after_the_reset_timeout(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_s=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        # a failed trial opens it again right away
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_health_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout_s=60)
+        breaker.half_open()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        breaker.half_open()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+
+class TestFailoverLLM(unittest.TestCase):
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+
+    def make_llm(self, ignore_cancel: bool = False) -> FailoverLLM:
+        self.primary = FakeLLM(["slow ", "answer"], gate=self.gate, ignore_cancel=ignore_cancel)
+        self.secondary = FakeLLM(["fast ", "answer"])
+        return FailoverLLM(self.primary, self.secondary, first_token_timeout_s=0.05, probe_interval_s=60)
+
+    def test_hedge_wins_and_the_loser_is_closed(self):
+        llm = self.make_llm()
+        self.assertEqual("".join(llm.chat_iter("q1")), "fast answer")
+        self.assertGreaterEqual(self.primary.cancel_calls, 1)
+        expected = conversation(("q1", "fast answer"))
+        self.assertTrue(wait_until(lambda: self.primary.history == expected), self.primary.history)
+        self.assertEqual(self.secondary.history, expected)
+
+    def test_next_turn_does_not_wait_for_the_loser(self):
+        llm = self.make_llm(ignore_cancel=True)
+        self.assertEqual("".join(llm.chat_iter("q1")), "fast answer")
+
+        start = time.monotonic()
+        self.assertEqual("".join(llm.chat_iter("q2")), "fast answer")
+        llm.add_turn("q3", "cached answer")
+        self.assertLess(time.monotonic() - start, 1)
+        # the loser is still waiting for its first token of the first turn
+        self.assertEqual(self.primary.history, [{"role": "user", "content": "q1"}])
+
+        # once it stops, it is given the turns it missed, in order
+        self.gate.set()
+        expected = conversation(("q1", "fast answer"), ("q2", "fast answer"), ("q3", "cached answer"))
+        self.assertTrue(wait_until(lambda: self.primary.history == expected), self.primary.history)
+        self.assertEqual(self.secondary.history, expected)
+
+        # and it can take over again
+        self.assertEqual("".join(llm.chat_iter("q4")), "slow answer")
+        expected += conversation(("q4", "slow answer"))
+        self.assertEqual(self.primary.history, expected)
+        self.assertEqual(self.secondary.history, expected)
+
+    def test_interrupt_reaches_the_loser_later(self):
+        llm = self.make_llm(ignore_cancel=True)
+        reply = llm.chat_iter("q1")
+        self.assertEqual(next(reply), "fast ")
+        reply.close()
+        llm.handle_interrupt("fast")
+        self.assertEqual(self.secondary.history, conversation(("q1", "fast...")))
+
+        self.gate.set()
+        self.assertTrue(wait_until(lambda: self.primary.history == self.secondary.history), self.primary.history)
+
+    def test_every_backend_failed(self):
+        primary = FakeLLM(["Error occurred: down"])
+        secondary = FakeLLM([])
+        llm = FailoverLLM(primary, secondary, first_token_timeout_s=0.05, probe_interval_s=60)
+        self.assertEqual("".join(llm.chat_iter("q1")), "Error occurred: no reply")
+        self.assertEqual(primary.history[-1], {"role": "assistant", "content": ""})
+        self.assertEqual(secondary.history, conversation(("q1", "")))
+
+
+if __name__ == "__main__":
+    unittest.main()
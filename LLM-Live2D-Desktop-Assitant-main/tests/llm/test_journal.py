@@ -0,0 +1,83 @@
+"""
+Test that a restarted server continues the conversation from its journal.
+
+The first "server" is a separate interpreter that records a conversation and exits
+without closing the journal, like a server stopped with Ctrl+C.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from llm.journal import JOURNAL_DIR, ConversationJournal
+
+CONVERSATION = [
+    {"role": "user", "content": "My name is Ada."},
+    {"role": "assistant", "content": "Nice to meet you, Ada!"},
+    {"role": "user", "content": "Copy this: 剪贴板"},
+    {"role": "assistant", "content": "剪贴板"},
+]
+
+
+class TestConversationJournal(unittest.TestCase):
+
+    def test_off_by_default(self):
+        self.assertIsNone(ConversationJournal.from_config(None))
+        self.assertIsNone(ConversationJournal.from_config(False))
+        self.assertNotIn("cache", JOURNAL_DIR.replace("\\", "/").split("/"))
+
+    def test_restart_replays_the_journal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = {"DIR": directory}
+            code = textwrap.dedent(
+                f"""
+                import json, sys
+                sys.path.append({parent_dir!r})
+                from llm.journal import ConversationJournal
+                journal = ConversationJournal.from_config({config!r}, default_session_id="ollama-neuro")
+                for message in {CONVERSATION!r}[:-1]:
+                    journal.append(message)
+                journal.append({{"role": "assistant", "content": "剪"}})
+                # the reply was cut short by an interrupt, then completed
+                journal.update_last({CONVERSATION[-1]!r})
+                """
+            )
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=60)
+            self.assertEqual(result.returncode, 0, result.stderr)
+
+            journal = ConversationJournal.from_config(config, default_session_id="ollama-neuro")
+            try:
+                self.assertEqual(journal.session_id, "ollama-neuro")
+                self.assertEqual(journal.messages, CONVERSATION)
+            finally:
+                journal.close()
+
+            # another provider or persona is another conversation
+            other = ConversationJournal.from_config(config, default_session_id="ollama-firefly")
+            try:
+                self.assertEqual(other.messages, [])
+            finally:
+                other.close()
+
+    def test_session_id_is_a_file_name(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = ConversationJournal.from_config(
+                {"DIR": directory}, default_session_id="claude-../zh 米粒"
+            )
+            try:
+                self.assertEqual(journal.path.parent, Path(directory))
+            finally:
+                journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Test that the response cache replays a stored reply and forwards everything else to the
+backend it wraps.
+"""
+
+import os
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from llm.llm_interface import LLMInterface
+from llm.response_cache import CachedLLM, ResponseCache
+
+
+class FakeLLM(LLMInterface):
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def chat_iter(self, prompt, image_base64=None):
+        self.calls.append(("chat_iter", prompt))
+        yield "Hello "
+        yield "there."
+
+    def add_turn(self, prompt, reply):
+        self.calls.append(("add_turn", prompt, reply))
+
+    def replace_last_reply(self, reply):
+        self.calls.append(("replace_last_reply", reply))
+
+    def handle_interrupt(self, heard_response):
+        self.calls.append(("handle_interrupt", heard_response))
+
+    def cancel(self):
+        self.calls.append(("cancel",))
+
+    def health_check(self):
+        return False
+
+
+class TestCachedLLM(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = FakeLLM()
+        self.llm = CachedLLM(self.backend, ResponseCache(), persona="test", context_turns=0)
+
+    def test_hit_is_replayed(self):
+        self.assertEqual("".join(self.llm.chat_iter("Hi!")), "Hello there.")
+        self.assertEqual(list(self.llm.chat_iter("hi")), ["Hello ", "there."])
+        self.assertEqual(self.backend.calls, [("chat_iter", "Hi!"), ("add_turn", "hi", "Hello there.")])
+
+    def test_interface_methods_are_forwarded(self):
+        self.llm.replace_last_reply("Other.")
+        self.llm.handle_interrupt("Oth")
+        self.llm.cancel()
+        self.assertFalse(self.llm.health_check())
+        self.assertEqual(
+            self.backend.calls,
+            [("replace_last_reply", "Other."), ("handle_interrupt", "Oth"), ("cancel",)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,3 @@
+"""
+Text pipeline tests package.
+"""
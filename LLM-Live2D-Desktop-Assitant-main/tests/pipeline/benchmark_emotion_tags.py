@@ -0,0 +1,110 @@
+"""
+Benchmark the emotion tag handling of Live2dModel.
+
+Every spoken sentence has its tags removed twice (TTS worker, AudioManager) and its
+expressions extracted once (audio payload). Compares the old per-key loops with the
+compiled single-pass matcher, with and without the shared parse cache, and checks that
+they agree on a set of sentences first.
+
+Run it as a script:
+    python tests/pipeline/benchmark_emotion_tags.py
+"""
+
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from module.live2d_model import Live2dModel
+
+SENTENCES = [
+    "[joy] Hello there! It is so nice to see you again.",
+    "Well, that is a great question, let me think about it for a second.",
+    "[SmIrK] Hehe, you think you can handle the truth? [anger][anger]",
+    "I am not sure [confusion] what you mean by that, could you explain?",
+    "[sadness] Oh no. [surprise] Wait, really? [joy][joy] That is wonderful!",
+    "Brackets [like these] are not tags, and neither is [joy or [ this.",
+]
+
+
+def old_extract_emotion(emo_map: dict, str_to_check: str) -> list:
+    """The old Live2dModel.extract_emotion."""
+    expression_list = []
+    str_to_check = str_to_check.lower()
+    i = 0
+    while i < len(str_to_check):
+        if str_to_check[i] != "[":
+            i += 1
+            continue
+        for key in emo_map.keys():
+            emo_tag = f"[{key}]"
+            if str_to_check[i : i + len(emo_tag)] == emo_tag:
+                expression_list.append(emo_map[key])
+                i += len(emo_tag) - 1
+                break
+        i += 1
+    return expression_list
+
+
+def old_remove_emotion_keywords(emo_map: dict, target_str: str) -> str:
+    """The old Live2dModel.remove_emotion_keywords."""
+    lower_str = target_str.lower()
+    for key in emo_map.keys():
+        lower_key = f"[{key}]".lower()
+        while lower_key in lower_str:
+            start_index = lower_str.find(lower_key)
+            end_index = start_index + len(lower_key)
+            target_str = target_str[:start_index] + target_str[end_index:]
+            lower_str = lower_str[:start_index] + lower_str[end_index:]
+    return target_str
+
+
+def old_stages(model: Live2dModel, sentence: str) -> None:
+    old_remove_emotion_keywords(model.emo_map, sentence)
+    old_remove_emotion_keywords(model.emo_map, sentence)
+    old_extract_emotion(model.emo_map, sentence)
+
+
+def new_stages(model: Live2dModel, sentence: str) -> None:
+    model.remove_emotion_keywords(sentence)
+    model.remove_emotion_keywords(sentence)
+    model.extract_emotion(sentence)
+
+
+def uncached_stages(model: Live2dModel, sentence: str) -> None:
+    model._emotions.parse_uncached(sentence)
+
+
+def measure(stages, model: Live2dModel, sentences: list[str], rounds: int = 5) -> float:
+    """Best time per sentence, in microseconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for sentence in sentences:
+            stages(model, sentence)
+        best = min(best, time.perf_counter() - start)
+    return best / len(sentences) * 1e6
+
+
+def main():
+    model = Live2dModel("mashiro", model_dict_path=os.path.join(parent_dir, "model_dict.json"))
+    for sentence in SENTENCES:
+        assert model.remove_emotion_keywords(sentence) == old_remove_emotion_keywords(model.emo_map, sentence), sentence
+        assert model.extract_emotion(sentence) == old_extract_emotion(model.emo_map, sentence), sentence
+
+    # distinct sentences, like a long conversation
+    sentences = [f"{sentence} ({number})" for number in range(2000) for sentence in SENTENCES]
+    print(f"{len(model.emo_map)} emotions, {len(sentences)} sentences")
+    old = measure(old_stages, model, sentences)
+    print(f"per-key loops:           {old:7.2f} us/sentence")
+    for name, stages in [("single pass:", uncached_stages), ("single pass, shared:", new_stages)]:
+        elapsed = measure(stages, model, sentences)
+        print(f"{name:24s} {elapsed:7.2f} us/sentence ({old / elapsed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark the throughput of the streaming sentence splitter.
+
+Compares it with the old approach of running a full sentence check on the buffer after
+every character.
+
+Run it as a script:
+    python tests/pipeline/benchmark_sentence_splitter.py
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from module.sentence_splitter import SentenceSplitter
+from tests.pipeline.benchmark_token_pipeline import old_check
+
+
+def load_text(repeat: int = 100) -> str:
+    with open(os.path.join(current_dir, "sentence_corpus.json"), encoding="utf-8") as file:
+        corpus = json.load(file)
+    return " ".join(case["text"] for case in corpus) * repeat
+
+
+def old_split(text: str) -> int:
+    sentences = 0
+    sentence_buffer = ""
+    for char in text:
+        sentence_buffer += char
+        if old_check(sentence_buffer):
+            sentences += 1
+            sentence_buffer = ""
+    return sentences
+
+
+def new_split(tokens: list[str]) -> int:
+    splitter = SentenceSplitter()
+    sentences = 0
+    for token in tokens:
+        sentences += len(splitter.feed(token))
+    return sentences + len(splitter.flush())
+
+
+def best_of(function, argument, rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    text = load_text()
+    size = len(text.encode("utf-8")) / 1e6
+    tokens = re.findall(r"\s?\S{1,4}|\s", text)
+    print(f"{len(text)} characters, {len(tokens)} tokens")
+
+    old = best_of(old_split, text)
+    print(f"per-character check:  {size / old:7.2f} MB/s")
+    for name, argument in [("token chunks", tokens), ("single characters", list(text))]:
+        elapsed = best_of(new_split, argument)
+        print(f"splitter, {name + ':':19s}{size / elapsed:7.2f} MB/s ({old / elapsed:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
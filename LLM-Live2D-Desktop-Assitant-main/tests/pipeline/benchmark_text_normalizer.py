@@ -0,0 +1,110 @@
+"""
+Benchmark the cleanup of the text TTS speaks, on mixed CJK and English sentences.
+
+Compares the old chain of the TTS path (emotion tags removed, `AudioManager.clean_text`
+with its regex and `unicodedata.category` filter, emotion tags removed again) with
+`TextNormalizer`, with and without its cache, and checks that they agree first.
+
+Run it as a script:
+    python tests/pipeline/benchmark_text_normalizer.py
+"""
+
+import os
+import re
+import sys
+import time
+import unicodedata
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from module.live2d_model import Live2dModel
+from utils.text_normalizer import TextNormalizer, remove_special_characters
+
+SENTENCES = [
+    "[joy] Hello there! 今天天气真好，我们去公园散步吧。",
+    "Well, 这个问题很有意思 — let me think about it for a second…",
+    "[SmIrK] Hehe, 你以为你能接受真相吗？ [anger][anger]",
+    "ｆｕｌｌｗｉｄｔｈ ＡＢＣ １２３ and emoji 😊🎉 are dropped ✨",
+    "[sadness] 哦不。 [surprise] 真的吗？ [joy][joy] That is wonderful!",
+    "Kana like こんにちは and カタカナ, Hangul 안녕하세요, café naïve ﬁ ½",
+    "Brackets [like these] are not tags,\tand neither is [joy or [ this.\n",
+]
+
+
+def old_remove_special_characters(text: str) -> str:
+    """The old remove_special_characters."""
+    normalized_text = unicodedata.normalize("NFKC", text)
+
+    def is_valid_char(char: str) -> bool:
+        category = unicodedata.category(char)
+        return (
+            category.startswith("L")
+            or category.startswith("N")
+            or category.startswith("P")
+            or char.isspace()
+        )
+
+    return "".join(char for char in normalized_text if is_valid_char(char))
+
+
+def old_clean_text(text: str) -> str:
+    """The old AudioManager.clean_text, with REMOVE_SPECIAL_CHAR on."""
+    text = re.sub(r'[^\u4e00-\u9fffA-Za-z0-9,]', ' ', text)
+    return old_remove_special_characters(text)
+
+
+def old_chain(model: Live2dModel, sentence: str) -> str:
+    # tts_worker, then AudioManager.generate_audio_file
+    sentence = model.remove_emotion_keywords(sentence)
+    sentence = old_clean_text(sentence)
+    return model.remove_emotion_keywords(sentence)
+
+
+def measure(function, sentences: list[str], rounds: int = 5) -> float:
+    """Best time per sentence, in microseconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for sentence in sentences:
+            function(sentence)
+        best = min(best, time.perf_counter() - start)
+    return best / len(sentences) * 1e6
+
+
+def main():
+    model = Live2dModel("mashiro", model_dict_path=os.path.join(parent_dir, "model_dict.json"))
+    normalizer = TextNormalizer(live2d=model)
+    for sentence in SENTENCES:
+        expected = old_chain(model, sentence)
+        assert normalizer.normalize(sentence) == expected, sentence
+        assert remove_special_characters(sentence) == old_remove_special_characters(sentence), sentence
+
+    # distinct sentences, like a long conversation
+    sentences = [f"{sentence} ({number})" for number in range(2000) for sentence in SENTENCES]
+    print(f"{len(sentences)} sentences")
+    old = measure(lambda sentence: old_chain(model, sentence), sentences)
+    print(f"old chain:                   {old:7.2f} us/sentence")
+    uncached = TextNormalizer(live2d=model, cache_size=0)
+    for name, function in [
+        ("TextNormalizer:", uncached.normalize),
+        ("TextNormalizer, cached:", normalizer.normalize),
+    ]:
+        elapsed = measure(function, sentences)
+        print(f"{name:28s} {elapsed:7.2f} us/sentence ({old / elapsed:.1f}x faster)")
+
+    # the same sentence is cleaned more than once (repeated replies, retried TTS)
+    repeated = SENTENCES * 2000
+    old = measure(lambda sentence: old_chain(model, sentence), repeated)
+    elapsed = measure(normalizer.normalize, repeated)
+    print(f"repeated sentences, cached:  {elapsed:7.2f} us/sentence ({old / elapsed:.1f}x faster)")
+
+    old = measure(old_remove_special_characters, sentences)
+    elapsed = measure(remove_special_characters, sentences)
+    print(f"remove_special_characters:   {old:7.2f} -> {elapsed:.2f} us/sentence ({old / elapsed:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark the CPU time the sentence producer spends per generated token.
+
+Compares the old producer loop (one character at a time, string concatenation, a print
+and a full sentence check of the buffer per character) with the chunk-granular one
+(SentenceSplitter, list buffers, console sink).
+
+Run it as a script:
+    python tests/pipeline/benchmark_token_pipeline.py
+"""
+
+import io
+import os
+import re
+import sys
+import time
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from module.sentence_splitter import SentenceSplitter
+from utils.console_sink import ConsoleSink
+
+SAMPLE = (
+    "Well, that is a great question! [joy] The weather in Paris is usually mild in spring, "
+    "with temperatures around 15 degrees. Dr. Smith, who lives there, says it rains a lot... "
+    "You should bring an umbrella, a light jacket and comfortable shoes, because you will "
+    "walk a lot, and the streets are old and uneven in many places. Have a nice trip! "
+)
+
+
+def make_tokens(replies: int = 200) -> list[str]:
+    """Split a long reply into token-sized chunks (about four characters each), like an LLM stream."""
+    text = SAMPLE * replies
+    return re.findall(r"\s?\S{1,4}|\s", text)
+
+
+def old_check(text: str):
+    """The sentence check the producer used to run on the whole buffer per character."""
+    if ("sing_song" in text and "}" in text):
+        return "sing-song"
+    white_list = ["...", "Dr.", "Mr.", "Ms.", "Mrs.", "Jr.", "Sr.", "St.", "Ave.", "Rd.",
+                  "Blvd.", "Dept.", "Univ.", "Prof.", "Ph.D.", "M.D.", "U.S.", "U.K.",
+                  "U.N.", "E.U.", "U.S.A.", "U.K.", "U.S.S.R.", "U.A.E."]
+    if any(text.strip().endswith(item) for item in white_list):
+        return False
+    punctuation_blacklist = [".", "?", "!", "。", "；", "？", "！", "…", "〰", "〜", "～", "！"]
+    return any(text.strip().endswith(punct) for punct in punctuation_blacklist)
+
+
+def old_producer(tokens: list[str], out) -> int:
+    sentences = 0
+    full_response = [""]
+    sentence_buffer = ""
+    # the backends used to be consumed one character at a time
+    for char in "".join(tokens):
+        print(char, end="", flush=True, file=out)
+        sentence_buffer += char
+        full_response[0] += char
+        if old_check(sentence_buffer):
+            sentences += 1
+            sentence_buffer = ""
+    return sentences + bool(sentence_buffer)
+
+
+def new_producer(tokens: list[str], out) -> int:
+    sentences = 0
+    response_parts = []
+    splitter = SentenceSplitter()
+    echo = ConsoleSink(out)
+    for chunk in tokens:
+        echo.write(chunk)
+        response_parts.append(chunk)
+        for _ in splitter.feed(chunk):
+            echo.end_sentence()
+            sentences += 1
+    echo.end_reply()
+    sentences += len(splitter.flush())
+    "".join(response_parts)
+    return sentences
+
+
+def measure(producer, tokens: list[str], rounds: int = 5) -> float:
+    """Best CPU time per token, in microseconds."""
+    best = float("inf")
+    for _ in range(rounds):
+        out = io.StringIO()
+        start = time.process_time()
+        producer(tokens, out)
+        best = min(best, time.process_time() - start)
+    return best / len(tokens) * 1e6
+
+
+def main():
+    tokens = make_tokens()
+    print(f"{len(tokens)} tokens, {sum(map(len, tokens))} characters")
+    old = measure(old_producer, tokens)
+    new = measure(new_producer, tokens)
+    print(f"per-character producer: {old:8.2f} us/token")
+    print(f"chunk producer:         {new:8.2f} us/token ({old / new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Test the streaming sentence splitter against a corpus of replies.
+
+Every reply in sentence_corpus.json is fed whole, one character at a time and in random
+chunks; the segments have to be the expected ones in every case.
+"""
+
+import json
+import os
+import random
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from module.sentence_splitter import MAX_BLOCK_CHARS, SentenceSplitter
+
+CORPUS_PATH = os.path.join(current_dir, "sentence_corpus.json")
+
+
+def split(text: str, chunk_sizes, **options) -> list[str]:
+    splitter = SentenceSplitter(**options)
+    segments = []
+    position = 0
+    while position < len(text):
+        size = next(chunk_sizes)
+        segments += splitter.feed(text[position:position + size])
+        position += size
+    return segments + splitter.flush()
+
+
+def constant(size: int):
+    while True:
+        yield size
+
+
+def randomized(seed: int):
+    rng = random.Random(seed)
+    while True:
+        yield rng.randint(1, 12)
+
+
+class TestSentenceSplitter(unittest.TestCase):
+    """
+    Test the SentenceSplitter.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CORPUS_PATH, encoding="utf-8") as file:
+            cls.corpus = json.load(file)
+
+    def test_corpus_whole(self):
+        """Each reply, fed in one piece."""
+        for case in self.corpus:
+            with self.subTest(case["name"]):
+                self.assertEqual(
+                    split(case["text"], constant(len(case["text"])), **case["options"]),
+                    case["segments"],
+                )
+
+    def test_corpus_streamed(self):
+        """Each reply, fed character by character and in random chunks."""
+        for case in self.corpus:
+            for name, sizes in [
+                ("1", constant(1)),
+                ("3", constant(3)),
+                ("random-1", randomized(1)),
+                ("random-2", randomized(2)),
+            ]:
+                with self.subTest(case["name"], chunks=name):
+                    self.assertEqual(
+                        split(case["text"], sizes, **case["options"]), case["segments"]
+                    )
+
+    def test_no_text_lost(self):
+        """The segments add up to the reply (whitespace in front of a tool call is dropped)."""
+        for case in self.corpus:
+            with self.subTest(case["name"]):
+                segments = split(case["text"], randomized(3), **case["options"])
+                self.assertEqual("".join("".join(segments).split()), "".join(case["text"].split()))
+
+    def test_max_chars(self):
+        """No segment is longer than max_chars."""
+        text = "word " * 500
+        for segment in split(text, randomized(4), max_chars=50):
+            self.assertLessEqual(len(segment), 50)
+
+    def test_sentence_emitted_before_reply_ends(self):
+        """A sentence is returned as soon as the next chunk shows it is complete."""
+        splitter = SentenceSplitter()
+        self.assertEqual(splitter.feed("Hello there"), [])
+        self.assertEqual(splitter.feed("."), [])
+        self.assertEqual(splitter.feed(" How"), ["Hello there."])
+        self.assertEqual(splitter.feed("好的。"), [" How好的。"])
+
+    def test_unclosed_block_is_not_held_back(self):
+        """A `{"` that is never closed does not hold back the rest of a long reply."""
+        splitter = SentenceSplitter()
+        segments = splitter.feed('Sure {"sing_song": "')
+        for _ in range(MAX_BLOCK_CHARS // 10):
+            segments += splitter.feed("la la la. ")
+        self.assertGreater(len(segments), 2)
+        self.assertIn(" la la la.", segments)
+
+
+if __name__ == "__main__":
+    unittest.main()
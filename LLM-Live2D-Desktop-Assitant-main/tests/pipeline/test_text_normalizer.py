@@ -0,0 +1,45 @@
+"""
+Test the text normalizer that cleans up sentences before TTS speaks them.
+"""
+
+import os
+import re
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from utils.text_normalizer import TextNormalizer
+
+
+class FakeLive2d:
+    def remove_emotion_keywords(self, text: str) -> str:
+        return re.sub(r"\[(joy|anger)\]", "", text)
+
+
+class TestTextNormalizer(unittest.TestCase):
+
+    def test_from_config(self):
+        normalizer = TextNormalizer.from_config({}, FakeLive2d())
+        self.assertEqual(normalizer.normalize("[joy]Hi!  你好。"), "Hi   你好 ")
+
+    def test_remove_special_char_off(self):
+        normalizer = TextNormalizer.from_config({"REMOVE_SPECIAL_CHAR": False}, FakeLive2d())
+        self.assertEqual(normalizer.normalize("[joy]Hi!  你好。[anger]"), "Hi!  你好。")
+
+    def test_collapse_whitespace(self):
+        normalizer = TextNormalizer.from_config({"TTS_TEXT": {"COLLAPSE_WHITESPACE": True}}, FakeLive2d())
+        self.assertEqual(normalizer.normalize("[joy]Hi!  你好。"), "Hi 你好")
+
+    def test_strip_tags(self):
+        """The text a translator is given keeps its punctuation."""
+        normalizer = TextNormalizer.from_config({}, FakeLive2d())
+        self.assertEqual(normalizer.strip_tags("[joy]Hi! [anger]"), "Hi! ")
+        self.assertEqual(TextNormalizer().strip_tags("[joy]Hi!"), "[joy]Hi!")
+
+
+if __name__ == "__main__":
+    unittest.main()
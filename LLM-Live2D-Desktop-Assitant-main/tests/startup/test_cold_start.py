@@ -0,0 +1,143 @@
+"""
+Cold-start budget of the server.
+
+Each check runs in a fresh interpreter, so nothing is imported already:
+- the backend factories import no backend (and none of their client libraries),
+- `server.py --help` answers within HELP_BUDGET_S,
+- the server answers `/health` within READY_BUDGET_S.
+
+Find out where the time goes with:
+    python server.py --profile-imports
+"""
+
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+import urllib.request
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+HELP_BUDGET_S = 2.0
+READY_BUDGET_S = 10.0
+
+FACTORIES = [
+    "llm.llm_factory",
+    "asr.asr_factory",
+    "tts.tts_factory",
+    "translate.translate_factory",
+]
+# imported only by the backend that is configured
+BACKEND_MODULES = [
+    "llm.ollama",
+    "llm.memGPT",
+    "llm.claude",
+    "asr.asr_with_vad",
+    "translate.deeplx",
+    "openai",
+    "zhipuai",
+    "rich",
+    "onnxruntime",
+    "playsound3",
+]
+
+SERVER_DEPENDENCIES = all(
+    importlib.util.find_spec(name) is not None for name in ("fastapi", "uvicorn")
+)
+
+
+def run_python(*args: str, timeout: float = 60) -> tuple[subprocess.CompletedProcess, float]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *args],
+        cwd=parent_dir,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+    return result, time.perf_counter() - start
+
+
+class TestColdStart(unittest.TestCase):
+
+    def test_factories_import_no_backend(self):
+        code = (
+            "import json, sys\n"
+            + "".join(f"import {name}\n" for name in FACTORIES)
+            + f"print(json.dumps([name for name in {BACKEND_MODULES!r} if name in sys.modules]))"
+        )
+        result, _ = run_python("-c", code)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.splitlines()[-1]), [])
+
+    def test_import_profiler(self):
+        code = (
+            "from utils.import_profiler import import_profiler\n"
+            "import_profiler.install()\n"
+            "import llm.llm_factory\n"
+            "print(import_profiler.report())"
+        )
+        result, _ = run_python("-c", code)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = result.stdout.splitlines()
+        self.assertEqual(lines[0], "import time: self [us] | cumulative | imported package")
+        self.assertTrue(any(line.endswith(" llm.llm_factory") for line in lines))
+        self.assertTrue(any(line.endswith("   llm.llm_interface") for line in lines))
+        self.assertIn("modules imported in", lines[-1])
+
+    @unittest.skipUnless(SERVER_DEPENDENCIES, "fastapi and uvicorn are not installed")
+    def test_help_budget(self):
+        result, elapsed = run_python("server.py", "--help")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("--profile-imports", result.stdout)
+        self.assertLess(elapsed, HELP_BUDGET_S)
+
+    @unittest.skipUnless(SERVER_DEPENDENCIES, "fastapi and uvicorn are not installed")
+    @unittest.skipUnless(os.path.exists(os.path.join(parent_dir, "conf.yaml")), "conf.yaml not found")
+    def test_ready_budget(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = dict(os.environ, PORT=str(port))
+        # the server writes the port it runs on into server_port.txt
+        port_file = os.path.join(parent_dir, "server_port.txt")
+        port_file_content = None
+        if os.path.exists(port_file):
+            with open(port_file) as file:
+                port_file_content = file.read()
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "server.py", "--port", str(port)],
+            cwd=parent_dir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            ready = None
+            while time.perf_counter() - start < READY_BUDGET_S and process.poll() is None:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                        if response.status == 200:
+                            ready = time.perf_counter() - start
+                            break
+                except OSError:
+                    time.sleep(0.05)
+            self.assertIsNotNone(ready, f"server not ready within {READY_BUDGET_S} s")
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            if port_file_content is not None:
+                with open(port_file, "w") as file:
+                    file.write(port_file_content)
+
+
+if __name__ == "__main__":
+    unittest.main()
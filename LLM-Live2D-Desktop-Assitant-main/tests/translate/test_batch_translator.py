@@ -0,0 +1,92 @@
+"""
+Test the background batching translator with a fake translator.
+"""
+
+import os
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(parent_dir)
+
+from translate.batch_translator import BatchTranslator
+from translate.translate_interface import TranslateInterface
+
+
+class FakeTranslator(TranslateInterface):
+    """Upper-cases the texts and records the batches it was given."""
+
+    def __init__(self) -> None:
+        self.batches = []
+        self.drop = 0
+        self.error: BaseException | None = None
+
+    def translate(self, text: str) -> str:
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        self.batches.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return [text.upper() for text in texts][: len(texts) - self.drop]
+
+
+class TestBatchTranslator(unittest.TestCase):
+
+    def setUp(self):
+        self.translator = FakeTranslator()
+        self.batch_translator = BatchTranslator(self.translator, target_lang="JA", batch_window_s=0.2)
+
+    def test_batching_window(self):
+        futures = [self.batch_translator.submit(text) for text in ("one", "two", "one")]
+        self.assertEqual([future.result(timeout=5) for future in futures], ["ONE", "TWO", "ONE"])
+        # sent together, each sentence once
+        self.assertEqual(self.translator.batches, [["one", "two"]])
+
+    def test_cache_hit(self):
+        self.assertEqual(self.batch_translator.translate("hello"), "HELLO")
+        future = self.batch_translator.submit("hello")
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), "HELLO")
+        self.assertEqual(len(self.translator.batches), 1)
+
+    def test_target_script_is_not_sent(self):
+        for text in ("こんにちは。", "123 !?"):
+            future = self.batch_translator.submit(text)
+            self.assertTrue(future.done())
+            self.assertEqual(future.result(), text)
+        self.assertEqual(self.translator.batches, [])
+
+    def test_failing_batch(self):
+        self.translator.drop = 1
+        futures = [self.batch_translator.submit(text) for text in ("one", "two")]
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(timeout=5)
+
+        self.translator.drop = 0
+        self.translator.error = ConnectionError("down")
+        with self.assertRaises(ConnectionError):
+            self.batch_translator.translate("three")
+
+        # nothing is cached, and the thread keeps working
+        self.translator.error = None
+        self.assertEqual(self.batch_translator.translate("one"), "ONE")
+
+    def test_thread_that_stops(self):
+        """The sentences waiting for a thread that stopped on an error are failed, not left hanging."""
+        self.translator.error = SystemExit()
+        waiting = self.batch_translator.submit("first")
+        with self.assertRaises(RuntimeError):
+            waiting.result(timeout=5)
+        self.assertIsNone(self.batch_translator._worker)
+
+        # the next sentence starts a new thread
+        self.translator.error = None
+        self.assertEqual(self.batch_translator.submit("second").result(timeout=5), "SECOND")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+"""Description: Translates sentences in the background, in batches, while TTS runs.
+
+The producer submits each sentence as soon as it is split off the LLM stream, and the TTS
+worker picks up the translation when it gets to that sentence, so in steady state the
+translation is already there. Sentences submitted within `batch_window_s` of each other
+go to the translator in one request. Translations are kept in an LRU cache, and
+sentences that are already written in the script of the target language (or have
+nothing to translate) are not sent at all.
+"""
+
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from utils.metrics import metrics
+
+from .translate_interface import TranslateInterface
+
+_NOT_LETTERS = re.compile(r"[\W\d_]+")
+_HAN = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_KANA = r"\u3040-\u30ff\u31f0-\u31ff\uff66-\uff9f"
+_HANGUL = r"\u1100-\u11ff\u3130-\u318f\uac00-\ud7af"
+# target language -> (all the letters are in this script, one of them is in this one)
+_TARGET_SCRIPTS = {
+    "JA": (re.compile(f"[{_HAN}{_KANA}]+"), re.compile(f"[{_KANA}]")),
+    "ZH": (re.compile(f"[{_HAN}]+"), None),
+    "KO": (re.compile(f"[{_HANGUL}{_HAN}]+"), re.compile(f"[{_HANGUL}]")),
+}
+
+
+def in_target_script(text: str, target_lang: str) -> bool:
+    """
+    Whether there is nothing to translate: the text has no letters, or it is written in
+    the script of a CJK target language. Texts in latin script are always translated.
+    """
+    letters = _NOT_LETTERS.sub("", text)
+    if not letters:
+        return True
+    scripts = _TARGET_SCRIPTS.get(target_lang.upper().split("-")[0])
+    if scripts is None:
+        return False
+    all_letters, marker = scripts
+    return all_letters.fullmatch(letters) is not None and (
+        marker is None or marker.search(letters) is not None
+    )
+
+
+class BatchTranslator(TranslateInterface):
+    """Puts a translator behind a cache and a background batching thread, see the module description."""
+
+    def __init__(
+        self,
+        translator: TranslateInterface,
+        target_lang: str = "",
+        batch_window_s: float = 0.02,
+        max_batch: int = 16,
+        cache_size: int = 512,
+        idle_timeout_s: float = 30,
+    ) -> None:
+        """
+        Parameters:
+        - translator (TranslateInterface): The translator that does the work.
+        - target_lang (str, optional): Target language, for the script check. Defaults to "" (no check).
+        - batch_window_s (float, optional): How long a sentence waits for others to be sent with. Defaults to 0.02.
+        - max_batch (int, optional): Most sentences in one request. Defaults to 16.
+        - cache_size (int, optional): Translations kept in an LRU cache (0 = off). Defaults to 512.
+        - idle_timeout_s (float, optional): The background thread stops after this long without work. Defaults to 30.
+        """
+        self.translator = translator
+        self.target_lang = target_lang or ""
+        self.batch_window_s = batch_window_s
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.idle_timeout_s = idle_timeout_s
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: threading.Thread | None = None
+
+    def translate(self, text: str) -> str:
+        return self.submit(text).result()
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        if self.target_lang and in_target_script(text, self.target_lang):
+            metrics.incr("translate.skipped")
+            future.set_result(text)
+            return future
+        with self._lock:
+            translation = self._cache.get(text)
+            if translation is not None:
+                self._cache.move_to_end(text)
+                metrics.incr("translate.cache_hits")
+                future.set_result(translation)
+                return future
+            self._queue.put((text, future))
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        return future
+
+    def _run(self) -> None:
+        batch = []
+        try:
+            while True:
+                try:
+                    batch = [self._queue.get(timeout=self.idle_timeout_s)]
+                except queue.Empty:
+                    with self._lock:
+                        if self._queue.empty():
+                            self._worker = None
+                            return
+                    continue
+                deadline = time.monotonic() + self.batch_window_s
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        batch.append(
+                            self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                        )
+                    except queue.Empty:
+                        break
+                self._translate(batch)
+                batch = []
+        finally:
+            with self._lock:
+                # stopped by an error rather than for being idle: the next submit starts a new
+                # thread, and nobody would answer the sentences that are waiting
+                crashed = self._worker is threading.current_thread()
+                if crashed:
+                    self._worker = None
+                    while True:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+            if crashed:
+                error = RuntimeError("The translation thread stopped")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _translate(self, batch: list[tuple[str, Future]]) -> None:
+        # the same sentence may be in the batch more than once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        metrics.incr("translate.requests")
+        metrics.observe("translate.batch_size", len(texts))
+        start = time.perf_counter()
+        try:
+            translated = list(self.translator.translate_batch(texts))
+            if len(translated) != len(texts):
+                raise ValueError(f"Got {len(translated)} translations for {len(texts)} sentences")
+            translations = dict(zip(texts, translated))
+        except Exception as e:
+            metrics.incr("translate.errors")
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+        metrics.observe("translate.latency_s", time.perf_counter() - start)
+
+        if self.cache_size > 0:
+            with self._lock:
+                for text, translation in translations.items():
+                    self._cache[text] = translation
+                    self._cache.move_to_end(text)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        for text, future in batch:
+            # the caller may have given up on it
+            if not future.cancelled():
+                future.set_result(translations[text])
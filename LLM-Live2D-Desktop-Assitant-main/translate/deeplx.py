@@ -6,21 +6,31 @@ class DeepLXTranslate(TranslateInterface):
     api_endpoint: str = "http://127.0.0.1:1188/v2/translate"
     target_lang: str = "JA"
 
-    def __init__(self, api_endpoint: str, target_lang: str):
+    def __init__(self, api_endpoint: str, target_lang: str, timeout_s: float = 10):
         self.api_endpoint = api_endpoint
         self.target_lang = target_lang
+        # one pooled client, the connection to DeepLX is reused between sentences
+        self.client = httpx.Client(timeout=timeout_s)
 
-    # translate v2 endpoint from DeepLX
     def translate(self, text: str) -> str:
+        return self.translate_batch([text])[0]
+
+    # translate v2 endpoint from DeepLX, which takes a list of texts
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        req = None
         try:
-            data = {"text": [text], "target_lang": self.target_lang}
+            data = {"text": texts, "target_lang": self.target_lang}
             post_data = json.dumps(data)
-            req = httpx.post(url=self.api_endpoint, data=post_data).text
-            res = json.loads(req)["translations"]
-            res = " ".join([d["text"] for d in res])
+            req = self.client.post(url=self.api_endpoint, data=post_data).text
+            res = [d["text"] for d in json.loads(req)["translations"]]
         except Exception as e:
             print(f"Error translating text: {e}")
             print(f"Response: {req}")
             raise e
 
+        if len(res) != len(texts):
+            if len(texts) == 1:
+                return [" ".join(res)]
+            # the translations cannot be matched with the texts, send them one by one
+            return [self.translate(text) for text in texts]
         return res
@@ -1,4 +1,4 @@
-from .deeplx import DeepLXTranslate
+from .batch_translator import BatchTranslator
 from .translate_interface import TranslateInterface
 
 class TranslateFactory:
@@ -6,9 +6,21 @@ class TranslateFactory:
     def get_translator(translate_provider:str, **kwargs) -> TranslateInterface:
         translate_provider = translate_provider.lower()
         if translate_provider == "deeplx":
-            return DeepLXTranslate(
+            from .deeplx import DeepLXTranslate
+
+            translator = DeepLXTranslate(
                 api_endpoint=kwargs.get("DEEPLX_API_ENDPOINT"),
-                target_lang=kwargs.get("DEEPLX_TARGET_LANG")
+                target_lang=kwargs.get("DEEPLX_TARGET_LANG"),
+                timeout_s=kwargs.get("TIMEOUT_S", 10),
             )
+            target_lang = kwargs.get("DEEPLX_TARGET_LANG")
         else:
-            raise ValueError(f"Unsupported translate provider: {translate_provider}")
\ No newline at end of file
+            raise ValueError(f"Unsupported translate provider: {translate_provider}")
+
+        return BatchTranslator(
+            translator,
+            target_lang=target_lang if kwargs.get("SKIP_TARGET_SCRIPT", True) else "",
+            batch_window_s=kwargs.get("BATCH_WINDOW_S", 0.02),
+            max_batch=kwargs.get("MAX_BATCH", 16),
+            cache_size=kwargs.get("CACHE_SIZE", 512),
+        )
@@ -1,4 +1,5 @@
 import abc
+from concurrent.futures import Future
 
 
 class TranslateInterface(metaclass=abc.ABCMeta):
@@ -8,3 +9,20 @@ class TranslateInterface(metaclass=abc.ABCMeta):
         """
         Translate the input text to the target language."""
         raise NotImplementedError
+
+    def translate_batch(self, texts: list[str]) -> list[str]:
+        """
+        Translate several texts, in order. Translators whose API takes a list override this
+        to send them in one request."""
+        return [self.translate(text) for text in texts]
+
+    def submit(self, text: str) -> Future:
+        """
+        Start translating the text and return a future of the translation.
+        Translators that run in the background override this, here it translates right away."""
+        future = Future()
+        try:
+            future.set_result(self.translate(text))
+        except Exception as e:
+            future.set_exception(e)
+        return future
@@ -1,7 +1,6 @@
 import abc
 import os
 import sys
-from playsound3 import playsound
 
 
 class TTSInterface(metaclass=abc.ABCMeta):
@@ -57,6 +56,9 @@ class TTSInterface(metaclass=abc.ABCMeta):
         # Method 1: Try playsound3 (original method)
         try:
             print(f"[AUDIO FIX] Method 1: Trying playsound3...")
+            # only used to play audio on this device, not by the server
+            from playsound3 import playsound
+
             playsound(audio_file_path)
             print(f"[AUDIO FIX] ✓ playsound3 succeeded")
             return
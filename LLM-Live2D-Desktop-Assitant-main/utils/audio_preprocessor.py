@@ -1,5 +1,5 @@
-import unicodedata
 from translate.translate_interface import TranslateInterface
+from utils.text_normalizer import remove_special_characters
 
 
 def audio_filter(
@@ -40,31 +40,6 @@ def audio_filter(
     return text
 
 
-def remove_special_characters(text: str) -> str:
-    """
-    Filter text to remove all non-letter, non-number, and non-punctuation characters.
-
-    Args:
-        text (str): The text to filter.
-
-    Returns:
-        str: The filtered text.
-    """
-    normalized_text = unicodedata.normalize("NFKC", text)
-
-    def is_valid_char(char: str) -> bool:
-        category = unicodedata.category(char)
-        return (
-            category.startswith("L")
-            or category.startswith("N")
-            or category.startswith("P")
-            or char.isspace()
-        )
-
-    filtered_text = "".join(char for char in normalized_text if is_valid_char(char))
-    return filtered_text
-
-
 if __name__ == "__main__":
     while True:
         print(remove_special_characters(input(">> ")))
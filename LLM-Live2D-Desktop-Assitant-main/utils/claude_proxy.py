@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import AsyncIterator
+
+import httpx
+from loguru import logger
+
+from utils.metrics import metrics
+
+
+def sse(data: dict) -> bytes:
+    """Encode one server-sent event carrying a JSON object."""
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+class ClaudeProxyError(Exception):
+    """The upstream Claude endpoint failed, or the caller has too many requests open."""
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Broadcast:
+    """
+    One upstream stream, shared by every caller that sent the same request.
+
+    The chunks are kept, so a caller that joins late still gets the whole reply.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.done = False
+        self.subscribers = 0
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk: bytes | None) -> None:
+        """Add a chunk (None ends the stream) and wake up the readers."""
+        async with self._changed:
+            if chunk is None:
+                self.done = True
+            else:
+                self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def read(self) -> AsyncIterator[bytes]:
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or position < len(self.chunks))
+                chunks = self.chunks[position:]
+                done = self.done
+            position += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done and position == len(self.chunks):
+                return
+
+
+class ClaudeProxy:
+    """
+    Forwards Claude requests from the desktop clients to the AWS endpoint.
+
+    - All requests share one pooled `httpx.AsyncClient`, so the upstream connections stay warm.
+    - Each client may have `max_per_client` requests upstream at once. Further requests wait
+      for a slot, and are refused (429) once `max_queued_per_client` are already waiting.
+    - Identical requests that are in flight at the same time are sent upstream once and the
+      reply (or the stream) is shared.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None,
+        stream_url: str | None = None,
+        max_connections: int = 20,
+        max_per_client: int = 4,
+        max_queued_per_client: int = 16,
+        timeout_s: float = 60,
+        connect_timeout_s: float = 10,
+    ) -> None:
+        """
+        Parameters:
+        - base_url (str): Base URL of the AWS endpoint, requests go to `{base_url}/claude`.
+        - stream_url (str, optional): URL of the streaming endpoint. Without it, streamed replies are sent in one piece.
+        - max_connections (int, optional): Size of the upstream connection pool. Defaults to 20.
+        - max_per_client (int, optional): Requests one client may have upstream at once. Defaults to 4.
+        - max_queued_per_client (int, optional): Requests one client may have waiting for a slot. Defaults to 16.
+        - timeout_s (float, optional): Read timeout, the max gap between chunks of the reply. Defaults to 60.
+        - connect_timeout_s (float, optional): Connect timeout. Defaults to 10.
+        """
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.stream_url = stream_url
+        self.max_per_client = max_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self._limits = httpx.Limits(
+            max_connections=max_connections, max_keepalive_connections=max_connections
+        )
+        self._timeout = httpx.Timeout(timeout_s, connect=connect_timeout_s)
+        self._client: httpx.AsyncClient | None = None
+        # client id -> [semaphore, number of requests waiting or running]
+        self._slots: dict[str, list] = {}
+        self._replies: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _Broadcast] = {}
+
+    @classmethod
+    def from_config(cls, claude_config: dict | None, proxy_config: dict | None = None) -> "ClaudeProxy":
+        """Build the proxy from the `claude` section and the optional `CLAUDE_PROXY` section."""
+        claude_config = claude_config or {}
+        proxy_config = proxy_config or {}
+        return cls(
+            base_url=claude_config.get("BASE_URL"),
+            stream_url=claude_config.get("STREAM_URL"),
+            max_connections=proxy_config.get("MAX_CONNECTIONS", 20),
+            max_per_client=proxy_config.get("MAX_PER_CLIENT", 4),
+            max_queued_per_client=proxy_config.get("MAX_QUEUED_PER_CLIENT", 16),
+            timeout_s=proxy_config.get("TIMEOUT_S", 60),
+            connect_timeout_s=proxy_config.get("CONNECT_TIMEOUT_S", 10),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _key(kind: str, payload: dict) -> str:
+        return hashlib.sha256(
+            (kind + json.dumps(payload, sort_keys=True, ensure_ascii=False)).encode()
+        ).hexdigest()
+
+    async def _acquire(self, client_id: str) -> None:
+        slot = self._slots.get(client_id)
+        if slot is None:
+            slot = self._slots[client_id] = [asyncio.Semaphore(self.max_per_client), 0]
+        if slot[1] >= self.max_per_client + self.max_queued_per_client:
+            metrics.incr("claude_proxy.rejected")
+            raise ClaudeProxyError(429, "Too many Claude requests from this client")
+        slot[1] += 1
+        try:
+            await slot[0].acquire()
+        except BaseException:
+            self._release(client_id, acquired=False)
+            raise
+
+    def _release(self, client_id: str, acquired: bool = True) -> None:
+        slot = self._slots[client_id]
+        if acquired:
+            slot[0].release()
+        slot[1] -= 1
+        if slot[1] == 0:
+            del self._slots[client_id]
+
+    async def complete(self, payload: dict, client_id: str) -> dict:
+        """
+        Send a request and return the JSON reply (`{"reply": ..., "usage": ...}`).
+
+        Raises:
+        - ClaudeProxyError: The endpoint failed, or the client has too many requests open.
+        """
+        metrics.incr("claude_proxy.requests")
+        key = self._key("complete", payload)
+        reply = self._replies.get(key)
+        if reply is None:
+            await self._acquire(client_id)
+            # the same request may have been sent while this one waited for a slot
+            reply = self._replies.get(key)
+            if reply is None:
+                reply = self._replies[key] = asyncio.create_task(self._post(payload))
+                reply.add_done_callback(lambda _: self._finish_reply(key, client_id))
+            else:
+                self._release(client_id)
+                metrics.incr("claude_proxy.deduplicated")
+        else:
+            metrics.incr("claude_proxy.deduplicated")
+        # a caller that hangs up does not cancel the request for the others
+        return await asyncio.shield(reply)
+
+    def _finish_reply(self, key: str, client_id: str) -> None:
+        del self._replies[key]
+        self._release(client_id)
+
+    async def _post(self, payload: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(f"{self.base_url}/claude", json=payload)
+        except httpx.HTTPError as e:
+            metrics.incr("claude_proxy.errors")
+            raise ClaudeProxyError(502, f"Claude endpoint unreachable: {e}") from e
+        metrics.observe("claude_proxy.latency_s", time.perf_counter() - start)
+        if response.status_code != 200:
+            metrics.incr("claude_proxy.errors")
+            raise ClaudeProxyError(response.status_code, f"HTTP error {response.status_code}: {response.text}")
+        return response.json()
+
+    async def stream(self, payload: dict, client_id: str) -> AsyncIterator[bytes]:
+        """
+        Send a request and yield the reply as server-sent events, as they arrive.
+
+        The events are those of the streaming endpoint: `{"delta": ...}`, `{"usage": ...}`,
+        `{"error": ...}` and `{"done": true}`. Without a streaming endpoint the reply is sent
+        as a single delta.
+
+        Raises:
+        - ClaudeProxyError: The client has too many requests open.
+        """
+        metrics.incr("claude_proxy.requests")
+        key = self._key("stream", payload)
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            await self._acquire(client_id)
+            # the same request may have been sent while this one waited for a slot
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                broadcast.task = asyncio.create_task(self._pump(key, broadcast, payload, client_id))
+            else:
+                self._release(client_id)
+                metrics.incr("claude_proxy.deduplicated")
+        else:
+            metrics.incr("claude_proxy.deduplicated")
+
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.read():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # every caller hung up, stop reading the upstream stream
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, payload: dict, client_id: str) -> None:
+        start = time.perf_counter()
+        first_chunk = True
+        try:
+            async for chunk in self._upstream_events(payload):
+                if first_chunk:
+                    first_chunk = False
+                    metrics.observe("claude_proxy.ttfb_s", time.perf_counter() - start)
+                await broadcast.publish(chunk)
+            metrics.observe("claude_proxy.latency_s", time.perf_counter() - start)
+        except asyncio.CancelledError:
+            metrics.incr("claude_proxy.cancelled")
+        except Exception as e:
+            if not isinstance(e, ClaudeProxyError):
+                metrics.incr("claude_proxy.errors")
+            logger.error(f"Claude proxy stream error: {e}")
+            await broadcast.publish(sse({"error": str(e)}))
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            self._release(client_id)
+            await broadcast.publish(None)
+
+    async def _upstream_events(self, payload: dict) -> AsyncIterator[bytes]:
+        if not self.stream_url:
+            # API Gateway buffers responses, so the reply comes in one piece
+            data = await self._post(payload)
+            yield sse({"delta": data.get("reply", "")})
+            if data.get("usage"):
+                yield sse({"usage": data["usage"]})
+            yield sse({"done": True})
+            return
+
+        async with self.client.stream(
+            "POST",
+            self.stream_url,
+            json=payload,
+            headers={"accept": "text/event-stream"},
+        ) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode(errors="replace")
+                yield sse({"error": f"HTTP error {response.status_code}: {body}"})
+                return
+            async for chunk in response.aiter_raw():
+                yield chunk
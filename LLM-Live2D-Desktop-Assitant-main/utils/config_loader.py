@@ -0,0 +1,246 @@
+"""Description: Loads, validates and caches the YAML configuration files.
+
+`conf.yaml` and the alternatives in `CONFIG_ALTS_DIR` are read once. The encoding is
+probed, `${VAR_NAME}` is replaced with the environment variable, and the YAML is parsed
+and checked against `SCHEMA`. A file is read again only when its modification time or
+size changes, and that is checked at most every `check_interval_s` seconds. Switching
+between configurations that have not changed does not touch the disk. Every load gets
+its own copy of the configuration, so callers may modify it.
+"""
+
+import copy
+import os
+import re
+import threading
+import time
+
+from loguru import logger
+
+# Match ${VAR_NAME}
+_ENV_PATTERN = re.compile(r"\$\{(\w+)\}")
+_ENCODINGS = ("utf-8", "utf-8-sig", "gbk", "gb2312", "ascii")
+CONFIG_EXTENSIONS = (".yaml", ".yml")
+
+LLM_PROVIDERS = ("ollama", "mem0", "memgpt", "claude", "fakellm", "failover")
+
+# type of the top-level keys the code reads, others (the provider sections) are not checked
+SCHEMA: dict[str, type | tuple[type, ...]] = {
+    "LLM_PROVIDER": str,
+    "ASR_MODEL": str,
+    "TTS_MODEL": str,
+    "TRANSLATE_PROVIDER": str,
+    "LIVE2D_MODEL": str,
+    "PERSONA_CHOICE": (str, type(None)),
+    "DEFAULT_PERSONA_PROMPT_IN_YAML": (str, type(None)),
+    "EXIT_PHRASE": str,
+    "HOST": str,
+    "CONFIG_ALTS_DIR": str,
+    "CLAUDE_API_KEY": (str, type(None)),
+    "VOICE_INPUT_ON": bool,
+    "TTS_ON": bool,
+    "TRANSLATE_AUDIO": bool,
+    "LIVE2D": bool,
+    "VERBOSE": bool,
+    "SAY_SENTENCE_SEPARATELY": bool,
+    "REMOVE_SPECIAL_CHAR": bool,
+    "ECHO_LLM_OUTPUT": bool,
+    "SERVER_PORT": int,
+    "PORT": int,
+    "SENTENCE_MIN_CHARS": int,
+    "SENTENCE_MAX_CHARS": int,
+    "ASR_WORKER_PROCESSES": int,
+    "SERVER": dict,
+    "LOCAL_WAKE_WORD": (dict, type(None)),
+    "ASR_ENDPOINTING": (dict, type(None)),
+    "ASR_LANGUAGE_PINNING": (dict, type(None)),
+    "CONVERSATION_JOURNAL": (dict, bool, type(None)),
+    "RESPONSE_CACHE": (dict, type(None)),
+    "VISION_IMAGE": (dict, type(None)),
+    "CLAUDE_PROXY": (dict, type(None)),
+    "TTS_TEXT": (dict, type(None)),
+}
+
+
+class ConfigError(ValueError):
+    """The configuration file does not match `SCHEMA`."""
+
+    def __init__(self, path: str, problems: list[str]) -> None:
+        super().__init__(f"Invalid configuration {path}: " + "; ".join(problems))
+        self.path = path
+        self.problems = problems
+
+
+def _type_names(expected) -> str:
+    types = expected if isinstance(expected, tuple) else (expected,)
+    return " or ".join("null" if t is type(None) else t.__name__ for t in types)
+
+
+def validate_config(config, path: str = "config") -> dict:
+    """
+    Check the configuration against `SCHEMA` and return it.
+
+    Raises:
+    - ConfigError if a key has the wrong type or the LLM provider is unknown.
+    """
+    if not isinstance(config, dict):
+        raise ConfigError(path, ["the file does not contain a mapping"])
+    problems = []
+    for key, expected in SCHEMA.items():
+        if key not in config:
+            continue
+        value = config[key]
+        types = expected if isinstance(expected, tuple) else (expected,)
+        # bool is an int, but `PORT: true` is a mistake
+        if isinstance(value, bool) and bool not in types:
+            valid = False
+        else:
+            valid = isinstance(value, types)
+        if not valid:
+            problems.append(f"{key} should be {_type_names(expected)}, not {type(value).__name__}")
+    provider = config.get("LLM_PROVIDER")
+    if isinstance(provider, str) and provider.lower() not in LLM_PROVIDERS:
+        problems.append(f"LLM_PROVIDER {provider!r} is not one of {', '.join(LLM_PROVIDERS)}")
+    if problems:
+        raise ConfigError(path, problems)
+    return config
+
+
+def _decode(path: str, raw_data: bytes) -> str:
+    # Try common encodings first
+    for encoding in _ENCODINGS:
+        try:
+            return raw_data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+
+    # Try detecting encoding as last resort
+    import chardet
+
+    detected = chardet.detect(raw_data)
+    if detected["encoding"]:
+        try:
+            return raw_data.decode(detected["encoding"])
+        except (UnicodeDecodeError, LookupError):
+            pass
+    raise UnicodeError(f"Failed to decode config file {path} with any encoding")
+
+
+def substitute_env(content: str) -> str:
+    """Replace ${VAR_NAME} with the environment variable, and leave it if it is not set."""
+    return _ENV_PATTERN.sub(lambda match: os.getenv(match.group(1), match.group(0)), content)
+
+
+def parse_config(path: str) -> dict:
+    """
+    Read, parse and validate a configuration file, without the cache.
+
+    Raises:
+    - FileNotFoundError if the configuration file is not found.
+    - UnicodeError if the file cannot be decoded.
+    - yaml.YAMLError if the configuration file is not a valid YAML file.
+    - ConfigError if the configuration does not match `SCHEMA`.
+    """
+    import yaml
+
+    with open(path, "rb") as file:
+        raw_data = file.read()
+    content = substitute_env(_decode(path, raw_data))
+    try:
+        config = yaml.load(content, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        logger.error(f"Error parsing YAML from {path}: {e}")
+        raise
+    return validate_config(config, path)
+
+
+class ConfigStore:
+    """
+    Process-wide cache of the parsed configuration files and of the config directories.
+    """
+
+    def __init__(self, check_interval_s: float = 2.0) -> None:
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        # absolute path -> [mtime and size, time of the last check, config]
+        self._configs: dict[str, list] = {}
+        # absolute directory -> [mtimes of the directories, time of the last check, file name -> path]
+        self._indexes: dict[str, list] = {}
+
+    def load(self, path: str) -> dict:
+        """
+        Return a copy of the configuration in the file, see `parse_config` for the errors.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._configs.get(path)
+            now = time.monotonic()
+            if entry is not None and now - entry[1] < self.check_interval_s:
+                return copy.deepcopy(entry[2])
+            stat = os.stat(path)
+            version = (stat.st_mtime_ns, stat.st_size)
+            if entry is None or entry[0] != version:
+                entry = [version, now, parse_config(path)]
+                self._configs[path] = entry
+                logger.info(f"Loaded configuration {path}")
+            entry[1] = now
+            return copy.deepcopy(entry[2])
+
+    def list_configs(self, config_dir: str) -> dict[str, str]:
+        """
+        The configuration files in `config_dir` and its subdirectories, by file name.
+        """
+        config_dir = os.path.abspath(config_dir)
+        with self._lock:
+            index = self._indexes.get(config_dir)
+            now = time.monotonic()
+            if index is not None and now - index[1] < self.check_interval_s:
+                return dict(index[2])
+            if index is not None and self._mtimes(index[0]) == index[0]:
+                index[1] = now
+                return dict(index[2])
+            # a directory that does not exist yet is rescanned once it is created
+            directories = {config_dir: None}
+            files = {}
+            for root, _, names in os.walk(config_dir):
+                directories[root] = os.stat(root).st_mtime_ns
+                for name in names:
+                    if name.endswith(CONFIG_EXTENSIONS):
+                        files.setdefault(name, os.path.join(root, name))
+            self._indexes[config_dir] = [directories, now, files]
+            return dict(files)
+
+    @staticmethod
+    def _mtimes(directories: dict[str, int]) -> dict[str, int | None]:
+        mtimes = {}
+        for directory in directories:
+            try:
+                mtimes[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtimes[directory] = None
+        return mtimes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._configs.clear()
+            self._indexes.clear()
+
+
+config_store = ConfigStore()
+
+
+def load_config_with_env(path) -> dict:
+    """
+    Load the configuration file with environment variables.
+
+    Parameters:
+    - path (str): The path to the configuration file.
+
+    Returns:
+    - dict: The configuration dictionary.
+
+    Raises:
+    - FileNotFoundError if the configuration file is not found.
+    - yaml.YAMLError if the configuration file is not a valid YAML file.
+    - ConfigError if the configuration does not match the schema.
+    """
+    return config_store.load(path)
@@ -0,0 +1,41 @@
+import sys
+import threading
+
+
+class ConsoleSink:
+    """
+    Echoes streamed LLM output to the console.
+
+    Chunks are written as they arrive, but the stream is only flushed at the end of a
+    sentence (or of the reply), not for every token.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def write(self, text: str) -> None:
+        with self._lock:
+            self.stream.write(text)
+
+    def end_sentence(self) -> None:
+        with self._lock:
+            self.stream.flush()
+
+    def end_reply(self) -> None:
+        with self._lock:
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+class NullSink:
+    """A sink that drops everything, for when the echo is turned off."""
+
+    def write(self, text: str) -> None:
+        pass
+
+    def end_sentence(self) -> None:
+        pass
+
+    def end_reply(self) -> None:
+        pass
@@ -0,0 +1,181 @@
+"""Description: Shrinks clipboard images before they are sent to a vision model.
+
+Clipboard images arrive as full-resolution PNGs (screenshots are several MB of base64),
+while vision models scale everything down to about a thousand pixels per side anyway.
+`ImagePreprocessor.prepare` downscales the image to `max_side`, re-encodes it as JPEG
+(or WebP) and lowers the quality until it fits in `max_bytes`. Results are cached by the
+hash of the pasted image, so pasting the same image again costs nothing.
+"""
+
+import base64
+import binascii
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+
+from loguru import logger
+from PIL import Image, ImageOps
+
+from utils.metrics import metrics
+
+# first bytes of the base64 encoding of each format
+_MIME_PREFIXES = {
+    "/9j/": "image/jpeg",
+    "iVBORw0KGgo": "image/png",
+    "UklGR": "image/webp",
+    "R0lGOD": "image/gif",
+}
+# formats every vision endpoint accepts, sent as they are when they are small enough
+_PASSTHROUGH_FORMATS = ("JPEG", "PNG", "WEBP")
+_QUALITY_STEP = 10
+_SHRINK_STEP = 0.75
+
+
+def image_mime_type(image_base64: str, default: str = "image/jpeg") -> str:
+    """Guess the MIME type of a base64 encoded image from its first bytes."""
+    for prefix, mime_type in _MIME_PREFIXES.items():
+        if image_base64.startswith(prefix):
+            return mime_type
+    return default
+
+
+class _ImageCache:
+    """A thread-safe LRU of prepared images, shared by all sessions."""
+
+    def __init__(self, max_entries: int = 32) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+            return image
+
+    def put(self, key: tuple, image: str) -> None:
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = _ImageCache()
+
+
+class ImagePreprocessor:
+    """Downscales and re-encodes images for vision requests, see the module description."""
+
+    def __init__(
+        self,
+        max_side: int = 1024,
+        max_bytes: int = 200_000,
+        image_format: str = "JPEG",
+        quality: int = 85,
+        min_quality: int = 45,
+        enabled: bool = True,
+    ) -> None:
+        """
+        Parameters:
+        - max_side (int, optional): Longest side of the image in pixels. Defaults to 1024.
+        - max_bytes (int, optional): Size budget of the encoded image (before base64). Defaults to 200_000.
+        - image_format (str, optional): "JPEG" or "WEBP". Defaults to "JPEG".
+        - quality (int, optional): Encoder quality to start with. Defaults to 85.
+        - min_quality (int, optional): Lowest quality before the image is made smaller instead. Defaults to 45.
+        - enabled (bool, optional): Pass images through untouched when False. Defaults to True.
+        """
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.min_quality = min_quality
+        self.enabled = enabled
+
+    @classmethod
+    def from_config(cls, config: dict | None) -> "ImagePreprocessor":
+        """Build it from the `VISION_IMAGE` section of the configuration."""
+        config = config or {}
+        return cls(
+            max_side=config.get("MAX_SIDE", 1024),
+            max_bytes=config.get("MAX_BYTES", 200_000),
+            image_format=config.get("FORMAT", "JPEG"),
+            quality=config.get("QUALITY", 85),
+            min_quality=config.get("MIN_QUALITY", 45),
+            enabled=config.get("ENABLED", True),
+        )
+
+    def prepare(self, image_base64: str) -> str:
+        """
+        Return the image, downscaled and re-encoded, as base64.
+
+        The original is returned if it cannot be decoded.
+        """
+        if not self.enabled or not image_base64:
+            return image_base64
+        digest = hashlib.sha256(image_base64.encode("ascii", "ignore")).hexdigest()
+        key = (digest, self.max_side, self.max_bytes, self.image_format, self.quality, self.min_quality)
+        prepared = _cache.get(key)
+        if prepared is not None:
+            metrics.incr("vision.image.cache_hits")
+            return prepared
+        metrics.incr("vision.image.cache_misses")
+
+        start = time.perf_counter()
+        try:
+            data = base64.b64decode(image_base64, validate=False)
+            encoded = self._encode(data)
+        except (binascii.Error, OSError, ValueError) as e:
+            logger.warning(f"Could not prepare the clipboard image, sending it as is: {e}")
+            return image_base64
+        metrics.observe("vision.image.prepare_s", time.perf_counter() - start)
+        metrics.observe("vision.image.input_bytes", len(data))
+        metrics.observe("vision.image.output_bytes", len(encoded))
+
+        prepared = image_base64 if encoded is data else base64.b64encode(encoded).decode("ascii")
+        _cache.put(key, prepared)
+        return prepared
+
+    def _encode(self, data: bytes) -> bytes:
+        with Image.open(io.BytesIO(data)) as image:
+            if (
+                image.format in _PASSTHROUGH_FORMATS
+                and len(data) <= self.max_bytes
+                and max(image.size) <= self.max_side
+            ):
+                # already small enough (flat screenshots are often smaller as PNG than as JPEG)
+                return data
+            image = ImageOps.exif_transpose(image)
+            image = self._flatten(image)
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+            quality = self.quality
+            while True:
+                output = io.BytesIO()
+                image.save(output, format=self.image_format, quality=quality)
+                encoded = output.getvalue()
+                if len(encoded) <= self.max_bytes or max(image.size) <= 64:
+                    return encoded
+                if quality - _QUALITY_STEP >= self.min_quality:
+                    quality -= _QUALITY_STEP
+                else:
+                    # still too big at the lowest quality, lose some resolution instead
+                    width, height = image.size
+                    image = image.resize(
+                        (max(1, int(width * _SHRINK_STEP)), max(1, int(height * _SHRINK_STEP))),
+                        Image.Resampling.LANCZOS,
+                    )
+
+    def _flatten(self, image: Image.Image) -> Image.Image:
+        if self.image_format == "WEBP" and image.mode in ("RGB", "RGBA"):
+            return image
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # JPEG has no alpha channel, put transparent screenshots on white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image.convert("RGB")
@@ -0,0 +1,81 @@
+"""Description: Measures how long each module takes to import, like `python -X importtime`.
+
+`server.py --profile-imports` installs the profiler before anything else is imported and
+prints the report once the server is set up. The profiler is a meta path finder: it lets
+the other finders find the module and times the loader's `exec_module`, which is where
+the module's code (and so its own imports) runs. Built-in and frozen modules are not timed.
+"""
+
+import sys
+import time
+from importlib.abc import MetaPathFinder
+
+
+class ImportProfiler(MetaPathFinder):
+    """Records the self and cumulative import time of every module, in microseconds."""
+
+    def __init__(self) -> None:
+        # (module name, depth, self time, cumulative time), in the order the imports finish
+        self.records: list[tuple[str, int, int, int]] = []
+        # [module name, start, time spent importing other modules]
+        self._stack: list[list] = []
+
+    def install(self) -> None:
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        # built-in and frozen modules share one loader (the class itself)
+        if loader is None or isinstance(loader, type) or not hasattr(loader, "exec_module"):
+            return spec
+        exec_module = loader.exec_module
+
+        def timed_exec_module(module):
+            self._stack.append([fullname, time.perf_counter(), 0.0])
+            try:
+                exec_module(module)
+            finally:
+                name, start, children = self._stack.pop()
+                cumulative = time.perf_counter() - start
+                if self._stack:
+                    self._stack[-1][2] += cumulative
+                self.records.append(
+                    (name, len(self._stack), int((cumulative - children) * 1e6), int(cumulative * 1e6))
+                )
+
+        try:
+            loader.exec_module = timed_exec_module
+        except AttributeError:
+            pass
+        return spec
+
+    def report(self, top: int | None = None) -> str:
+        """
+        The `-X importtime` table, or the `top` modules by self time when given.
+        """
+        records = self.records
+        if top is not None:
+            records = sorted(records, key=lambda record: record[2], reverse=True)[:top]
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for name, depth, self_us, cumulative_us in records:
+            indent = "  " * depth if top is None else ""
+            lines.append(f"import time: {self_us:>9} | {cumulative_us:>10} | {indent}{name}")
+        total_us = sum(cumulative_us for _, depth, _, cumulative_us in self.records if depth == 0)
+        lines.append(f"{len(self.records)} modules imported in {total_us / 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+import_profiler = ImportProfiler()
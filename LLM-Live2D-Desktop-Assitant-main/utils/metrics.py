@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MetricsRegistry:
+    """
+    A tiny thread-safe registry of counters and value summaries.
+
+    Counters only go up (`incr`). Summaries (`observe`) keep the count, total, min,
+    max and last observed value, which is enough to report averages for latency and
+    payload sizes without keeping every sample around.
+
+    Names are dotted strings, e.g. `asr.groq.upload_bytes`.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {}
+        self._summaries: dict[str, dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increase the counter `name` by `value`."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        """Add one sample to the summary `name`."""
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                self._summaries[name] = {
+                    "count": 1,
+                    "total": value,
+                    "min": value,
+                    "max": value,
+                    "last": value,
+                }
+                return
+            summary["count"] += 1
+            summary["total"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+            summary["last"] = value
+
+    @contextmanager
+    def timer(self, name: str):
+        """Observe the wall time (in seconds) spent inside the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serializable copy of all counters and summaries."""
+        with self._lock:
+            summaries = {}
+            for name, summary in self._summaries.items():
+                summaries[name] = dict(summary, avg=summary["total"] / summary["count"])
+            return {"counters": dict(self._counters), "summaries": summaries}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+# process-wide registry, exposed by the server at /metrics
+metrics = MetricsRegistry()
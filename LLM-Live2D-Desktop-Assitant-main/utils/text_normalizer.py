@@ -0,0 +1,120 @@
+"""Description: Cleans up the text of a sentence before TTS speaks it.
+
+The text used to go through several overlapping steps, each walking the characters in
+Python: the emotion tags were removed, everything but CJK ideographs, ASCII letters,
+digits and commas was replaced by spaces, and what was left was filtered again by
+`unicodedata.category`. `TextNormalizer` does it with one compiled regex (the tags) and
+one `str.translate` table, and can collapse the whitespace. The translate tables remember
+the verdict for every character they have seen and are shared by the whole process, and
+the normalized text of the last few sentences is cached.
+
+Every string that goes to TTS is normalized by the session's one `TextNormalizer`. When it
+is translated first, the translator is given the sentence without its tags
+(`strip_tags`), and the translation is normalized.
+"""
+
+import functools
+import re
+import unicodedata
+
+# the characters the TTS engines are given, all others become spaces
+TTS_CHARACTERS = r"\u4e00-\u9fffA-Za-z0-9,"
+
+
+def is_speakable(char: str) -> bool:
+    """Letters, numbers, punctuation and whitespace."""
+    return unicodedata.category(char)[0] in "LNP" or char.isspace()
+
+
+class CharTable(dict):
+    """
+    A `str.translate` table that decides on each character the first time it is seen.
+
+    Characters are kept if `keep(char)` is true, and replaced by `replacement` (removed
+    when it is None) otherwise.
+    """
+
+    def __init__(self, keep, replacement: str | None = None) -> None:
+        super().__init__()
+        self._keep = keep
+        self._replacement = replacement
+
+    def __missing__(self, codepoint: int):
+        value = codepoint if self._keep(chr(codepoint)) else self._replacement
+        self[codepoint] = value
+        return value
+
+
+# shared by every session, a character is looked up once per process
+SPEAKABLE_TABLE = CharTable(is_speakable)
+_TTS_CHARACTER = re.compile(f"[{TTS_CHARACTERS}]")
+TTS_CHARACTER_TABLE = CharTable(lambda char: _TTS_CHARACTER.match(char) is not None, " ")
+
+
+class TextNormalizer:
+    """Normalizes sentences for TTS, see the module description."""
+
+    def __init__(
+        self,
+        live2d=None,
+        remove_special_char: bool = True,
+        collapse_whitespace: bool = False,
+        cache_size: int = 256,
+    ) -> None:
+        """
+        Parameters:
+        - live2d (Live2dModel, optional): The model whose emotion tags are removed. Defaults to None (no tags).
+        - remove_special_char (bool, optional): Turn everything but `TTS_CHARACTERS` into spaces. Defaults to True.
+        - collapse_whitespace (bool, optional): Turn runs of whitespace into one space and strip the ends. Defaults to False.
+        - cache_size (int, optional): Normalized sentences kept in an LRU cache (0 = off). Defaults to 256.
+        """
+        self.live2d = live2d
+        self.remove_special_char = remove_special_char
+        self.collapse_whitespace = collapse_whitespace
+        self.normalize = (
+            functools.lru_cache(maxsize=cache_size)(self._normalize)
+            if cache_size > 0
+            else self._normalize
+        )
+
+    @classmethod
+    def from_config(cls, config: dict, live2d=None) -> "TextNormalizer":
+        """Build it from `REMOVE_SPECIAL_CHAR` and the optional `TTS_TEXT` section of the configuration."""
+        text_config = config.get("TTS_TEXT") or {}
+        return cls(
+            live2d=live2d,
+            remove_special_char=config.get("REMOVE_SPECIAL_CHAR", True),
+            collapse_whitespace=text_config.get("COLLAPSE_WHITESPACE", False),
+            cache_size=text_config.get("CACHE_SIZE", 256),
+        )
+
+    def strip_tags(self, text: str) -> str:
+        """Only remove the emotion tags, for text that is translated before it is normalized."""
+        if self.live2d:
+            text = self.live2d.remove_emotion_keywords(text)
+        return text
+
+    def _normalize(self, text: str) -> str:
+        text = self.strip_tags(text)
+        if self.remove_special_char:
+            # what is left is letters, digits and commas that NFKC does not change, so
+            # remove_special_characters has nothing to do after this
+            text = text.translate(TTS_CHARACTER_TABLE)
+        if self.collapse_whitespace:
+            text = " ".join(text.split())
+        return text
+
+
+def remove_special_characters(text: str) -> str:
+    """
+    Filter text to remove all non-letter, non-number, and non-punctuation characters.
+
+    Args:
+        text (str): The text to filter.
+
+    Returns:
+        str: The filtered text.
+    """
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    return text.translate(SPEAKABLE_TABLE)